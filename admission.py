@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Классы приоритета: дешёвые расклады не должны ждать за 10-карточными
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_HEAVY = 2
+
+SPREAD_PRIORITIES = {
+    "single": PRIORITY_INTERACTIVE,
+    "daily": PRIORITY_INTERACTIVE,
+    "three": PRIORITY_STANDARD,
+    "love": PRIORITY_STANDARD,
+    "weekly": PRIORITY_HEAVY,
+    "celtic": PRIORITY_HEAVY,
+}
+
+
+def priority_for(spread_type: str) -> int:
+    return SPREAD_PRIORITIES.get(spread_type, PRIORITY_STANDARD)
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен к LLM: очередь переполнена или истёк срок ожидания"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Ограничивает число одновременных вызовов LLM.
+
+    Сверх лимита запросы ждут в ограниченной очереди с приоритетами; при
+    переполнении очереди сразу получают 429, по истечении срока ожидания - 503.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 256, queue_timeout: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiting = 0
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Скользящая оценка времени удержания слота для Retry-After
+        self._avg_hold_seconds = 1.0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def _retry_after(self) -> int:
+        backlog = (self._waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._avg_hold_seconds))
+
+    def try_acquire(self) -> bool:
+        """Занимает свободный слот без ожидания (для необязательных вызовов, например хеджирования)"""
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def acquire(self, priority: int = PRIORITY_STANDARD, timeout: Optional[float] = None) -> None:
+        if self.try_acquire():
+            return
+
+        if self._waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise AdmissionRejected("Слишком много запросов к AI, попробуйте позже", 429, self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._sequence), future))
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._waiting -= 1
+            self.rejected_timeout += 1
+            raise AdmissionRejected("AI сервис перегружен, попробуйте позже", 503, self._retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже был передан нам - возвращаем его следующему
+                self.release()
+            else:
+                self._waiting -= 1
+            raise
+        self.admitted += 1
+
+    def release(self) -> None:
+        # Передаём слот следующему ожидающему с наивысшим приоритетом
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            self._waiting -= 1
+            future.set_result(None)
+            return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_STANDARD, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+llm_admission = AdmissionController(
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.environ.get("LLM_MAX_QUEUE", "256")),
+    queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "10")),
+)
@@ -2,118 +2,375 @@ import os
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from dotenv import load_dotenv
 import uuid
-from typing import List, Dict
+import time
+import asyncio
+from typing import AsyncIterator, List, Dict, Tuple
 from models.tarot import TarotCard
+from services.cache_service import make_reading_key, reading_cache
+from services.stream_parser import ReadingStreamParser
+from services.singleflight import reading_flight
+from services.admission import AdmissionRejected, llm_admission, priority_for
+from services.llm_policy import DeadlineExceeded, llm_policy
+from services.local_interpreter import local_interpreter
+from services.corpus_service import reading_corpus
+from services.prompts import PromptTemplates, estimate_tokens, prompt_library
+from services.metrics import LLM_COMPLETION_TOKENS, LLM_FALLBACKS, LLM_MISSING_ADVICE, LLM_STREAM_UNSUPPORTED, READINGS_GENERATED
+from services.tarot_service import spread_label
 
 load_dotenv()
 
+# Группы позиций для веерной генерации больших раскладов: каждая группа
+# толкуется отдельным параллельным вызовом, затем короткий вызов сводит итог
+FANOUT_GROUPS = {
+    "weekly": [[0], [1], [2], [3], [4], [5], [6]],
+    "celtic": [[0, 1], [2, 3], [4, 5], [6, 7], [8, 9]],
+}
+FANOUT_SPREADS = {spread for spread in os.environ.get("LLM_FANOUT_SPREADS", "").split(",") if spread in FANOUT_GROUPS}
+# Доля общего срока, оставляемая на итоговый вызов
+FANOUT_SYNTHESIS_SHARE = float(os.environ.get("LLM_FANOUT_SYNTHESIS_SHARE", "0.3"))
+
 class AITarotService:
+    # Предупреждение о LlmChat без потокового режима пишется в лог один раз на процесс
+    _stream_warning_logged = False
+    
     def __init__(self):
         self.api_key = os.environ.get('EMERGENT_LLM_KEY')
         if not self.api_key:
             raise ValueError("EMERGENT_LLM_KEY не найден в переменных окружения")
     
-    def _get_spread_prompt(self, spread_type: str, question: str = None) -> str:
-        """Создает промпт на основе типа расклада"""
-        base_prompt = """Ты - опытный мастер Таро с глубокими знаниями символики карт и многолетним опытом интерпретации. 
-        Твоя задача - дать вдумчивое, точное и практичное предсказание на основе выпавших карт.
-        
-        Учитывай:
-        - Традиционные значения каждой карты
-        - Влияние перевёрнутых карт
-        - Взаимодействие карт между собой
-        - Контекст заданного вопроса
-        - Позицию каждой карты в раскладе
-        
-        Отвечай на русском языке, создавая связное, вдохновляющее предсказание."""
-        
-        spread_prompts = {
-            "single": "Дай интерпретацию одной карты как ответа на вопрос.",
-            "daily": "Интерпретируй карту дня, фокусируясь на энергиях и событиях предстоящего дня.",
-            "three": "Проанализируй расклад 'Три карты' (Прошлое-Настоящее-Будущее), показав развитие ситуации во времени.",
-            "love": "Дай интерпретацию любовного расклада, анализируя чувства, препятствия и перспективы отношений.",
-            "weekly": "Проанализируй недельный расклад, дав краткий прогноз для каждого дня недели.",
-            "celtic": "Дай полную интерпретацию Кельтского креста - самого глубокого и информативного расклада Таро."
-        }
-        
-        specific_prompt = spread_prompts.get(spread_type, spread_prompts["single"])
-        
-        if question:
-            return f"{base_prompt}\n\nВопрос: {question}\n\n{specific_prompt}"
-        else:
-            return f"{base_prompt}\n\n{specific_prompt}"
-    
-    def _format_cards_info(self, cards: List[TarotCard]) -> str:
-        """Форматирует информацию о картах для AI"""
-        cards_info = "Выпавшие карты:\n\n"
-        
-        for i, card in enumerate(cards, 1):
-            position_info = f" ({card.position})" if card.position else ""
-            reversed_info = " (перевёрнутая)" if card.reversed else ""
-            
-            cards_info += f"{i}. {card.name}{position_info}{reversed_info}\n"
-            cards_info += f"   Ключевые слова: {', '.join(card.keywords)}\n"
-            
-            if card.reversed:
-                cards_info += f"   Значение: {card.reversed_meaning}\n\n"
-            else:
-                cards_info += f"   Значение: {card.upright_meaning}\n\n"
-        
-        return cards_info
+    def _parse_response(self, response_text: str, budget_key: str) -> Dict[str, str]:
+        """Разбивает ответ AI на интерпретацию и совет"""
+        parser = ReadingStreamParser()
+        parser.feed(response_text)
+        _, result = parser.finish()
+        self._check_advice(parser, response_text, budget_key)
+        return result
+    
+    def _check_advice(self, parser: ReadingStreamParser, response_text: str, budget_key: str) -> None:
+        """Учитывает ответы без раздела СОВЕТ: обрезанные по бюджету или нарушившие формат"""
+        if parser.advice_found:
+            return
+        budget = prompt_library.response_budget(budget_key)
+        reason = "truncated" if estimate_tokens(response_text) >= budget * 0.9 else "format"
+        print(f"Ответ AI без раздела СОВЕТ ({budget_key}, {reason}), используется совет по умолчанию")
+        LLM_MISSING_ADVICE.inc(spread_label(budget_key), reason)
+    
+    def _fallback_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
+        """Локальная интерпретация на случай недоступности AI"""
+        LLM_FALLBACKS.inc(spread_label(spread_type))
+        return local_interpreter.interpret(cards, spread_type, question)
+    
+    def _create_chat(self, system_message: str, budget_key: str, session_id: str = None,
+                     initial_messages: List[Dict] = None) -> LlmChat:
+        """Создаёт сессию LLM с системным промптом и бюджетом длины ответа"""
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id or f"tarot_reading_{uuid.uuid4()}",
+            system_message=system_message,
+            initial_messages=initial_messages
+        ).with_model("openai", "gpt-4o-mini")
+        
+        # Ограничиваем длину ответа, если клиент LLM это поддерживает
+        with_params = getattr(chat, "with_params", None)
+        if with_params is not None:
+            chat = with_params(max_tokens=prompt_library.response_budget(budget_key))
+        return chat
+    
+    def _select_prompts(self, cards: List[TarotCard], spread_type: str, question: str = None) -> PromptTemplates:
+        """Версия промптов для расклада (постоянна для одинаковых входных данных)"""
+        return prompt_library.select(make_reading_key(cards, spread_type, question))
+    
+    def _reading_prompt(self, prompts: PromptTemplates, cards: List[TarotCard], spread_type: str,
+                        question: str = None) -> Tuple[str, UserMessage]:
+        """Системный промпт и запрос с блоком карт, уложенным в бюджет расклада"""
+        system_message = prompts.system_prompt(spread_type, question)
+        text = prompts.reading_message(cards, system_message, prompt_library.prompt_budget(spread_type))
+        prompt_library.record(prompts.version, spread_type, system_message, text)
+        return system_message, UserMessage(text=text)
+    
+    async def _request_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
+        """Запрашивает предсказание у LLM (без кэша и fallback)"""
+        system_message, user_message = self._reading_prompt(self._select_prompts(cards, spread_type, question), cards, spread_type, question)
+        response = await self._request_text(system_message, spread_type, user_message)
+        
+        # Парсим ответ на интерпретацию и совет
+        return self._parse_response(response, spread_type)
+    
+    async def request_llm_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
+        """Предсказание от LLM через политику вызовов, без корпуса, кэша и fallback (для пакетной генерации)"""
+        return await llm_policy.call(spread_type, lambda: self._request_reading(cards, spread_type, question))
+    
+    async def _request_text(self, system_message: str, budget_key: str, user_message: UserMessage) -> str:
+        chat = self._create_chat(system_message, budget_key)
+        response = str(await chat.send_message(user_message))
+        LLM_COMPLETION_TOKENS.inc(spread_label(budget_key), amount=estimate_tokens(response))
+        return response
+    
+    def _fanout_groups(self, spread_type: str, count: int) -> List[List[int]]:
+        """Группы позиций расклада; карты сверх схемы идут отдельной группой"""
+        groups = [[i for i in group if i < count] for group in FANOUT_GROUPS[spread_type]]
+        groups = [group for group in groups if group]
+        covered = {i for group in groups for i in group}
+        rest = [i for i in range(count) if i not in covered]
+        if rest:
+            groups.append(rest)
+        return groups
+    
+    async def _request_part(self, prompts: PromptTemplates, cards: List[TarotCard], indices: List[int],
+                            spread_type: str, question: str, deadline_at: float) -> str:
+        """Толкование одной группы позиций большого расклада"""
+        part_key = f"{spread_type}:part"
+        system_message = prompts.system_prompt(spread_type, question)
+        text = prompts.part_message([cards[i] for i in indices], indices[0] + 1, system_message)
+        prompt_library.record(prompts.version, part_key, system_message, text)
+        
+        remaining = max(0.0, deadline_at - time.monotonic())
+        async with llm_admission.slot(priority_for(spread_type), timeout=min(llm_admission.queue_timeout, remaining)):
+            response = await llm_policy.call(
+                part_key,
+                lambda: self._request_text(system_message, part_key, UserMessage(text=text)),
+                deadline_at
+            )
+        return response.strip()
+    
+    async def _fanout_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Tuple[Dict[str, str], bool]:
+        """Веерная генерация: группы позиций параллельно, затем итог под общим сроком.
+        
+        Не успевшие группы заполняются локальной интерпретацией; второй
+        элемент результата - True, если все части получены от AI.
+        """
+        deadline = llm_policy.deadline_for(spread_type)
+        started = time.monotonic()
+        deadline_at = started + deadline
+        parts_deadline_at = started + deadline * (1 - FANOUT_SYNTHESIS_SHARE)
+        
+        prompts = self._select_prompts(cards, spread_type, question)
+        groups = self._fanout_groups(spread_type, len(cards))
+        outcomes = await asyncio.gather(
+            *(self._request_part(prompts, cards, group, spread_type, question, parts_deadline_at) for group in groups),
+            return_exceptions=True
+        )
+        failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if len(failures) == len(outcomes):
+            raise failures[0]
+        
+        positions = local_interpreter.tarot_service.get_position_names(spread_type, len(cards))
+        sections = []
+        for group, outcome in zip(groups, outcomes):
+            group_cards = [cards[i] for i in group]
+            group_positions = [positions[i] if i < len(positions) else "" for i in group]
+            if isinstance(outcome, Exception):
+                print(f"Ошибка толкования части расклада {spread_type}: {outcome}")
+                # Строки локального движка уже содержат позицию и название карты
+                sections.append(local_interpreter.describe_cards(group_cards, group_positions))
+                continue
+            title = ", ".join(
+                f"{card.position or position} - {card.name}" if card.position or position else card.name
+                for card, position in zip(group_cards, group_positions)
+            )
+            sections.append(f"{title}\n{outcome}")
+        
+        synthesis_key = f"{spread_type}:synthesis"
+        system_message = prompts.system_prompt(spread_type, question)
+        text = prompts.synthesis_message(sections)
+        prompt_library.record(prompts.version, synthesis_key, system_message, text)
+        try:
+            remaining = max(0.0, deadline_at - time.monotonic())
+            async with llm_admission.slot(priority_for(spread_type), timeout=min(llm_admission.queue_timeout, remaining)):
+                response = await llm_policy.call(
+                    synthesis_key,
+                    lambda: self._request_text(system_message, synthesis_key, UserMessage(text=text)),
+                    deadline_at
+                )
+            summary = self._parse_response(response, synthesis_key)
+            complete = not failures
+        except Exception as e:
+            print(f"Ошибка итогового вызова расклада {spread_type}: {e}")
+            summary = {"interpretation": "", "advice": self._fallback_reading(cards, spread_type, question)["advice"]}
+            complete = False
+        
+        interpretation = "\n\n".join(part for part in [summary["interpretation"], *sections] if part)
+        return {"interpretation": interpretation, "advice": summary["advice"]}, complete
+    
+    async def _stream_completion(self, chat: LlmChat, user_message: UserMessage) -> AsyncIterator[str]:
+        """Отдаёт ответ LLM фрагментами по мере поступления"""
+        stream_message = getattr(chat, "stream_message", None)
+        if stream_message is None:
+            # LlmChat без потокового режима: весь ответ приходит одним фрагментом
+            LLM_STREAM_UNSUPPORTED.inc()
+            if not AITarotService._stream_warning_logged:
+                AITarotService._stream_warning_logged = True
+                print("LlmChat не поддерживает stream_message: /generate/stream отдаёт ответ одним фрагментом")
+            yield str(await chat.send_message(user_message))
+            return
+        
+        async for chunk in stream_message(user_message):
+            yield str(chunk)
+    
+    async def _generate_and_cache(self, cache_key: str, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
+        """Запрашивает предсказание у LLM и кладёт его в кэш"""
+        if spread_type in FANOUT_SPREADS:
+            result, complete = await self._fanout_reading(cards, spread_type, question)
+            # Частично локальный результат не кэшируем, как и обычный fallback
+            if complete:
+                await reading_cache.set(cache_key, result)
+            return result
+        
+        deadline = llm_policy.deadline_for(spread_type)
+        deadline_at = time.monotonic() + deadline
+        
+        async with llm_admission.slot(priority_for(spread_type), timeout=min(llm_admission.queue_timeout, deadline)):
+            result = await llm_policy.call(
+                spread_type,
+                lambda: self._request_reading(cards, spread_type, question),
+                deadline_at
+            )
+        await reading_cache.set(cache_key, result)
+        return result
     
     async def generate_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
         """Генерирует AI предсказание на основе карт"""
+        # Карта дня и одна карта без вопроса - из предгенерированного корпуса
+        prepared = await reading_corpus.pick(cards, spread_type, question)
+        if prepared is not None:
+            READINGS_GENERATED.inc("corpus")
+            return prepared
+        
+        cache_key = make_reading_key(cards, spread_type, question)
+        cached = await reading_cache.get(cache_key)
+        if cached is not None:
+            READINGS_GENERATED.inc("cache")
+            return cached
+        
+        if not llm_policy.health.allow_request():
+            # AI деградировал - сразу отвечаем локальной интерпретацией
+            READINGS_GENERATED.inc("degraded")
+            return self._fallback_reading(cards, spread_type, question)
+        
         try:
-            session_id = f"tarot_reading_{uuid.uuid4()}"
-            
-            system_message = self._get_spread_prompt(spread_type, question)
-            cards_info = self._format_cards_info(cards)
-            
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=session_id,
-                system_message=system_message
-            ).with_model("openai", "gpt-4o-mini")
-            
-            user_message = UserMessage(
-                text=f"""
-                {cards_info}
-                
-                Пожалуйста, дай детальную интерпретацию этого расклада. Структурируй ответ следующим образом:
-                
-                ИНТЕРПРЕТАЦИЯ:
-                [Подробный анализ карт и их взаимодействия, учитывающий позиции и вопрос]
-                
-                СОВЕТ:
-                [Практические рекомендации и советы на основе полученной информации]
-                
-                Говори доброжелательно, но честно. Избегай слишком общих фраз, фокусируйся на конкретной ситуации.
-                """
+            # Одновременные одинаковые запросы ждут один общий вызов LLM
+            result = await reading_flight.do(
+                cache_key,
+                lambda: self._generate_and_cache(cache_key, cards, spread_type, question)
             )
-            
-            response = await chat.send_message(user_message)
-            
-            # Парсим ответ на интерпретацию и совет
-            response_text = str(response)
-            
-            if "ИНТЕРПРЕТАЦИЯ:" in response_text and "СОВЕТ:" in response_text:
-                parts = response_text.split("СОВЕТ:")
-                interpretation = parts[0].replace("ИНТЕРПРЕТАЦИЯ:", "").strip()
-                advice = parts[1].strip()
-            else:
-                # Если AI не следовал формату, используем весь ответ как интерпретацию
-                interpretation = response_text
-                advice = "Доверьтесь своей интуиции и используйте полученную информацию для принятия осознанных решений."
-            
-            return {
-                "interpretation": interpretation,
-                "advice": advice
-            }
-            
+        except AdmissionRejected:
+            # Перегрузка отдаётся клиенту как 429/503, а не как fallback
+            raise
         except Exception as e:
             print(f"Ошибка генерации AI предсказания: {e}")
-            # Fallback на базовую интерпретацию
-            return {
-                "interpretation": "Карты указывают на важный период в вашей жизни. Доверьтесь своей интуиции и будьте открыты к переменам.",
-                "advice": "Помните, что карты Таро - это инструмент для самопознания. Используйте их мудрость для принятия осознанных решений."
-            }
\ No newline at end of file
+            # Fallback на локальную интерпретацию (в кэш не попадает)
+            READINGS_GENERATED.inc("fallback")
+            return self._fallback_reading(cards, spread_type, question)
+        
+        READINGS_GENERATED.inc("llm")
+        return dict(result)
+    
+    def _followup_prompts(self, reading: Dict, cards: List[TarotCard]) -> PromptTemplates:
+        """Версия промптов, которой было сгенерировано исходное толкование"""
+        prompts = prompt_library.variants.get(reading.get("prompt_version"))
+        if prompts is None:
+            # Гадания, сохранённые до prompt_version: тот же выбор, что при генерации
+            prompts = self._select_prompts(cards, reading["spread_type"], reading.get("question"))
+        return prompts
+    
+    def _create_followup_chat(self, reading: Dict, cards: List[TarotCard], history: List[Dict]) -> LlmChat:
+        """Сессия LLM с неизменным префиксом гадания: промпт, карты, исходное толкование.
+        
+        Префикс одинаков для всех вопросов по гаданию, поэтому провайдер может
+        кэшировать его; меняется только хвост с историей и новым вопросом.
+        """
+        prompts = self._followup_prompts(reading, cards)
+        system_message, user_message = self._reading_prompt(prompts, cards, reading["spread_type"], reading.get("question"))
+        messages = [
+            {"role": "user", "content": user_message.text},
+            {"role": "assistant", "content": reading["interpretation"]},
+        ]
+        for turn in history:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        
+        return self._create_chat(
+            system_message,
+            "followup",
+            session_id=f"tarot_reading_{reading['id']}",
+            initial_messages=messages
+        )
+    
+    async def answer_followup(self, reading: Dict, cards: List[TarotCard], history: List[Dict], question: str) -> str:
+        """Отвечает на уточняющий вопрос по сохранённому гаданию (cards - из reading_store.reading_cards)"""
+        async def request() -> str:
+            chat = self._create_followup_chat(reading, cards, history)
+            return str(await chat.send_message(UserMessage(text=question))).strip()
+        
+        # Короткий ответ: тот же срок и приоритет, что у расклада из одной карты
+        async with llm_admission.slot(priority_for("single"), timeout=min(llm_admission.queue_timeout, llm_policy.deadline_for("single"))):
+            return await llm_policy.call("followup", request)
+    
+    async def stream_reading(self, cards: List[TarotCard], spread_type: str, question: str = None) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+        """Потоковая генерация: события interpretation/advice и итоговое done.
+        
+        При ошибке AI перед done с локальной интерпретацией идёт событие error;
+        replace=true означает, что уже полученные фрагменты нужно отбросить.
+        """
+        cache_key = make_reading_key(cards, spread_type, question)
+        cached = await reading_corpus.pick(cards, spread_type, question) or await reading_cache.get(cache_key)
+        if cached is not None:
+            yield "interpretation", {"text": cached["interpretation"]}
+            yield "advice", {"text": cached["advice"]}
+            yield "done", cached
+            return
+        
+        if not llm_policy.health.allow_request():
+            fallback = self._fallback_reading(cards, spread_type, question)
+            yield "interpretation", {"text": fallback["interpretation"]}
+            yield "advice", {"text": fallback["advice"]}
+            yield "done", fallback
+            return
+        
+        parser = ReadingStreamParser()
+        # Полный текст ответа - для оценки обрезки по бюджету, как в обычном режиме
+        response_parts: List[str] = []
+        deadline = llm_policy.deadline_for(spread_type)
+        started = time.monotonic()
+        deadline_at = started + deadline
+        emitted = False
+        try:
+            async with llm_admission.slot(priority_for(spread_type), timeout=min(llm_admission.queue_timeout, deadline)):
+                system_message, user_message = self._reading_prompt(
+                    self._select_prompts(cards, spread_type, question), cards, spread_type, question
+                )
+                chat = self._create_chat(system_message, spread_type)
+                chunks = self._stream_completion(chat, user_message)
+                try:
+                    while True:
+                        # Каждый фрагмент должен прийти до общего срока расклада
+                        remaining = deadline_at - time.monotonic()
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, remaining))
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise DeadlineExceeded("Истёк срок ожидания ответа AI")
+                        response_parts.append(chunk)
+                        for section, text in parser.feed(chunk):
+                            emitted = True
+                            yield section, {"text": text}
+                finally:
+                    await chunks.aclose()
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Ошибка потоковой генерации AI предсказания: {e}")
+            llm_policy.health.record(False)
+            yield "error", {"detail": "AI не ответил, используется локальная интерпретация", "replace": emitted}
+            yield "done", self._fallback_reading(cards, spread_type, question)
+            return
+        
+        llm_policy.health.record(time.monotonic() - started < deadline * llm_policy.slow_fraction)
+        events, result = parser.finish()
+        self._check_advice(parser, "".join(response_parts), spread_type)
+        for section, text in events:
+            yield section, {"text": text}
+        
+        await reading_cache.set(cache_key, result)
+        yield "done", result
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Ручной запуск архивации гаданий (те же настройки READINGS_*, что и у фоновой задачи).
+
+Запуск из каталога backend:
+    python archive_readings.py --recount
+    python archive_readings.py --target file --archive-dir /var/backups/tarot
+"""
+
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / '.env')
+
+from services import database
+from services.history_cache import history_cache
+from services.retention_service import ARCHIVE_TARGETS, recount_sessions, reading_archiver
+
+app = typer.Typer(help="Перенос старых гаданий из горячей коллекции в архив")
+
+
+@app.command()
+def main(
+    recount: bool = typer.Option(False, help="Сначала пересчитать число гаданий по сессиям"),
+    target: Optional[str] = typer.Option(None, help="collection или file (по умолчанию READINGS_ARCHIVE_TARGET)"),
+    archive_dir: Optional[str] = typer.Option(None, help="Каталог для NDJSON архивов"),
+):
+    if target and target not in ARCHIVE_TARGETS:
+        raise typer.BadParameter(f"Неизвестное хранилище архива: {target} (допустимо: {', '.join(ARCHIVE_TARGETS)})",
+                                 param_hint="--target")
+
+    async def run():
+        db = database.connect()
+        try:
+            if recount:
+                typer.echo(f"Пересчитано сессий: {await recount_sessions(db)}")
+            if target:
+                reading_archiver.target = target
+            if archive_dir:
+                reading_archiver.archive_dir = Path(archive_dir)
+            # Ручной запуск не ограничен окном низкой нагрузки
+            reading_archiver.window = None
+            await history_cache.attach(db)
+            await reading_archiver.attach(db)
+            moved = await reading_archiver.run_once()
+        finally:
+            database.close()
+        typer.echo(f"Перенесено в архив: {moved}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    app()
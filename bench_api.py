@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк API без сети: приложение из server.py запускается в
+процессе и вызывается через httpx.ASGITransport, LLM заменён заглушкой с
+настраиваемой задержкой, MongoDB - mongomock-motor (или --mongo-url).
+
+Запуск из каталога backend:
+    python bench_api.py --requests 500 --concurrency 32 --output bench.json
+    python bench_api.py --baseline bench.json --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import types
+import uuid
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ENDPOINTS = ("cards_random", "generate", "generate_local", "draw", "save", "history")
+SESSIONS = 50
+
+
+class BenchLlmChat:
+    """Заглушка LlmChat: логнормальная задержка, доля ошибок и ответ заданной длины"""
+
+    latency: float = 0.8
+    sigma: float = 0.3
+    error_rate: float = 0.0
+    output_chars: int = 1500
+    rng = random.Random(0)
+    calls = 0
+
+    def __init__(self, api_key=None, session_id=None, system_message=None, initial_messages=None):
+        self.system_message = system_message
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, user_message) -> str:
+        cls = type(self)
+        cls.calls += 1
+        await asyncio.sleep(cls.rng.lognormvariate(0, cls.sigma) * cls.latency)
+        if cls.rng.random() < cls.error_rate:
+            raise ConnectionError("bench: upstream error")
+        body = ("Карты говорят о переменах. " * (cls.output_chars // 27 + 1))[:cls.output_chars]
+        return f"ИНТЕРПРЕТАЦИЯ:\n{body}\n\nСОВЕТ:\n{body[:cls.output_chars // 4]}"
+
+
+class BenchUserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def install_llm_stub() -> None:
+    """Подставляет emergentintegrations.llm.chat, если приватный пакет не установлен (CI)"""
+    try:
+        import emergentintegrations.llm.chat  # noqa: F401
+        return
+    except ImportError:
+        pass
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat = BenchLlmChat
+    chat.UserMessage = BenchUserMessage
+    for name in ("emergentintegrations", "emergentintegrations.llm"):
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules["emergentintegrations.llm"].chat = chat
+    sys.modules["emergentintegrations"].llm = sys.modules["emergentintegrations.llm"]
+    sys.modules["emergentintegrations.llm.chat"] = chat
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict[str, float]:
+    values = np.array(latencies) * 1e3
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "mean_ms": round(float(values.mean()), 2) if len(values) else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+async def drive(client, make_request: Callable, total: int, concurrency: int) -> Dict[str, float]:
+    """Выполняет total запросов с заданной параллельностью и считает перцентили"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Регрессии относительно базового прогона: p95 выше или пропускная способность ниже допуска"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} мс")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['throughput_rps']} -> {current['throughput_rps']} запр/с")
+    return regressions
+
+
+async def run(args) -> Dict:
+    import httpx
+
+    install_llm_stub()
+    from services import ai_service, database
+
+    ai_service.LlmChat = BenchLlmChat
+    BenchLlmChat.latency = args.llm_latency_ms / 1e3
+    BenchLlmChat.sigma = args.llm_sigma
+    BenchLlmChat.error_rate = args.llm_error_rate
+    BenchLlmChat.output_chars = args.llm_output_chars
+    BenchLlmChat.rng = random.Random(args.seed)
+
+    if not args.mongo_url:
+        from mongomock_motor import AsyncMongoMockClient
+        # Общий пул из database.connect() не создаётся: база уже подставлена
+        database._database = AsyncMongoMockClient()[args.db_name]
+
+    from server import app
+    from services.deck import get_deck
+
+    deck = get_deck()
+    rng = random.Random(args.seed)
+    sessions = [f"bench_{uuid.uuid4()}" for _ in range(SESSIONS)]
+    spread = {"spread_type": "three", "question": "Что меня ждёт?"}
+
+    def card_refs(count: int = 3) -> List[Dict]:
+        return [{"id": record.id, "reversed": rng.random() < 0.3} for record in rng.sample(deck.records, count)]
+
+    def full_cards(count: int = 3) -> List[Dict]:
+        return [{**record.to_dict(), "reversed": False, "position": None} for record in rng.sample(deck.records, count)]
+
+    scenarios = {
+        "cards_random": lambda i: ("POST", "/api/cards/random", {"json": {"count": 3, "spread_type": "three"}}),
+        "generate": lambda i: ("POST", "/api/reading/generate", {"json": {**spread, "cards": card_refs()}}),
+        "generate_local": lambda i: ("POST", "/api/reading/generate?mode=local", {"json": {**spread, "cards": card_refs()}}),
+        "draw": lambda i: ("POST", "/api/reading/draw", {"json": spread}),
+        "save": lambda i: ("POST", "/api/reading/save", {"json": {
+            **spread, "cards": full_cards(), "interpretation": "Интерпретация " * 50, "user_session": sessions[i % SESSIONS],
+        }}),
+        "history": lambda i: ("GET", "/api/reading/history", {"params": {"session": sessions[i % SESSIONS], "limit": 20}}),
+    }
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = {}
+            for name in args.endpoints:
+                results[name] = await drive(client, scenarios[name], args.requests, args.concurrency)
+    finally:
+        await app.router.shutdown()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_sigma": args.llm_sigma,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_output_chars": args.llm_output_chars,
+            "mongo": "external" if args.mongo_url else "mongomock",
+        },
+        "llm_calls": BenchLlmChat.calls,
+        "endpoints": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на каждый эндпоинт")
+    parser.add_argument("--concurrency", type=int, default=32, help="Одновременных клиентов")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Эндпоинты через запятую")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="Медиана задержки заглушки LLM")
+    parser.add_argument("--llm-sigma", type=float, default=0.3, help="Разброс задержки (sigma логнормального распределения)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Доля ответов LLM с ошибкой")
+    parser.add_argument("--llm-output-chars", type=int, default=1500, help="Длина интерпретации в ответе LLM")
+    parser.add_argument("--mongo-url", help="Локальная MongoDB вместо mongomock-motor")
+    parser.add_argument("--db-name", default="tarot_bench", help="База для прогона")
+    parser.add_argument("--seed", type=int, default=1, help="Seed для карт и задержек")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое ухудшение относительно базового прогона")
+    parser.add_argument("--output", help="Куда сохранить JSON с результатами")
+    args = parser.parse_args()
+
+    args.endpoints = [name for name in args.endpoints.split(",") if name]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Неизвестные эндпоинты: {', '.join(sorted(unknown))}")
+
+    os.environ.setdefault("EMERGENT_LLM_KEY", "bench")
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = args.db_name
+
+    report = asyncio.run(run(args))
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            regressions = compare(report["endpoints"], json.load(baseline), args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as target:
+            target.write(output + "\n")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
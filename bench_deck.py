@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк колоды: время сборки каталога, стоимость одного вытягивания расклада
+и пакетной генерации раскладов.
+
+Запуск из каталога backend:
+    python bench_deck.py --repeat 20000
+"""
+
+import argparse
+import json
+import timeit
+
+from services.deck import DeckCatalogue, _build_records, get_deck
+from services.tarot_service import TarotService
+
+SPREADS = {"single": 1, "daily": 1, "three": 3, "love": 5, "weekly": 7, "celtic": 10}
+
+
+def bench(statement, repeat: int) -> float:
+    """Лучшее среднее время одного вызова в микросекундах"""
+    timer = timeit.Timer(statement)
+    return min(timer.repeat(repeat=5, number=repeat)) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000, help="Число вызовов в одном замере")
+    args = parser.parse_args()
+
+    deck = get_deck()
+    tarot_service = TarotService()
+    results = {
+        "deck_size": len(deck),
+        "deck_load_us": bench(lambda: DeckCatalogue(_build_records()), max(1, args.repeat // 100)),
+        "draw_us": {},
+        "draw_models_us": {},
+    }
+    for spread_type, count in SPREADS.items():
+        positions = tarot_service.get_position_names(spread_type, count)
+        # Путь /api/cards/random: перемешивание индексов + склейка JSON-фрагментов
+        results["draw_us"][spread_type] = bench(
+            lambda: deck.spread_json(deck.draw(count), positions), args.repeat)
+        # Путь с построением моделей TarotCard (AI и локальная интерпретация)
+        results["draw_models_us"][spread_type] = bench(
+            lambda: tarot_service.get_random_cards(count, spread_type),
+            max(1, args.repeat // 10))
+
+    # Пакетный режим /api/cards/random/batch: 100 000 раскладов Кельтского креста
+    positions = tarot_service.get_position_names("celtic", 10)
+    results["batch_100k_celtic_ms"] = bench(
+        lambda: sum(len(chunk) for chunk in deck.batch_ndjson(10, 100_000, positions, seed=1)), 1) * 1e-3
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
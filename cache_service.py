@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.tarot import TarotCard
+
+load_dotenv()
+
+# Версия формата ключа: при изменении промптов достаточно увеличить её,
+# чтобы старые интерпретации перестали находиться в кэше
+CACHE_KEY_VERSION = 2
+
+
+def normalize_question(question: Optional[str]) -> Optional[str]:
+    """Приводит вопрос к каноническому виду (регистр, пробелы)"""
+    if not question:
+        return None
+    normalized = " ".join(question.lower().split())
+    return normalized or None
+
+
+def make_reading_key(cards: List[TarotCard], spread_type: str, question: str = None) -> str:
+    """Канонический хэш входных данных предсказания"""
+    payload = {
+        "v": CACHE_KEY_VERSION,
+        "spread": spread_type,
+        "question": normalize_question(question),
+        "cards": [[card.id, bool(card.reversed), card.position or None] for card in cards],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReadingCache:
+    """Двухуровневый кэш интерпретаций: LRU в процессе + общая коллекция MongoDB с TTL"""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600, shared_ttl_seconds: int = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared_ttl_seconds = shared_ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._collection = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def attach(self, db: AsyncIOMotorDatabase) -> None:
+        """Подключает общий уровень кэша и создаёт TTL индекс"""
+        collection = db.reading_cache
+        try:
+            await collection.create_index("created_at", expireAfterSeconds=self.shared_ttl_seconds)
+        except Exception as e:
+            print(f"Ошибка создания индекса кэша предсказаний: {e}")
+            return
+        self._collection = collection
+
+    def get_local(self, key: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: Dict[str, str]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Ищет интерпретацию сначала в памяти, затем в MongoDB"""
+        value = self.get_local(key)
+        if value is not None:
+            self.local_hits += 1
+            return dict(value)
+
+        if self._collection is not None:
+            try:
+                doc = await self._collection.find_one({"_id": key}, {"interpretation": 1, "advice": 1})
+            except Exception as e:
+                print(f"Ошибка чтения кэша предсказаний: {e}")
+                doc = None
+            if doc is not None:
+                value = {"interpretation": doc["interpretation"], "advice": doc["advice"]}
+                self._put_local(key, value)
+                self.shared_hits += 1
+                return dict(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, str]) -> None:
+        """Сохраняет интерпретацию в оба уровня кэша"""
+        value = {"interpretation": value["interpretation"], "advice": value["advice"]}
+        self._put_local(key, value)
+
+        if self._collection is not None:
+            try:
+                await self._collection.replace_one(
+                    {"_id": key},
+                    {**value, "created_at": datetime.utcnow()},
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"Ошибка записи кэша предсказаний: {e}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        hits = self.local_hits + self.shared_hits
+        return {
+            "entries": len(self._entries),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+reading_cache = ReadingCache(
+    max_entries=int(os.environ.get("READING_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.environ.get("READING_CACHE_TTL_SECONDS", "3600")),
+    shared_ttl_seconds=int(os.environ.get("READING_CACHE_SHARED_TTL_SECONDS", "86400")),
+)
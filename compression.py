@@ -0,0 +1,99 @@
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Типы ответов, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br, если клиент его принимает и модуль brotli установлен, иначе gzip"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip().lower()
+        try:
+            if quality.startswith("q=") and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """Сжатие ответов gzip/brotli по Accept-Encoding начиная с minimum_size байт.
+
+    Сжимаются только ответы, отданные одним куском (JSON истории, карт,
+    предсказаний). Потоковые ответы (SSE, NDJSON) проходят как есть, чтобы
+    события доходили до клиента сразу, а не после заполнения буфера
+    компрессора.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = _choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Заголовки отправим, когда станет ясно, сжимается ли тело
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            response_headers = [(name.lower(), value) for name, value in start["headers"]]
+            names = {name for name, _ in response_headers}
+            content_type = next((value for name, value in response_headers if name == b"content-type"), b"").decode("latin-1")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or b"content-encoding" in names
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(body, compresslevel=self.gzip_level)
+            response_headers = [(name, value) for name, value in response_headers if name not in (b"content-length", b"vary")]
+            vary = [value for name, value in start["headers"] if name.lower() == b"vary"]
+            response_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**start, "headers": response_headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
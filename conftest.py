@@ -0,0 +1,84 @@
+"""
+Общие настройки модульных тестов: без сети, MongoDB и приватного пакета LLM.
+
+Запуск из каталога backend:
+    python -m pytest -q
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "tarot_test")
+os.environ.setdefault("EMERGENT_LLM_KEY", "test")
+
+# backend_test.py проверяет развёрнутый стенд по сети и в модульные тесты не входит
+collect_ignore = ["backend_test.py"]
+
+
+class StubLlmChat:
+    """LlmChat для тестов: отвечает фиксированным текстом в формате промпта"""
+
+    def __init__(self, api_key=None, session_id=None, system_message=None, initial_messages=None):
+        self.system_message = system_message
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, user_message) -> str:
+        return "ИНТЕРПРЕТАЦИЯ:\nКарты говорят о переменах.\n\nСОВЕТ:\nДействуйте спокойно."
+
+
+class StubUserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+
+try:
+    import emergentintegrations.llm.chat  # noqa: F401
+except ImportError:
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat = StubLlmChat
+    chat.UserMessage = StubUserMessage
+    sys.modules["emergentintegrations"] = types.ModuleType("emergentintegrations")
+    sys.modules["emergentintegrations.llm"] = types.ModuleType("emergentintegrations.llm")
+    sys.modules["emergentintegrations.llm"].chat = chat
+    sys.modules["emergentintegrations"].llm = sys.modules["emergentintegrations.llm"]
+    sys.modules["emergentintegrations.llm.chat"] = chat
+
+
+@pytest.fixture
+def db():
+    """Пустая база mongomock-motor, подставленная вместо общего пула"""
+    from mongomock_motor import AsyncMongoMockClient
+    from services import database
+
+    database._database = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    yield database._database
+    database._database = None
+
+
+@pytest.fixture
+def make_cards():
+    """Карты колоды по ссылкам (id, reversed, position)"""
+    from services.deck import get_deck
+
+    def make(*refs):
+        deck = get_deck()
+        return [deck.tarot_card(deck.index_by_id[card_id], reversed_, position)
+                for card_id, reversed_, position in refs]
+
+    return make
+
+
+@pytest.fixture
+def client(db):
+    """Приложение server.py поверх базы mongomock (с обработчиками startup/shutdown)"""
+    from fastapi.testclient import TestClient
+    from server import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.tarot import TarotCard
+from services.cache_service import normalize_question
+from services.tarot_service import TarotService
+
+load_dotenv()
+
+# Расклады из одной карты без вопроса дают фиксированный промпт,
+# поэтому их можно заранее сгенерировать для всех карт и ориентаций
+CORPUS_SPREADS = ("daily", "single")
+ACTIVE_ID = "active"
+
+Generator = Callable[[List[TarotCard], str], Awaitable[Dict[str, str]]]
+
+
+class CorpusBuildFailed(Exception):
+    """Слишком много неудачных генераций: новая версия корпуса не активирована"""
+
+    def __init__(self, message: str, failed: int, total: int):
+        super().__init__(message)
+        self.failed = failed
+        self.total = total
+
+
+class ReadingCorpus:
+    """Предгенерированные интерпретации для раскладов из одной карты.
+
+    Каждая сборка корпуса получает свою версию. Читатели видят только
+    активную версию, которая переключается одной записью в
+    reading_corpus_meta после того, как сборка полностью завершена.
+    """
+
+    def __init__(self, refresh_seconds: float = 30.0):
+        self.refresh_seconds = refresh_seconds
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._active: Optional[dict] = None
+        self._checked_at = 0.0
+        self._variants: Dict[Tuple, Dict[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def attach(self, db: AsyncIOMotorDatabase) -> None:
+        """Подключает корпус и создаёт индексы"""
+        self._db = db
+        try:
+            await db.reading_corpus.create_index(
+                [("version", 1), ("spread_type", 1), ("card_id", 1), ("reversed", 1), ("variant", 1)],
+                unique=True
+            )
+        except Exception as e:
+            print(f"Ошибка создания индекса корпуса: {e}")
+
+    @staticmethod
+    def is_eligible(cards: List[TarotCard], spread_type: str, question: str = None) -> bool:
+        return spread_type in CORPUS_SPREADS and len(cards) == 1 and normalize_question(question) is None
+
+    async def _active_version(self) -> Optional[dict]:
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return self._active
+
+        self._checked_at = now
+        try:
+            active = await self._db.reading_corpus_meta.find_one({"_id": ACTIVE_ID})
+        except Exception as e:
+            print(f"Ошибка чтения версии корпуса: {e}")
+            return self._active
+
+        if not active or not self._active or active["version"] != self._active["version"]:
+            self._variants.clear()
+        self._active = active
+        return active
+
+    async def pick(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Optional[Dict[str, str]]:
+        """Возвращает случайный вариант интерпретации из активного корпуса"""
+        if self._db is None or not self.is_eligible(cards, spread_type, question):
+            return None
+
+        active = await self._active_version()
+        if not active or spread_type not in active.get("spreads", CORPUS_SPREADS):
+            return None
+
+        card = cards[0]
+        key = (active["version"], spread_type, card.id, bool(card.reversed), random.randrange(active["variants"]))
+        value = self._variants.get(key)
+        if value is None:
+            try:
+                doc = await self._db.reading_corpus.find_one(
+                    dict(zip(("version", "spread_type", "card_id", "reversed", "variant"), key)),
+                    {"interpretation": 1, "advice": 1}
+                )
+            except Exception as e:
+                print(f"Ошибка чтения корпуса: {e}")
+                doc = None
+            if doc is None:
+                self.misses += 1
+                return None
+            value = self._variants[key] = {"interpretation": doc["interpretation"], "advice": doc["advice"]}
+
+        self.hits += 1
+        return dict(value)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "version": self._active["version"] if self._active else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+async def build_corpus(db: AsyncIOMotorDatabase, generate: Generator, variants: int = 3,
+                       concurrency: int = 8, spreads: Tuple[str, ...] = CORPUS_SPREADS,
+                       max_failure_rate: float = 0.05, retries: int = 2) -> str:
+    """Генерирует новую версию корпуса и делает её активной.
+
+    Неудачные генерации повторяются до retries раз. Если доля вариантов,
+    так и не полученных от AI, не больше max_failure_rate, их места
+    занимают копии удавшихся вариантов той же карты в той же ориентации:
+    активная версия всегда полная. Иначе (или если у карты не удался ни
+    один вариант) собранная версия удаляется, а активной остаётся прежняя.
+    """
+    version = f"{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    tarot_service = TarotService()
+    cards_by_id = {card_data["id"]: card_data for card_data in tarot_service.cards}
+    semaphore = asyncio.Semaphore(concurrency)
+    # (расклад, карта, перевёрнута, вариант) -> документ корпуса
+    documents: Dict[Tuple[str, int, bool, int], dict] = {}
+
+    async def generate_variant(slot: Tuple[str, int, bool, int]) -> None:
+        spread_type, card_id, is_reversed, variant = slot
+        card = TarotCard(**cards_by_id[card_id])
+        card.reversed = is_reversed
+        card = tarot_service.assign_positions([card], spread_type)[0]
+        try:
+            async with semaphore:
+                result = await generate([card], spread_type)
+            document = {
+                "version": version,
+                "spread_type": spread_type,
+                "card_id": card_id,
+                "reversed": is_reversed,
+                "variant": variant,
+                "interpretation": result["interpretation"],
+                "advice": result["advice"],
+                "created_at": datetime.utcnow()
+            }
+            await db.reading_corpus.insert_one(dict(document))
+            documents[slot] = document
+        except Exception as e:
+            print(f"Ошибка генерации варианта корпуса {spread_type}/{card_id}/{is_reversed}/{variant}: {e}")
+
+    slots = [
+        (spread_type, card_data["id"], is_reversed, variant)
+        for spread_type in spreads
+        for card_data in tarot_service.cards
+        for is_reversed in (False, True)
+        for variant in range(variants)
+    ]
+    tasks: List[asyncio.Future] = []
+    try:
+        missing = slots
+        for _ in range(retries + 1):
+            tasks = [asyncio.ensure_future(generate_variant(slot)) for slot in missing]
+            await asyncio.gather(*tasks)
+            missing = [slot for slot in missing if slot not in documents]
+            if not missing:
+                break
+
+        if len(missing) > max_failure_rate * len(slots):
+            raise CorpusBuildFailed(
+                f"Не удалось сгенерировать {len(missing)} из {len(slots)} вариантов корпуса",
+                len(missing), len(slots)
+            )
+        for slot in missing:
+            spread_type, card_id, is_reversed, variant = slot
+            donors = [documents[(spread_type, card_id, is_reversed, other)]
+                      for other in range(variants) if (spread_type, card_id, is_reversed, other) in documents]
+            if not donors:
+                raise CorpusBuildFailed(
+                    f"Для карты {card_id} ({spread_type}, перевёрнута: {is_reversed}) не удался ни один вариант",
+                    len(missing), len(slots)
+                )
+            await db.reading_corpus.insert_one({**donors[variant % len(donors)], "variant": variant})
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await db.reading_corpus.delete_many({"version": version})
+        raise
+
+    # Переключение на новую версию - одна атомарная запись
+    previous = await db.reading_corpus_meta.find_one_and_replace(
+        {"_id": ACTIVE_ID},
+        {"version": version, "variants": variants, "spreads": list(spreads), "duplicated": len(missing),
+         "activated_at": datetime.utcnow()},
+        upsert=True
+    )
+    # Предыдущую версию оставляем: процессы могут ещё читать её до обновления метаданных
+    keep = [version] + ([previous["version"]] if previous else [])
+    await db.reading_corpus.delete_many({"version": {"$nin": keep}})
+    return version
+
+
+reading_corpus = ReadingCorpus(
+    refresh_seconds=float(os.environ.get("READING_CORPUS_REFRESH_SECONDS", "30")),
+)
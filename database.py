@@ -0,0 +1,64 @@
+import os
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReadPreference
+
+from services.metrics import MongoCommandMetrics
+
+# Общий пул соединений с MongoDB на весь процесс.
+# Создаётся при старте приложения (connect) и закрывается при остановке (close).
+_client: Optional[AsyncIOMotorClient] = None
+_database: Optional[AsyncIOMotorDatabase] = None
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def _client_options() -> dict:
+    """Собирает параметры пула из переменных окружения"""
+    read_preference = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+    if read_preference not in READ_PREFERENCES:
+        raise ValueError(f"Неизвестный MONGO_READ_PREFERENCE: {read_preference}")
+
+    return {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "20000")),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "read_preference": READ_PREFERENCES[read_preference],
+        "event_listeners": [MongoCommandMetrics()],
+    }
+
+
+def connect() -> AsyncIOMotorDatabase:
+    """Создаёт общий клиент MongoDB (вызывается один раз при старте)"""
+    global _client, _database
+    if _database is None:
+        _client = AsyncIOMotorClient(os.environ["MONGO_URL"], **_client_options())
+        _database = _client[os.environ["DB_NAME"]]
+    return _database
+
+
+def close() -> None:
+    """Закрывает пул соединений (вызывается при остановке)"""
+    global _client, _database
+    if _client is not None:
+        _client.close()
+    _client = None
+    _database = None
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """Dependency для получения базы данных из общего пула"""
+    if _database is None:
+        return connect()
+    return _database
@@ -0,0 +1,455 @@
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from models.tarot import TarotCard
+from services.metrics import DECK_DRAW_LATENCY
+
+IMAGES = (
+    "https://images.unsplash.com/photo-1578662996442-48f60103fc96?w=400&h=600&fit=crop&crop=center",
+    "https://images.unsplash.com/photo-1551269901-5c5e14c25df7?w=400&h=600&fit=crop&crop=center",
+    "https://images.unsplash.com/photo-1532618793091-ec5fe9635fbd?w=400&h=600&fit=crop&crop=center",
+    "https://images.unsplash.com/photo-1518709268805-4e9042af2176?w=400&h=600&fit=crop&crop=center",
+    "https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=400&h=600&fit=crop&crop=center",
+)
+
+# Старшие арканы: (id, название, изображение, ключевые слова, прямое значение, перевёрнутое значение)
+MAJOR_ARCANA = (
+    (1, "Шут", 0, ("новое начало", "спонтанность", "свобода"),
+     "Новые начинания, спонтанность, свобода духа, чистый потенциал",
+     "Безрассудство, наивность, отсутствие планов, легкомыслие"),
+    (2, "Маг", 1, ("сила воли", "творчество", "навыки"),
+     "Сила воли, творческая энергия, умения, проявление намерений",
+     "Неиспользованный потенциал, обман, манипуляции, самомнение"),
+    (3, "Жрица", 2, ("интуиция", "тайна", "женская мудрость"),
+     "Интуиция, внутренняя мудрость, тайные знания, духовность",
+     "Игнорирование интуиции, секреты, поверхностность, разобщённость"),
+    (4, "Императрица", 3, ("материнство", "плодородие", "изобилие"),
+     "Материнство, творчество, изобилие природы, плодородность",
+     "Зависимость, пустота, бесплодие, блокировка творчества"),
+    (5, "Император", 4, ("авторитет", "структура", "защита"),
+     "Авторитет, стабильность, защита, лидерство",
+     "Тирания, негибкость, отсутствие дисциплины, злоупотребление властью"),
+    (6, "Иерофант", 0, ("духовность", "традиции", "обучение"),
+     "Духовное руководство, традиции, образование, институциональность",
+     "Догматизм, конформизм, ограниченность, бунт против системы"),
+    (7, "Влюбленные", 3, ("любовь", "выбор", "гармония"),
+     "Любовь, партнерство, важный выбор, гармония отношений",
+     "Дисгармония, неправильный выбор, расставание, конфликт ценностей"),
+    (8, "Колесница", 1, ("контроль", "победа", "целеустремленность"),
+     "Контроль, триумф, преодоление препятствий, направленная энергия",
+     "Отсутствие контроля, поражение, агрессия, отсутствие направления"),
+    (9, "Сила", 2, ("внутренняя сила", "терпение", "сострадание"),
+     "Внутренняя сила, терпение, сострадание, контроль над эмоциями",
+     "Слабость, неуверенность, злоупотребление силой, потеря контроля"),
+    (10, "Отшельник", 4, ("поиск истины", "одиночество", "мудрость"),
+     "Поиск истины, внутренняя мудрость, одиночество как путь к себе",
+     "Изоляция, одиночество как бегство, отказ от помощи, заблуждения"),
+    (11, "Колесо Фортуны", 0, ("судьба", "перемены", "циклы"),
+     "Поворот судьбы, удача, новые циклы, неизбежные перемены",
+     "Неудача, сопротивление переменам, застой, потеря контроля над обстоятельствами"),
+    (12, "Справедливость", 1, ("равновесие", "честность", "ответственность"),
+     "Справедливость, честность, закон, ответственность за свои поступки",
+     "Несправедливость, предвзятость, уход от ответственности, нечестность"),
+    (13, "Повешенный", 2, ("пауза", "жертва", "новый взгляд"),
+     "Пауза, добровольная жертва, новый взгляд на ситуацию, отпускание",
+     "Промедление, бесполезная жертва, упрямство, нежелание меняться"),
+    (14, "Смерть", 3, ("завершение", "трансформация", "обновление"),
+     "Завершение этапа, трансформация, освобождение места для нового",
+     "Страх перемен, застой, цепляние за прошлое, затянувшийся конец"),
+    (15, "Умеренность", 4, ("баланс", "гармония", "терпение"),
+     "Баланс, умеренность, терпение, соединение противоположностей",
+     "Дисбаланс, крайности, нетерпение, отсутствие меры"),
+    (16, "Дьявол", 0, ("искушение", "зависимость", "материальность"),
+     "Искушение, привязанности, зависимость, власть материального",
+     "Освобождение от оков, разрыв зависимости, осознание своих теней"),
+    (17, "Башня", 1, ("потрясение", "разрушение", "откровение"),
+     "Внезапные перемены, крушение иллюзий, потрясение, откровение",
+     "Избегание катастрофы, страх перемен, отложенный кризис"),
+    (18, "Звезда", 2, ("надежда", "вдохновение", "исцеление"),
+     "Надежда, вдохновение, исцеление, вера в будущее",
+     "Отчаяние, потеря веры, разочарование, отсутствие вдохновения"),
+    (19, "Луна", 3, ("иллюзии", "страхи", "подсознание"),
+     "Иллюзии, интуиция, страхи, тайны подсознания",
+     "Прояснение, преодоление страхов, разоблачение обмана"),
+    (20, "Солнце", 4, ("радость", "успех", "ясность"),
+     "Радость, успех, жизненная сила, ясность и оптимизм",
+     "Временные трудности, подавленность, излишний оптимизм, задержка успеха"),
+    (21, "Суд", 0, ("пробуждение", "возрождение", "призвание"),
+     "Пробуждение, возрождение, подведение итогов, внутренний зов",
+     "Самокритика, сомнения, игнорирование призвания, страх осуждения"),
+    (22, "Мир", 1, ("завершённость", "целостность", "достижение"),
+     "Завершение цикла, целостность, достижение цели, гармония с миром",
+     "Незавершённость, отсутствие закрытия, задержки, нехватка последнего шага"),
+)
+
+# Младшие арканы: масть -> (родительный падеж названия, изображение)
+SUITS = (
+    ("wands", "Жезлов", 1),
+    ("cups", "Кубков", 3),
+    ("swords", "Мечей", 4),
+    ("pentacles", "Пентаклей", 0),
+)
+RANKS = ("Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка", "Шестёрка", "Семёрка",
+         "Восьмёрка", "Девятка", "Десятка", "Паж", "Рыцарь", "Королева", "Король")
+
+# Для каждой масти 14 карт по порядку RANKS: (ключевые слова, прямое значение, перевёрнутое значение)
+MINOR_ARCANA = {
+    "wands": (
+        (("вдохновение", "энергия", "начинание"),
+         "Творческий импульс, новая идея, прилив энергии и энтузиазма",
+         "Задержки, потеря мотивации, нереализованные идеи"),
+        (("планирование", "выбор пути", "перспективы"),
+         "Планирование будущего, выбор направления, смелые замыслы",
+         "Страх неизвестности, нерешительность, отсутствие плана"),
+        (("расширение", "предвидение", "рост"),
+         "Расширение горизонтов, первые результаты, дальновидность",
+         "Препятствия на пути, задержки, разочарование в ожиданиях"),
+        (("праздник", "стабильность", "дом"),
+         "Праздник, гармония, домашний уют, заслуженная стабильность",
+         "Нестабильность, конфликты в семье, отложенное торжество"),
+        (("соперничество", "конфликт", "борьба"),
+         "Соперничество, споры, столкновение интересов, здоровая конкуренция",
+         "Избегание конфликта, внутренняя борьба, разрешение разногласий"),
+        (("победа", "признание", "успех"),
+         "Победа, общественное признание, успех и уверенность в себе",
+         "Самонадеянность, отсутствие признания, падение репутации"),
+        (("стойкость", "защита", "убеждения"),
+         "Отстаивание позиций, стойкость, защита своих убеждений",
+         "Усталость от борьбы, уступчивость, ощущение загнанности"),
+        (("скорость", "движение", "новости"),
+         "Быстрое развитие событий, новости, движение вперёд",
+         "Спешка, задержки, хаос, упущенные возможности"),
+        (("упорство", "выносливость", "последний рывок"),
+         "Упорство, выносливость, готовность к последнему рывку",
+         "Истощение, паранойя, желание сдаться"),
+        (("бремя", "ответственность", "перегрузка"),
+         "Тяжёлая ноша, перегрузка обязательствами, ответственность",
+         "Сброс лишнего груза, делегирование, выгорание"),
+        (("любознательность", "открытие", "весть"),
+         "Любознательность, вдохновляющие новости, жажда открытий",
+         "Нетерпеливость, плохие вести, разбросанность"),
+        (("страсть", "приключение", "порывистость"),
+         "Страсть, жажда приключений, смелые и быстрые действия",
+         "Импульсивность, безрассудство, незавершённые дела"),
+        (("уверенность", "харизма", "независимость"),
+         "Уверенность, тепло, харизма, независимость и решительность",
+         "Ревность, неуверенность, требовательность, эгоизм"),
+        (("лидерство", "видение", "предприимчивость"),
+         "Природное лидерство, видение цели, предприимчивость",
+         "Властность, нетерпимость, завышенные ожидания"),
+    ),
+    "cups": (
+        (("новые чувства", "любовь", "интуиция"),
+         "Новые чувства, эмоциональное обновление, любовь и сострадание",
+         "Подавленные эмоции, эмоциональная пустота, закрытость"),
+        (("союз", "партнёрство", "взаимность"),
+         "Союз, взаимная симпатия, партнёрство, гармония двоих",
+         "Разлад, дисбаланс в отношениях, непонимание"),
+        (("дружба", "радость", "общение"),
+         "Дружба, праздник, радость общения, поддержка близких",
+         "Излишества, сплетни, отчуждение от друзей"),
+        (("апатия", "созерцание", "переоценка"),
+         "Апатия, скука, погружение в себя, переоценка ценностей",
+         "Пробуждение интереса, новые возможности, выход из застоя"),
+        (("потеря", "сожаление", "горе"),
+         "Потеря, сожаление о прошлом, фокус на утраченном",
+         "Принятие, прощение, движение дальше после потери"),
+        (("ностальгия", "детство", "воспоминания"),
+         "Ностальгия, тёплые воспоминания, детская непосредственность",
+         "Жизнь прошлым, нежелание взрослеть, идеализация былого"),
+        (("мечты", "иллюзии", "выбор"),
+         "Мечты, множество вариантов, фантазии, соблазнительные иллюзии",
+         "Ясность, реалистичный выбор, отказ от иллюзий"),
+        (("уход", "разочарование", "поиск смысла"),
+         "Уход от того, что больше не радует, поиск более глубокого смысла",
+         "Страх перемен, бесцельность, возвращение к старому"),
+        (("исполнение желаний", "удовлетворение", "благополучие"),
+         "Исполнение желаний, удовлетворение, эмоциональное благополучие",
+         "Неудовлетворённость, самодовольство, материализм"),
+        (("семейное счастье", "гармония", "любовь"),
+         "Семейное счастье, гармония, эмоциональная наполненность",
+         "Разлад в семье, разрушенные ожидания, несогласие"),
+        (("чувствительность", "творчество", "послание"),
+         "Творческая чувствительность, приятные новости, открытость чувствам",
+         "Эмоциональная незрелость, капризы, творческий блок"),
+        (("романтика", "предложение", "обаяние"),
+         "Романтика, обаяние, приглашение, следование зову сердца",
+         "Переменчивость настроения, нереалистичные ожидания, обман чувств"),
+        (("сострадание", "забота", "эмпатия"),
+         "Сострадание, эмоциональная глубина, забота и интуиция",
+         "Эмоциональная зависимость, созависимость, неуверенность"),
+        (("эмоциональный баланс", "мудрость", "дипломатия"),
+         "Эмоциональная зрелость, мудрость, спокойствие и дипломатичность",
+         "Эмоциональная манипуляция, холодность, подавленные чувства"),
+    ),
+    "swords": (
+        (("ясность", "истина", "прорыв"),
+         "Ясность мысли, прорыв, истина, сила интеллекта",
+         "Путаница, неверные суждения, жестокость слов"),
+        (("тупик", "нерешительность", "выбор"),
+         "Трудный выбор, тупик, попытка сохранить нейтралитет",
+         "Информационная перегрузка, растерянность, раскрытие правды"),
+        (("сердечная боль", "разочарование", "печаль"),
+         "Сердечная боль, разочарование, печаль и горькая правда",
+         "Исцеление, прощение, восстановление после боли"),
+        (("отдых", "восстановление", "размышление"),
+         "Отдых, восстановление сил, размышление в тишине",
+         "Беспокойство, выгорание, невозможность остановиться"),
+        (("конфликт", "поражение", "раздор"),
+         "Конфликт, победа любой ценой, напряжённость и раздор",
+         "Примирение, желание прекратить спор, сожаление"),
+        (("переход", "перемены", "путь"),
+         "Переход к лучшему, перемены, оставление трудностей позади",
+         "Незавершённые дела, сопротивление переменам, тяжёлый багаж"),
+        (("хитрость", "стратегия", "скрытность"),
+         "Хитрость, стратегия, скрытые действия, обходные пути",
+         "Раскрытие обмана, угрызения совести, признание"),
+        (("ограничение", "беспомощность", "страх"),
+         "Ощущение ограничения, беспомощность, самоизоляция из-за страха",
+         "Освобождение, новый взгляд, принятие собственной силы"),
+        (("тревога", "бессонница", "страхи"),
+         "Тревога, бессонные ночи, навязчивые страхи и сомнения",
+         "Надежда, обращение за помощью, ослабление тревоги"),
+        (("окончание", "крах", "дно"),
+         "Болезненное окончание, крах, достижение дна",
+         "Восстановление, постепенное возрождение, избежание худшего"),
+        (("наблюдательность", "любопытство", "новые идеи"),
+         "Наблюдательность, жажда знаний, новые идеи и бдительность",
+         "Сплетни, поспешные выводы, пустые разговоры"),
+        (("решительность", "напор", "амбиции"),
+         "Решительность, стремительность, амбиции и прямота",
+         "Агрессивность, поспешность, необдуманные действия"),
+        (("независимость", "ясное суждение", "прямота"),
+         "Независимость, ясность суждений, честность и прямота",
+         "Холодность, резкость, горечь и предвзятость"),
+        (("интеллект", "авторитет", "истина"),
+         "Интеллектуальная сила, авторитет, справедливое суждение",
+         "Манипуляции, злоупотребление властью, тирания разума"),
+    ),
+    "pentacles": (
+        (("новая возможность", "процветание", "достаток"),
+         "Новая материальная возможность, процветание, прочное начало",
+         "Упущенная возможность, плохое планирование, неразумные траты"),
+        (("баланс", "гибкость", "приоритеты"),
+         "Баланс ресурсов, гибкость, умение совмещать дела",
+         "Перегрузка, дисбаланс, финансовая неразбериха"),
+        (("мастерство", "командная работа", "признание"),
+         "Мастерство, командная работа, признание профессионализма",
+         "Разногласия в команде, низкое качество, отсутствие роста"),
+        (("накопление", "контроль", "безопасность"),
+         "Накопление, бережливость, стремление к безопасности",
+         "Жадность, материализм, страх потери, расточительность"),
+        (("нужда", "лишения", "изоляция"),
+         "Материальные трудности, лишения, чувство изоляции",
+         "Выход из кризиса, восстановление, обретение поддержки"),
+        (("щедрость", "благотворительность", "обмен"),
+         "Щедрость, помощь, справедливый обмен и поддержка",
+         "Долги, корыстная помощь, неравные отношения"),
+        (("терпение", "инвестиции", "оценка"),
+         "Терпение, долгосрочные вложения, оценка результатов",
+         "Нетерпение, сомнительные вложения, отсутствие отдачи"),
+        (("усердие", "ремесло", "совершенствование"),
+         "Усердная работа, совершенствование навыков, преданность делу",
+         "Перфекционизм, рутина без цели, отсутствие мотивации"),
+        (("независимость", "роскошь", "самодостаточность"),
+         "Финансовая независимость, самодостаточность, заслуженный комфорт",
+         "Зависимость от других, показная роскошь, переработки"),
+        (("наследие", "богатство", "семья"),
+         "Наследие, семейное благополучие, долгосрочная стабильность",
+         "Семейные споры о деньгах, финансовые потери, нестабильность"),
+        (("учёба", "амбиции", "новое дело"),
+         "Стремление учиться, практичные цели, начало нового дела",
+         "Отсутствие прогресса, прокрастинация, упущенные уроки"),
+        (("надёжность", "трудолюбие", "методичность"),
+         "Надёжность, трудолюбие, методичное движение к цели",
+         "Скука, застой, лень, чрезмерная осторожность"),
+        (("забота", "практичность", "достаток"),
+         "Практичная забота, уют, достаток и материнская щедрость",
+         "Дисбаланс между работой и домом, самоотречение, зависимость"),
+        (("богатство", "успех", "стабильность"),
+         "Богатство, деловой успех, стабильность и щедрость",
+         "Жадность, упрямство, финансовые ошибки, одержимость статусом"),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class CardRecord:
+    """Неизменяемая запись о карте колоды"""
+    __slots__ = ("id", "name", "arcana", "suit", "image", "keywords", "upright_meaning", "reversed_meaning")
+
+    id: int
+    name: str
+    arcana: str
+    suit: Optional[str]
+    image: str
+    keywords: Tuple[str, ...]
+    upright_meaning: str
+    reversed_meaning: str
+
+    def to_dict(self) -> Dict:
+        """Словарь в формате TarotCard (без ориентации и позиции)"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "arcana": self.arcana,
+            "image": self.image,
+            "keywords": list(self.keywords),
+            "upright_meaning": self.upright_meaning,
+            "reversed_meaning": self.reversed_meaning,
+        }
+
+
+def _build_records() -> Tuple[CardRecord, ...]:
+    records = [
+        CardRecord(card_id, name, "major", None, IMAGES[image], keywords, upright, reversed_meaning)
+        for card_id, name, image, keywords, upright, reversed_meaning in MAJOR_ARCANA
+    ]
+    card_id = len(records)
+    for suit, suit_name, image in SUITS:
+        for rank, (keywords, upright, reversed_meaning) in zip(RANKS, MINOR_ARCANA[suit]):
+            card_id += 1
+            records.append(CardRecord(card_id, f"{rank} {suit_name}", "minor", suit, IMAGES[image],
+                                      keywords, upright, reversed_meaning))
+    return tuple(records)
+
+
+class DeckCatalogue:
+    """Колода, собранная один раз на процесс.
+
+    Карты хранятся как неизменяемые записи с индексами по id, аркану и
+    масти. Для каждой карты заранее собран JSON-фрагмент, поэтому
+    вытягивание расклада - это перемешивание индексов и склейка строк,
+    без построения словарей и валидации моделей.
+    """
+
+    def __init__(self, records: Sequence[CardRecord]):
+        self.records: Tuple[CardRecord, ...] = tuple(records)
+        self.by_id: Dict[int, CardRecord] = {record.id: record for record in self.records}
+        self.index_by_id: Dict[int, int] = {record.id: i for i, record in enumerate(self.records)}
+        self.by_arcana: Dict[str, Tuple[CardRecord, ...]] = {}
+        self.by_suit: Dict[str, Tuple[CardRecord, ...]] = {}
+        for record in self.records:
+            self.by_arcana[record.arcana] = self.by_arcana.get(record.arcana, ()) + (record,)
+            if record.suit:
+                self.by_suit[record.suit] = self.by_suit.get(record.suit, ()) + (record,)
+
+        # JSON карты без закрывающей скобки: ориентация и позиция дописываются при выдаче
+        self._fragments: Tuple[str, ...] = tuple(
+            json.dumps({**record.to_dict(), "suit": record.suit}, ensure_ascii=False)[:-1]
+            for record in self.records
+        )
+        self._position_json: Dict[Optional[str], str] = {None: "null"}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, card_id: int) -> Optional[CardRecord]:
+        return self.by_id.get(card_id)
+
+    def draw(self, count: int, reversed_probability: float = 0.3,
+             rng: random.Random = None) -> List[Tuple[int, bool]]:
+        """Вытягивает count карт без повторов: список (индекс карты, перевёрнута ли)"""
+        if not 0 < count <= len(self.records):
+            raise ValueError(f"Можно вытянуть от 1 до {len(self.records)} карт, запрошено {count}")
+        rng = rng or random
+        started = time.perf_counter()
+        drawn = [(index, rng.random() < reversed_probability) for index in rng.sample(range(len(self.records)), count)]
+        DECK_DRAW_LATENCY.observe(time.perf_counter() - started, "single")
+        return drawn
+
+    def card_json(self, index: int, is_reversed: bool, position: Optional[str] = None) -> str:
+        position_json = self._position_json.get(position)
+        if position_json is None:
+            position_json = self._position_json[position] = json.dumps(position, ensure_ascii=False)
+        return f'{self._fragments[index]}, "reversed": {"true" if is_reversed else "false"}, "position": {position_json}}}'
+
+    def spread_json(self, drawn: Sequence[Tuple[int, bool]], positions: Sequence[str] = ()) -> str:
+        """JSON ответа {"cards": [...]} из заранее собранных фрагментов"""
+        cards = ", ".join(
+            self.card_json(index, is_reversed, positions[i] if i < len(positions) else None)
+            for i, (index, is_reversed) in enumerate(drawn)
+        )
+        return f'{{"cards": [{cards}]}}'
+
+    def ref_json(self, index: int, is_reversed: bool, position: Optional[str] = None) -> str:
+        """Компактная ссылка на карту: id, ориентация и позиция"""
+        position_json = json.dumps(position, ensure_ascii=False)
+        return f'{{"id": {self.records[index].id}, "reversed": {"true" if is_reversed else "false"}, "position": {position_json}}}'
+
+    def draw_batch(self, count: int, spreads: int, rng: np.random.Generator,
+                   reversed_probability: float = 0.3) -> Tuple[np.ndarray, np.ndarray]:
+        """Векторно вытягивает spreads независимых раскладов по count карт.
+
+        Возвращает матрицу индексов карт (spreads x count) и маску перевёрнутых карт.
+        Случайная выборка без повторов: берутся count наименьших из равномерных
+        ключей по всей колоде и упорядочиваются по возрастанию ключа.
+        """
+        if not 0 < count <= len(self.records):
+            raise ValueError(f"Можно вытянуть от 1 до {len(self.records)} карт, запрошено {count}")
+        started = time.perf_counter()
+        keys = rng.random((spreads, len(self.records)))
+        if count < len(self.records):
+            chosen = np.argpartition(keys, count - 1, axis=1)[:, :count]
+            order = np.argsort(np.take_along_axis(keys, chosen, axis=1), axis=1)
+            indices = np.take_along_axis(chosen, order, axis=1)
+        else:
+            indices = np.argsort(keys, axis=1)
+        reversed_mask = rng.random((spreads, count)) < reversed_probability
+        DECK_DRAW_LATENCY.observe(time.perf_counter() - started, "batch")
+        return indices, reversed_mask
+
+    def batch_ndjson(self, count: int, spreads: int, positions: Sequence[str] = (), seed: Optional[int] = None,
+                     full: bool = False, chunk_bytes: int = 1 << 20) -> Iterator[str]:
+        """NDJSON по одному раскладу на строку, порциями примерно по chunk_bytes.
+
+        Фрагменты для каждой (позиции, карты, ориентации) собираются заранее,
+        а строки порции выбираются из таблицы одной векторной индексацией.
+        Число раскладов в порции зависит от размера строки (count и формат),
+        поэтому память на порцию ограничена и для полных карт.
+        При одинаковом seed поток раскладов воспроизводим.
+        """
+        size = len(self.records)
+        fragment = self.card_json if full else self.ref_json
+        table = np.empty(count * size * 2, dtype=object)
+        for slot in range(count):
+            position = positions[slot] if slot < len(positions) else None
+            for index in range(size):
+                for is_reversed in (0, 1):
+                    table[(slot * size + index) * 2 + is_reversed] = fragment(index, bool(is_reversed), position)
+        slot_offsets = np.arange(count) * size * 2
+        line_bytes = sum(len(fragment) for fragment in table) / len(table) * count + 2 * count + 16
+        chunk_size = max(1, int(chunk_bytes // line_bytes))
+
+        rng = np.random.default_rng(seed)
+        emitted = 0
+        while emitted < spreads:
+            batch = min(chunk_size, spreads - emitted)
+            indices, reversed_mask = self.draw_batch(count, batch, rng)
+
+            # Строка: открывающая часть, фрагменты карт через запятую, закрывающая часть
+            parts = np.empty((batch, 2 * count + 1), dtype=object)
+            parts[:, 0] = '{"cards": ['
+            parts[:, 1::2] = table[slot_offsets + indices * 2 + reversed_mask]
+            parts[:, 2:-1:2] = ", "
+            parts[:, -1] = "]}\n"
+            yield "".join(parts.ravel())
+            emitted += batch
+
+    def tarot_card(self, index: int, is_reversed: bool = False, position: Optional[str] = None) -> TarotCard:
+        return TarotCard(**self.records[index].to_dict(), reversed=is_reversed, position=position)
+
+
+_deck: Optional[DeckCatalogue] = None
+
+
+def get_deck() -> DeckCatalogue:
+    """Колода процесса (собирается при первом обращении)"""
+    global _deck
+    if _deck is None:
+        _deck = DeckCatalogue(_build_records())
+    return _deck
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.prompts import estimate_tokens
+
+load_dotenv()
+
+# Бюджет истории уточняющих вопросов, который отправляется в LLM вместе с новым вопросом
+FOLLOWUP_HISTORY_TOKENS = int(os.environ.get("FOLLOWUP_HISTORY_TOKENS", "1500"))
+MAX_FOLLOWUP_TURNS = int(os.environ.get("MAX_FOLLOWUP_TURNS", "20"))
+
+
+async def ensure_followup_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Индекс для выборки последних вопросов по гаданию"""
+    await db.reading_followups.create_index(
+        [("reading_id", 1), ("created_at", -1)],
+        name="reading_followups"
+    )
+
+
+async def fetch_followup_history(db: AsyncIOMotorDatabase, reading_id: str,
+                                 token_budget: int = FOLLOWUP_HISTORY_TOKENS) -> List[Dict]:
+    """Последние вопросы и ответы по гаданию (в хронологическом порядке), уложенные в бюджет токенов"""
+    turns = await db.reading_followups.find(
+        {"reading_id": reading_id},
+        {"_id": 0, "question": 1, "answer": 1}
+    ).sort("created_at", -1).limit(MAX_FOLLOWUP_TURNS).to_list(length=MAX_FOLLOWUP_TURNS)
+
+    history = []
+    used = 0
+    for turn in turns:
+        used += estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"])
+        if used > token_budget:
+            break
+        history.append(turn)
+    history.reverse()
+    return history
+
+
+async def save_followup_turn(db: AsyncIOMotorDatabase, reading_id: str, session_id: str,
+                             question: str, answer: str) -> None:
+    await db.reading_followups.insert_one({
+        "reading_id": reading_id,
+        "session_id": session_id,
+        "question": question,
+        "answer": answer,
+        "created_at": datetime.utcnow(),
+    })
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+
+from services.history_service import fetch_history_page
+
+load_dotenv()
+
+
+class HistoryCache:
+    """Кэш сериализованных страниц истории по сессиям.
+
+    Ключ страницы включает версию сессии из коллекции session_versions:
+    сохранение гадания увеличивает версию, и старые страницы больше не
+    находятся (их вытесняет LRU). Версии кэшируются в процессе на
+    version_ttl секунд, поэтому повторный просмотр истории не делает
+    запросов к MongoDB; другие воркеры видят новую версию не позже чем
+    через version_ttl.
+    """
+
+    def __init__(self, max_entries: int = 5000, version_ttl: float = 2.0):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._pages: "OrderedDict[tuple, Tuple[str, bytes]]" = OrderedDict()
+        self._versions: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._collection = None
+        self.hits = 0
+        self.misses = 0
+
+    async def attach(self, db: AsyncIOMotorDatabase) -> None:
+        """Подключает общую коллекцию версий сессий"""
+        self._collection = db.session_versions
+        try:
+            # По числу гаданий в сессии архивация находит сессии сверх лимита
+            await self._collection.create_index("readings", name="session_readings")
+        except Exception as e:
+            print(f"Ошибка создания индекса версий сессий: {e}")
+
+    def _remember_version(self, session: str, version: int) -> None:
+        self._versions[session] = (time.monotonic() + self.version_ttl, version)
+        self._versions.move_to_end(session)
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+
+    async def version(self, session: str) -> int:
+        entry = self._versions.get(session)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        document = await self._collection.find_one({"_id": session}, {"version": 1})
+        version = document["version"] if document else 0
+        self._remember_version(session, version)
+        return version
+
+    async def bump(self, session: str, added: int = 1) -> None:
+        """Новая версия истории сессии (после записи гадания); added - изменение числа гаданий"""
+        if self._collection is None:
+            return
+        document = await self._collection.find_one_and_update(
+            {"_id": session},
+            {"$inc": {"version": 1, "readings": added}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._remember_version(session, document["version"])
+
+    async def bump_many(self, changes: Dict[str, int]) -> None:
+        """Новые версии для сессий пачки: {сессия: изменение числа гаданий}"""
+        if self._collection is None or not changes:
+            return
+        now = datetime.utcnow()
+        await self._collection.bulk_write([
+            UpdateOne({"_id": session}, {"$inc": {"version": 1, "readings": added}, "$set": {"updated_at": now}}, upsert=True)
+            for session, added in changes.items()
+        ], ordered=False)
+        for session in changes:
+            self._versions.pop(session, None)
+
+    async def get_page(self, db: AsyncIOMotorDatabase, session: str, limit: int,
+                       cursor: Optional[str], view: str) -> Tuple[str, bytes]:
+        """ETag и тело страницы истории (из кэша или из MongoDB)"""
+        if self._collection is None:
+            return self._serialize(await fetch_history_page(db, session, limit=limit, cursor=cursor, view=view))
+
+        key = (session, await self.version(session), limit, cursor, view)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+        self.misses += 1
+        page = self._serialize(await fetch_history_page(db, session, limit=limit, cursor=cursor, view=view))
+        self._pages[key] = page
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return page
+
+    def _serialize(self, page: Dict) -> Tuple[str, bytes]:
+        body = orjson.dumps(page)
+        return f'"{hashlib.sha256(body).hexdigest()[:32]}"', body
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "pages": len(self._pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+history_cache = HistoryCache(
+    max_entries=int(os.environ.get("HISTORY_CACHE_MAX_ENTRIES", "5000")),
+    version_ttl=float(os.environ.get("HISTORY_VERSION_TTL_SECONDS", "2")),
+)
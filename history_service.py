@@ -0,0 +1,113 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.reading_store import rehydrate_card, rehydrate_reading
+
+HISTORY_VIEWS = ("full", "summary")
+MAX_PAGE_SIZE = 50
+
+# Поля, которые нужны списку истории (ReadingHistory.jsx): превью карт и начало интерпретации
+SUMMARY_CARDS = 3
+SUMMARY_INTERPRETATION_CHARS = 300
+SUMMARY_CARD_FIELDS = ("id", "name", "image", "reversed", "position")
+
+# Поля гадания из контракта API; служебные поля документа (session_id,
+# prompt_version, schema_version) наружу не отдаются
+READING_FIELDS = ("id", "spread_type", "question", "cards", "interpretation", "created_at")
+READING_PROJECTION = {"_id": 0, **{field: 1 for field in READING_FIELDS}}
+
+
+class InvalidCursor(ValueError):
+    """Курсор пагинации повреждён или подделан"""
+
+
+def encode_cursor(created_at: datetime, reading_id: str) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "i": reading_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), str(data["i"])
+    except Exception:
+        raise InvalidCursor("Некорректный курсор истории")
+
+
+async def ensure_history_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Индексы для истории: выборка по сессии в порядке (created_at, id) без сортировки в памяти"""
+    await db.readings.create_index(
+        [("session_id", 1), ("created_at", -1), ("id", -1)],
+        name="session_history"
+    )
+    await db.readings.create_index("id", unique=True, name="reading_id")
+
+
+def _page_query(session: str, cursor: Optional[str]) -> Dict:
+    query = {"session_id": session}
+    if cursor:
+        created_at, reading_id = decode_cursor(cursor)
+        # Keyset: строго после последней записи предыдущей страницы в порядке (created_at, id) по убыванию
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": reading_id}},
+        ]
+    return query
+
+
+def _summary_card(card: Dict) -> Dict:
+    return {field: card.get(field) for field in SUMMARY_CARD_FIELDS}
+
+
+def public_reading(reading: Dict) -> Dict:
+    """Гадание в том виде, в каком его отдаёт API"""
+    return {field: reading.get(field) for field in READING_FIELDS}
+
+
+async def fetch_history_page(db: AsyncIOMotorDatabase, session: str, limit: int = MAX_PAGE_SIZE,
+                             cursor: Optional[str] = None, view: str = "full") -> Dict:
+    """Страница истории сессии и курсор следующей страницы"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = _page_query(session, cursor)
+    sort = [("created_at", -1), ("id", -1)]
+
+    if view == "summary":
+        pipeline = [
+            {"$match": query},
+            {"$sort": dict(sort)},
+            {"$limit": limit + 1},
+            {"$project": {
+                "_id": 0,
+                "id": 1,
+                "spread_type": 1,
+                "question": 1,
+                "created_at": 1,
+                "cards": {"$slice": ["$cards", SUMMARY_CARDS]},
+                "cards_count": {"$size": {"$ifNull": ["$cards", []]}},
+                "interpretation": {"$substrCP": ["$interpretation", 0, SUMMARY_INTERPRETATION_CHARS]},
+            }},
+        ]
+        readings = await db.readings.aggregate(pipeline).to_list(length=limit + 1)
+        for reading in readings:
+            reading["cards"] = [_summary_card(rehydrate_card(card)) for card in reading.get("cards") or []]
+    else:
+        readings = await db.readings.find(query, READING_PROJECTION).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+        readings = [public_reading(rehydrate_reading(reading)) for reading in readings]
+
+    next_cursor = None
+    if len(readings) > limit:
+        readings = readings[:limit]
+        last = readings[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    return {"readings": readings, "next_cursor": next_cursor}
+
+
+async def fetch_reading(db: AsyncIOMotorDatabase, session: str, reading_id: str) -> Optional[Dict]:
+    """Полный документ гадания со служебными полями (для API - через public_reading)"""
+    reading = await db.readings.find_one({"id": reading_id, "session_id": session}, {"_id": 0})
+    return rehydrate_reading(reading) if reading is not None else None
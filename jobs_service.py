@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.tarot import TarotCard
+from services.admission import AdmissionRejected
+from services.ai_service import AITarotService
+
+load_dotenv()
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+
+
+class JobQueueFull(Exception):
+    """Очередь заданий заполнена"""
+
+
+class IdempotencyConflict(Exception):
+    """Ключ идемпотентности уже использован для другого запроса"""
+
+
+def _request_hash(cards: List[TarotCard], spread_type: str, question: Optional[str]) -> str:
+    payload = {
+        "spread": spread_type,
+        "question": question,
+        "cards": [[card.id, bool(card.reversed), card.position] for card in cards],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def job_view(job: Dict) -> Dict:
+    """Публичное представление задания для ответа API"""
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "spread_type": job["spread_type"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+    }
+
+
+class ReadingJobQueue:
+    """Асинхронные задания на генерацию предсказаний.
+
+    Запрос сразу получает id задания, а пул воркеров выполняет
+    AITarotService.generate_reading. Задания хранятся в коллекции
+    reading_jobs с TTL, поэтому статус и результат можно запросить из
+    любого процесса. Повтор запроса с тем же ключом идемпотентности
+    возвращает уже созданное задание, а не запускает новый вызов LLM.
+
+    Выполняемое задание держит аренду: воркер обновляет heartbeat_at каждые
+    lease_seconds / 3 секунд. Задания упавшего процесса с устаревшим
+    heartbeat_at возвращаются в очередь живыми процессами; так же живые
+    процессы подбирают задания в очереди, которые дольше lease_seconds никто
+    не взял (процесс упал до выполнения) или срок not_before которых прошёл.
+    Запуск задания помечается владельцем и номером попытки: результат
+    записывается, только пока задание принадлежит этому запуску.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 1000, ttl_seconds: int = 3600,
+                 max_attempts: int = 3, poll_interval: float = 0.5, lease_seconds: float = 60):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Set[str] = set()
+        # Задания в локальной очереди: одно задание стоит в ней не больше одного раза
+        self._enqueued: Set[str] = set()
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._finished: Dict[str, asyncio.Event] = {}
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self.reclaimed = 0
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Создаёт индексы, поднимает воркеров и возвращает в очередь незавершённые задания"""
+        self._db = db
+        self._queue = asyncio.Queue()
+        try:
+            await db.reading_jobs.create_index("expires_at", expireAfterSeconds=0)
+            await db.reading_jobs.create_index(
+                "idempotency_key",
+                unique=True,
+                partialFilterExpression={"idempotency_key": {"$type": "string"}}
+            )
+            await db.reading_jobs.create_index([("status", 1), ("heartbeat_at", 1)], name="job_leases")
+            await db.reading_jobs.create_index([("status", 1), ("queued_at", 1)], name="job_queue_age")
+        except Exception as e:
+            print(f"Ошибка создания индексов заданий: {e}")
+        async for job in db.reading_jobs.find({"status": JOB_QUEUED}, {"_id": 1}):
+            self._enqueue(job["_id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaim_loop()))
+
+    async def stop(self) -> None:
+        """Останавливает воркеров; прерванные задания снова ставятся в очередь"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._running:
+            await self._db.reading_jobs.update_many(
+                {"_id": {"$in": list(self._running)}, "status": JOB_RUNNING, "owner": self._owner},
+                {"$set": {"status": JOB_QUEUED, "queued_at": datetime.utcnow()}}
+            )
+            self._running.clear()
+
+    async def submit(self, cards: List[TarotCard], spread_type: str, question: Optional[str] = None,
+                     idempotency_key: Optional[str] = None) -> Dict:
+        """Создаёт задание (или возвращает существующее по ключу идемпотентности)"""
+        request_hash = _request_hash(cards, spread_type, question)
+        if idempotency_key:
+            existing = await self._find_by_key(idempotency_key, request_hash)
+            if existing is not None:
+                return existing
+        if self._queue.qsize() >= self.max_queue:
+            raise JobQueueFull("Очередь заданий заполнена, попробуйте позже")
+
+        now = datetime.utcnow()
+        job = {
+            "_id": str(uuid.uuid4()),
+            "status": JOB_QUEUED,
+            "spread_type": spread_type,
+            "question": question,
+            "cards": [card.dict() for card in cards],
+            "request_hash": request_hash,
+            "attempts": 0,
+            "created_at": now,
+            "queued_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds),
+        }
+        if idempotency_key:
+            job["idempotency_key"] = idempotency_key
+        try:
+            await self._db.reading_jobs.insert_one(job)
+        except DuplicateKeyError:
+            # Параллельный повтор с тем же ключом успел создать задание первым
+            existing = await self._find_by_key(idempotency_key, request_hash)
+            if existing is not None:
+                return existing
+            raise
+        self.submitted += 1
+        self._enqueue(job["_id"])
+        return job
+
+    async def _find_by_key(self, idempotency_key: str, request_hash: str) -> Optional[Dict]:
+        job = await self._db.reading_jobs.find_one({"idempotency_key": idempotency_key})
+        if job is None:
+            return None
+        if job["request_hash"] != request_hash:
+            raise IdempotencyConflict("Ключ идемпотентности уже использован для другого запроса")
+        self.deduplicated += 1
+        return job
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[Dict]:
+        """Задание по id; wait > 0 - ждать завершения не дольше wait секунд (long-poll)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            job = await self._db.reading_jobs.find_one({"_id": job_id})
+            remaining = deadline - loop.time()
+            if job is None or job["status"] in FINISHED_STATUSES:
+                self._finished.pop(job_id, None)
+                return job
+            if remaining <= 0:
+                # Событие больше никто не установит, если задание выполняет другой процесс
+                self._finished.pop(job_id, None)
+                return job
+            # Задание этого процесса будит ожидающих сразу, чужое - опрашиваем
+            finished = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(finished.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._enqueued:
+            self._enqueued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._enqueued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Ошибка выполнения задания {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _schedule(self, job_id: str, delay: float) -> None:
+        """Вернуть задание в локальную очередь через delay секунд, не занимая воркера"""
+        asyncio.get_running_loop().call_later(max(0.0, delay), self._enqueue, job_id)
+
+    async def _run(self, job_id: str) -> None:
+        # Забираем задание атомарно: другой процесс не выполнит его повторно
+        now = datetime.utcnow()
+        job = await self._db.reading_jobs.find_one_and_update(
+            {"_id": job_id, "status": JOB_QUEUED, "$or": [{"not_before": None}, {"not_before": {"$lte": now}}]},
+            {"$set": {"status": JOB_RUNNING, "owner": self._owner, "started_at": now, "heartbeat_at": now},
+             "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            # Задание отложено после отказа admission - вернёмся к нему в срок
+            pending = await self._db.reading_jobs.find_one({"_id": job_id, "status": JOB_QUEUED}, {"not_before": 1})
+            if pending is not None and pending.get("not_before"):
+                self._schedule(job_id, (pending["not_before"] - now).total_seconds())
+            return
+        if job["attempts"] > self.max_attempts:
+            # Задание возвращалось после падений процесса слишком много раз
+            if await self._finish(job, {"status": JOB_FAILED, "error": "Превышено число попыток выполнения"}):
+                self.failed += 1
+            return
+
+        self._running.add(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await AITarotService().generate_reading(
+                cards=[TarotCard(**card) for card in job["cards"]],
+                spread_type=job["spread_type"],
+                question=job.get("question")
+            )
+        except AdmissionRejected as e:
+            if job["attempts"] < self.max_attempts:
+                # LLM перегружена: задание ждёт в очереди с not_before, воркер свободен
+                requeued = await self._db.reading_jobs.update_one(
+                    self._lease_query(job),
+                    {"$set": {"status": JOB_QUEUED, "not_before": datetime.utcnow() + timedelta(seconds=e.retry_after)}}
+                )
+                self._running.discard(job_id)
+                if requeued.modified_count:
+                    self._schedule(job_id, e.retry_after)
+                return
+            if await self._finish(job, {"status": JOB_FAILED, "error": str(e)}):
+                self.failed += 1
+        except Exception as e:
+            if await self._finish(job, {"status": JOB_FAILED, "error": str(e)}):
+                self.failed += 1
+        else:
+            if await self._finish(job, {"status": JOB_DONE, "result": dict(result)}):
+                self.completed += 1
+        finally:
+            heartbeat.cancel()
+
+    def _lease_query(self, job: Dict) -> Dict:
+        """Задание всё ещё выполняется этим запуском (не возвращено в очередь и не взято другим)"""
+        return {"_id": job["_id"], "status": JOB_RUNNING, "owner": self._owner, "attempts": job["attempts"]}
+
+    async def _heartbeat(self, job: Dict) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._db.reading_jobs.update_one(self._lease_query(job), {"$set": {"heartbeat_at": datetime.utcnow()}})
+            except Exception as e:
+                print(f"Ошибка продления аренды задания {job['_id']}: {e}")
+
+    async def reclaim_stale(self) -> int:
+        """Возвращает в работу задания упавших процессов.
+
+        Выполняемые задания с истёкшей арендой снова ставятся в очередь;
+        задания в очереди, которые дольше lease_seconds никто не взял или
+        срок not_before которых прошёл, берутся в локальную очередь. Взять
+        задание на выполнение может только один процесс (атомарный захват в _run).
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.lease_seconds)
+        query = {"status": JOB_RUNNING, "$or": [
+            {"heartbeat_at": {"$lt": stale_before}},
+            # Задания, начатые до появления heartbeat_at
+            {"heartbeat_at": None, "started_at": {"$lt": stale_before}},
+        ]}
+        reclaimed = 0
+        for job in await self._db.reading_jobs.find(query, {"_id": 1}).to_list(length=self.max_queue):
+            job = await self._db.reading_jobs.find_one_and_update(
+                dict(query, _id=job["_id"]),
+                {"$set": {"status": JOB_QUEUED, "queued_at": now}, "$unset": {"not_before": "", "owner": ""}}
+            )
+            if job is not None:
+                self._enqueue(job["_id"])
+                reclaimed += 1
+
+        orphaned = {"status": JOB_QUEUED, "_id": {"$nin": list(self._enqueued)}, "$or": [
+            {"not_before": {"$lte": now}},
+            {"not_before": None, "queued_at": {"$lt": stale_before}},
+            # Задания, созданные до появления queued_at
+            {"not_before": None, "queued_at": None, "created_at": {"$lt": stale_before}},
+        ]}
+        for job in await self._db.reading_jobs.find(orphaned, {"_id": 1}).to_list(length=self.max_queue):
+            self._enqueue(job["_id"])
+            reclaimed += 1
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def _reclaim_loop(self) -> None:
+        while True:
+            try:
+                await self.reclaim_stale()
+            except Exception as e:
+                print(f"Ошибка возврата зависших заданий: {e}")
+            await asyncio.sleep(self.lease_seconds / 2)
+
+    async def _finish(self, job: Dict, fields: Dict) -> bool:
+        """Записывает итог запуска; False - задание уже вернули в очередь или выполнил другой запуск"""
+        job_id = job["_id"]
+        fields["finished_at"] = datetime.utcnow()
+        updated = await self._db.reading_jobs.update_one(self._lease_query(job), {"$set": fields})
+        self._running.discard(job_id)
+        if not updated.modified_count:
+            print(f"Задание {job_id} больше не принадлежит этому запуску, результат не записан")
+            return False
+        finished = self._finished.pop(job_id, None)
+        if finished is not None:
+            finished.set()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "failed": self.failed,
+            "reclaimed": self.reclaimed,
+        }
+
+
+reading_jobs = ReadingJobQueue(
+    workers=int(os.environ.get("READING_JOB_WORKERS", "4")),
+    max_queue=int(os.environ.get("READING_JOB_MAX_QUEUE", "1000")),
+    ttl_seconds=int(os.environ.get("READING_JOB_TTL_SECONDS", "3600")),
+    max_attempts=int(os.environ.get("READING_JOB_MAX_ATTEMPTS", "3")),
+    lease_seconds=float(os.environ.get("READING_JOB_LEASE_SECONDS", "60")),
+)
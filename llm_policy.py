@@ -0,0 +1,281 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from services.admission import AdmissionController, llm_admission
+from services.metrics import LLM_LATENCY
+from services.tarot_service import spread_label
+
+load_dotenv()
+
+# Сроки (в секундах), за которые расклад должен получить ответ AI.
+# После истечения срока сразу используется резервная интерпретация.
+DEFAULT_DEADLINES = {
+    "single": 15.0,
+    "daily": 15.0,
+    "three": 25.0,
+    "love": 30.0,
+    "weekly": 40.0,
+    "celtic": 45.0,
+}
+
+# Признаки временных ошибок провайдера, которые имеет смысл повторить
+TRANSIENT_MARKERS = ("429", "500", "502", "503", "504", "rate limit", "timeout", "timed out",
+                     "temporarily", "overloaded", "connection")
+
+
+def _parse_deadlines(raw: str) -> Dict[str, float]:
+    """Разбирает LLM_DEADLINES вида "single=10,celtic=60" """
+    deadlines = dict(DEFAULT_DEADLINES)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        spread_type, _, seconds = item.partition("=")
+        deadlines[spread_type.strip()] = float(seconds)
+    return deadlines
+
+
+class DeadlineExceeded(Exception):
+    """Ответ AI не получен до истечения срока"""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных вызовов для расчёта перцентилей"""
+
+    def __init__(self, window: int = 256):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class UpstreamHealth:
+    """Оценка состояния AI по последним вызовам.
+
+    Ошибки, истечения срока и слишком медленные ответы считаются неудачами.
+    При высокой доле неудач AI считается деградировавшим: запросы уходят в
+    локальную интерпретацию, и лишь раз в probe_interval секунд один запрос
+    пропускается к AI, чтобы проверить, восстановился ли он.
+    """
+
+    def __init__(self, window: int = 20, failure_ratio: float = 0.5, probe_interval: float = 10.0):
+        self.window = window
+        self.failure_ratio = failure_ratio
+        self.probe_interval = probe_interval
+        self._outcomes = deque(maxlen=window)
+        self._next_probe_at = 0.0
+
+    def record(self, ok: bool) -> None:
+        self._outcomes.append(ok)
+
+    @property
+    def degraded(self) -> bool:
+        if len(self._outcomes) < max(1, self.window // 2):
+            return False
+        failures = sum(1 for ok in self._outcomes if not ok)
+        return failures / len(self._outcomes) >= self.failure_ratio
+
+    def allow_request(self) -> bool:
+        if not self.degraded:
+            return True
+        now = time.monotonic()
+        if now >= self._next_probe_at:
+            self._next_probe_at = now + self.probe_interval
+            return True
+        return False
+
+
+class LlmCallPolicy:
+    """Сроки, хеджирование и повторы для вызовов LLM.
+
+    Если первый вызов дольше заданного перцентиля задержек, запускается
+    дублирующий запрос, и побеждает первый успешный ответ. Дубль занимает
+    собственный слот admission и не отправляется, если свободных слотов
+    нет, - лимит одновременных вызовов провайдера не превышается. Временные ошибки
+    повторяются с экспоненциальной задержкой со случайным разбросом, но
+    не дольше оставшегося срока.
+    """
+
+    def __init__(self, deadlines: Dict[str, float], hedge_percentile: float = 95.0,
+                 hedge_min_samples: int = 20, max_attempts: int = 3,
+                 retry_base_seconds: float = 0.5, retry_max_seconds: float = 4.0,
+                 slow_fraction: float = 0.8, health: UpstreamHealth = None,
+                 admission: Optional[AdmissionController] = None):
+        self.deadlines = deadlines
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.slow_fraction = slow_fraction
+        self.health = health or UpstreamHealth()
+        self.admission = admission
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self.hedges = 0
+        self.hedges_skipped = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.deadlines_exceeded = 0
+
+    def deadline_for(self, spread_type: str) -> float:
+        return self.deadlines.get(spread_type, self.deadlines["single"])
+
+    def tracker(self, spread_type: str) -> LatencyTracker:
+        # По нормализованному ключу: строки клиента вне известных раскладов делят один трекер
+        label = spread_label(spread_type)
+        tracker = self._trackers.get(label)
+        if tracker is None:
+            tracker = self._trackers[label] = LatencyTracker()
+        return tracker
+
+    def hedge_delay(self, spread_type: str) -> Optional[float]:
+        """Через сколько секунд отправлять дублирующий запрос (None - не хеджировать)"""
+        if self.hedge_percentile <= 0:
+            return None
+        tracker = self.tracker(spread_type)
+        if len(tracker) < self.hedge_min_samples:
+            return None
+        return tracker.percentile(self.hedge_percentile)
+
+    def _backoff(self, attempt: int) -> float:
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def _hedged(self, factory: Callable[[], Awaitable[Any]], deadline_at: float,
+                      hedge_delay: Optional[float]) -> Any:
+        started = time.monotonic()
+        primary = asyncio.ensure_future(factory())
+        tasks = {primary}
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                wake_at = min(hedge_at, deadline_at) if hedge_at is not None else deadline_at
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=max(0.0, wake_at - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+
+                if done:
+                    continue
+                if hedge_at is not None and time.monotonic() < deadline_at:
+                    # Первый вызов дольше обычного - отправляем дубль, если есть свободный слот
+                    hedge_at = None
+                    if self.admission is not None and not self.admission.try_acquire():
+                        self.hedges_skipped += 1
+                        continue
+                    self.hedges += 1
+                    hedge = asyncio.ensure_future(factory())
+                    if self.admission is not None:
+                        # Слот освобождается и при отмене дубля, даже не успевшего начаться
+                        hedge.add_done_callback(lambda _: self.admission.release())
+                    tasks.add(hedge)
+                    continue
+                self.deadlines_exceeded += 1
+                raise DeadlineExceeded("Истёк срок ожидания ответа AI")
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, spread_type: str, factory: Callable[[], Awaitable[Any]],
+                   deadline_at: Optional[float] = None) -> Any:
+        """Вызывает factory() с учётом срока, хеджирования и повторов"""
+        deadline = self.deadline_for(spread_type)
+        if deadline_at is None:
+            deadline_at = time.monotonic() + deadline
+        label = spread_label(spread_type)
+        tracker = self.tracker(spread_type)
+
+        attempt = 0
+        while True:
+            if time.monotonic() >= deadline_at:
+                self.deadlines_exceeded += 1
+                raise DeadlineExceeded("Истёк срок ожидания ответа AI")
+
+            started = time.monotonic()
+            try:
+                result = await self._hedged(factory, deadline_at, self.hedge_delay(spread_type))
+            except DeadlineExceeded:
+                LLM_LATENCY.observe(time.monotonic() - started, label, "deadline")
+                self.health.record(False)
+                raise
+            except Exception as e:
+                LLM_LATENCY.observe(time.monotonic() - started, label, "error")
+                attempt += 1
+                if attempt >= self.max_attempts or not is_transient(e):
+                    self.health.record(False)
+                    raise
+                backoff = self._backoff(attempt)
+                if time.monotonic() + backoff >= deadline_at:
+                    self.health.record(False)
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff)
+                continue
+
+            latency = time.monotonic() - started
+            LLM_LATENCY.observe(latency, label, "ok")
+            tracker.record(latency)
+            self.health.record(latency < deadline * self.slow_fraction)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,
+            "retries": self.retries,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "degraded": self.health.degraded,
+            "p95_seconds": {
+                spread_type: tracker.percentile(95)
+                for spread_type, tracker in self._trackers.items()
+            },
+        }
+
+
+llm_policy = LlmCallPolicy(
+    deadlines=_parse_deadlines(os.environ.get("LLM_DEADLINES", "")),
+    hedge_percentile=float(os.environ.get("LLM_HEDGE_PERCENTILE", "95")),
+    hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20")),
+    max_attempts=int(os.environ.get("LLM_MAX_ATTEMPTS", "3")),
+    retry_base_seconds=float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5")),
+    retry_max_seconds=float(os.environ.get("LLM_RETRY_MAX_SECONDS", "4")),
+    slow_fraction=float(os.environ.get("LLM_SLOW_FRACTION", "0.8")),
+    health=UpstreamHealth(
+        window=int(os.environ.get("LLM_HEALTH_WINDOW", "20")),
+        failure_ratio=float(os.environ.get("LLM_HEALTH_FAILURE_RATIO", "0.5")),
+        probe_interval=float(os.environ.get("LLM_HEALTH_PROBE_SECONDS", "10")),
+    ),
+    admission=llm_admission,
+)
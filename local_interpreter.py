@@ -0,0 +1,96 @@
+from typing import Dict, List
+
+from models.tarot import TarotCard
+from services.tarot_service import TarotService
+
+# Шаблоны собраны один раз при импорте; генерация - только подстановка строк
+SPREAD_INTROS = {
+    "single": "Карта отвечает на ваш вопрос через образ «{name}».",
+    "daily": "Энергию этого дня задаёт карта «{name}».",
+    "three": "Расклад показывает, как ситуация развивалась из прошлого в настоящее и куда она ведёт.",
+    "love": "Расклад раскрывает чувства обеих сторон, препятствия и перспективы ваших отношений.",
+    "weekly": "Карты дают прогноз на каждый день предстоящей недели.",
+    "celtic": "Кельтский крест раскрывает ситуацию целиком - от её корней до вероятного итога.",
+}
+QUESTION_INTRO = "Вы спросили: «{question}». "
+CARD_LINE = "{position}{name}{orientation}: {meaning}. Ключевые темы - {keywords}."
+POSITION_PREFIX = "{position} - "
+REVERSED_SUFFIX = " (перевёрнутая)"
+
+TONE_UPRIGHT = "Карты в основном стоят прямо: энергия расклада открыта и поддерживает ваши намерения."
+TONE_MIXED = "Прямые и перевёрнутые карты уравновешивают друг друга: успех зависит от того, какие тенденции вы решите усилить."
+TONE_REVERSED = "Большинство карт перевёрнуто: сейчас важно разобраться с внутренними блоками, прежде чем двигаться дальше."
+
+ADVICE_UPRIGHT = "Опирайтесь на то, что даёт карта «{name}»: {keywords}. Действуйте уверенно и не откладывайте важные шаги."
+ADVICE_REVERSED = "Карта «{name}» в перевёрнутом положении просит внимания к теме «{keyword}». Не спешите, сначала устраните то, что мешает, и только потом действуйте."
+ADVICE_CLOSING = "Используйте расклад как повод для честного взгляда на себя - окончательный выбор всегда остаётся за вами."
+
+
+class LocalInterpretationEngine:
+    """Детерминированная интерпретация расклада без обращения к AI.
+
+    Строится из ключевых слов и значений карт и названий позиций
+    TarotService; используется в режиме mode=local и как резерв при
+    деградации AI.
+    """
+
+    def __init__(self, tarot_service: TarotService = None):
+        self.tarot_service = tarot_service or TarotService()
+
+    def _card_line(self, card: TarotCard, position: str) -> str:
+        meaning = card.reversed_meaning if card.reversed else card.upright_meaning
+        return CARD_LINE.format(
+            position=POSITION_PREFIX.format(position=position) if position else "",
+            name=card.name,
+            orientation=REVERSED_SUFFIX if card.reversed else "",
+            meaning=meaning,
+            keywords=", ".join(card.keywords),
+        )
+
+    def _tone(self, cards: List[TarotCard]) -> str:
+        reversed_count = sum(1 for card in cards if card.reversed)
+        if reversed_count * 3 <= len(cards):
+            return TONE_UPRIGHT
+        if reversed_count * 3 >= len(cards) * 2:
+            return TONE_REVERSED
+        return TONE_MIXED
+
+    def _advice(self, cards: List[TarotCard]) -> str:
+        # Итог расклада определяет последняя карта (результат, исход, воскресенье)
+        key_card = cards[-1]
+        if key_card.reversed:
+            first = ADVICE_REVERSED.format(name=key_card.name, keyword=key_card.keywords[0] if key_card.keywords else key_card.name)
+        else:
+            first = ADVICE_UPRIGHT.format(name=key_card.name, keywords=", ".join(key_card.keywords))
+        return f"{first} {ADVICE_CLOSING}"
+
+    def describe_cards(self, cards: List[TarotCard], positions: List[str]) -> str:
+        """Шаблонное описание отдельных карт (без вступления и совета)"""
+        return "\n\n".join(
+            self._card_line(card, card.position or (positions[i] if i < len(positions) else ""))
+            for i, card in enumerate(cards)
+        )
+
+    def interpret(self, cards: List[TarotCard], spread_type: str, question: str = None) -> Dict[str, str]:
+        """Составляет интерпретацию и совет по шаблонам"""
+        if not cards:
+            return {"interpretation": "", "advice": ADVICE_CLOSING}
+
+        positions = self.tarot_service.get_position_names(spread_type, len(cards))
+        intro = SPREAD_INTROS.get(spread_type, SPREAD_INTROS["three"]).format(name=cards[0].name)
+        if question:
+            intro = QUESTION_INTRO.format(question=question.strip()) + intro
+
+        lines = [intro]
+        for i, card in enumerate(cards):
+            position = card.position or (positions[i] if i < len(positions) else "")
+            lines.append(self._card_line(card, position))
+        lines.append(self._tone(cards))
+
+        return {
+            "interpretation": "\n\n".join(lines),
+            "advice": self._advice(cards)
+        }
+
+
+local_interpreter = LocalInterpretationEngine()
@@ -0,0 +1,236 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+# Границы корзин гистограмм (секунды)
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счётчик; значения по наборам меток в словаре.
+
+    Обновления приходят не только из цикла asyncio, но и из потоков
+    (слушатель команд MongoDB, синхронные генераторы в пуле starlette),
+    поэтому изменения и снимок для выгрузки идут под блокировкой.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (накопительные счётчики считаются при выгрузке).
+
+    Как и Counter, обновляется и из потоков, поэтому защищена блокировкой.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам + корзина +Inf, сумма]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Значение, которое снимается при выгрузке (размер очереди, доля попаданий в кэш).
+
+    kind="counter" - для счётчиков, которые уже ведёт сам сервис.
+    """
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {_number(self.collect())}"]
+        except Exception as e:
+            print(f"Ошибка снятия метрики {self.name}: {e}")
+            return []
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, collect: Callable[[], float], kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, documentation, collect, kind))
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus (0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "tarot_http_requests_total", "HTTP запросы по маршруту, методу и статусу", ("route", "method", "status"))
+HTTP_LATENCY = registry.histogram(
+    "tarot_http_request_duration_seconds", "Время обработки HTTP запроса", ("route", "method"))
+LLM_LATENCY = registry.histogram(
+    "tarot_llm_call_duration_seconds", "Время вызова LLM", ("spread", "outcome"), LLM_BUCKETS)
+LLM_PROMPT_TOKENS = registry.counter(
+    "tarot_llm_prompt_tokens_total", "Оценка входных токенов LLM", ("spread", "version"))
+LLM_COMPLETION_TOKENS = registry.counter(
+    "tarot_llm_completion_tokens_total", "Оценка токенов ответа LLM", ("spread",))
+LLM_MISSING_ADVICE = registry.counter(
+    "tarot_llm_missing_advice_total", "Ответы LLM без раздела СОВЕТ (truncated - упёрлись в бюджет ответа)",
+    ("spread", "reason"))
+LLM_STREAM_UNSUPPORTED = registry.counter(
+    "tarot_llm_stream_unsupported_total", "Потоковые запросы, ответ на которые пришёл одним фрагментом (нет stream_message)")
+LLM_FALLBACKS = registry.counter(
+    "tarot_llm_fallbacks_total", "Ответы локальной интерпретацией вместо AI", ("spread",))
+READINGS_GENERATED = registry.counter(
+    "tarot_readings_generated_total", "Предсказания по источнику ответа", ("source",))
+MONGO_LATENCY = registry.histogram(
+    "tarot_mongo_command_duration_seconds", "Время команд MongoDB", ("collection", "command", "outcome"))
+DECK_DRAW_LATENCY = registry.histogram(
+    "tarot_deck_draw_duration_seconds", "Время вытягивания карт из колоды", ("kind",), FAST_BUCKETS)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: время и статусы запросов по шаблону маршрута (а не по конкретному URL)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_LATENCY.observe(time.perf_counter() - started, path, scope["method"])
+            HTTP_REQUESTS.inc(path, scope["method"], status)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Время команд MongoDB по коллекции (подключается в database._client_options)"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, int], Tuple[str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        # Имя коллекции - значение ключа команды (find, insert, ...); у getMore - отдельное поле
+        collection = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def _finish(self, event, outcome: str) -> None:
+        collection, command = self._pending.pop((event.connection_id, event.request_id), ("", event.command_name))
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, collection, command, outcome)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, "error")
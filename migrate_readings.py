@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Миграция коллекции readings в компактный формат (схема 2):
+карты хранятся ссылками (card_id, reversed, position) на колоду.
+
+Запуск из каталога backend:
+    python migrate_readings.py --batch-size 500 --pause 0.1
+"""
+
+import asyncio
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+load_dotenv(Path(__file__).parent / '.env')
+
+from services import database
+from services.reading_store import READING_SCHEMA_VERSION, compact_cards
+
+app = typer.Typer(help="Перевод сохранённых гаданий на ссылки на карты колоды")
+
+
+@app.command()
+def main(
+    batch_size: int = typer.Option(500, help="Документов в одной пачке"),
+    pause: float = typer.Option(0.1, help="Пауза между пачками, секунд (чтобы не мешать основной нагрузке)"),
+    dry_run: bool = typer.Option(False, help="Только посчитать документы для миграции"),
+):
+    async def run():
+        db = database.connect()
+        query = {"schema_version": {"$ne": READING_SCHEMA_VERSION}}
+        try:
+            if dry_run:
+                typer.echo(f"К миграции: {await db.readings.count_documents(query)}")
+                return
+
+            migrated = 0
+            last_id = None
+            while True:
+                # Идём по _id, чтобы каждая пачка была дешёвой выборкой по индексу
+                batch_query = dict(query, **({"_id": {"$gt": last_id}} if last_id is not None else {}))
+                documents = await db.readings.find(batch_query, {"cards": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+                if not documents:
+                    break
+
+                await db.readings.bulk_write([
+                    UpdateOne(
+                        {"_id": document["_id"], "schema_version": {"$ne": READING_SCHEMA_VERSION}},
+                        {"$set": {"cards": compact_cards(document.get("cards") or []), "schema_version": READING_SCHEMA_VERSION}}
+                    )
+                    for document in documents
+                ], ordered=False)
+
+                migrated += len(documents)
+                last_id = documents[-1]["_id"]
+                typer.echo(f"Перенесено: {migrated}")
+                await asyncio.sleep(pause)
+        finally:
+            database.close()
+        typer.echo(f"Готово, перенесено документов: {migrated}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    app()
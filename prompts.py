@@ -0,0 +1,265 @@
+import hashlib
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from models.tarot import TarotCard
+from services.deck import DeckCatalogue, get_deck
+from services.metrics import LLM_PROMPT_TOKENS
+from services.tarot_service import spread_label
+
+load_dotenv()
+
+# Грубая оценка: для русского текста ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+BASE_PROMPT = """Ты - опытный мастер Таро с глубокими знаниями символики карт и многолетним опытом интерпретации.
+Твоя задача - дать вдумчивое, точное и практичное предсказание на основе выпавших карт.
+
+Учитывай:
+- Традиционные значения каждой карты
+- Влияние перевёрнутых карт
+- Взаимодействие карт между собой
+- Контекст заданного вопроса
+- Позицию каждой карты в раскладе
+
+Отвечай на русском языке, создавая связное, вдохновляющее предсказание."""
+
+SPREAD_INSTRUCTIONS = {
+    "single": "Дай интерпретацию одной карты как ответа на вопрос.",
+    "daily": "Интерпретируй карту дня, фокусируясь на энергиях и событиях предстоящего дня.",
+    "three": "Проанализируй расклад 'Три карты' (Прошлое-Настоящее-Будущее), показав развитие ситуации во времени.",
+    "love": "Дай интерпретацию любовного расклада, анализируя чувства, препятствия и перспективы отношений.",
+    "weekly": "Проанализируй недельный расклад, дав краткий прогноз для каждого дня недели.",
+    "celtic": "Дай полную интерпретацию Кельтского креста - самого глубокого и информативного расклада Таро.",
+}
+
+READING_REQUEST = """{cards_info}\
+Пожалуйста, дай детальную интерпретацию этого расклада. Структурируй ответ следующим образом:
+
+ИНТЕРПРЕТАЦИЯ:
+[Подробный анализ карт и их взаимодействия, учитывающий позиции и вопрос]
+
+СОВЕТ:
+[Практические рекомендации и советы на основе полученной информации]
+
+Говори доброжелательно, но честно. Избегай слишком общих фраз, фокусируйся на конкретной ситуации."""
+
+PART_REQUEST = """{cards_info}\
+Это часть большого расклада. Дай интерпретацию только этих карт с учётом их позиций и вопроса - 3-4 предложения на карту.
+Не делай общего вывода и не давай советов: их составят отдельно. Отвечай простым текстом без заголовков."""
+
+SYNTHESIS_REQUEST = """Толкования позиций расклада:
+
+{sections}
+
+Составь по ним общий вывод и совет. Структурируй ответ следующим образом:
+
+ИНТЕРПРЕТАЦИЯ:
+[Короткий общий вывод: как карты связаны между собой и куда ведёт расклад, один-два абзаца]
+
+СОВЕТ:
+[Практические рекомендации на основе всего расклада]"""
+
+# Бюджеты токенов (промпт, ответ) по типу расклада. Бюджет ответа - с запасом
+# примерно вдвое над типичной длиной толкования на русском, чтобы раздел СОВЕТ
+# не обрезался; ответы без СОВЕТ считаются в tarot_llm_missing_advice_total
+DEFAULT_BUDGETS = {
+    "single": (700, 1000),
+    "daily": (700, 1000),
+    "three": (1000, 1600),
+    "love": (1300, 2000),
+    "weekly": (1700, 2600),
+    "celtic": (2100, 3200),
+}
+
+# Уровни детализации блока карт: сначала полный, затем без ключевых слов, затем только названия
+DETAIL_FULL = 2
+DETAIL_MEANING = 1
+DETAIL_NAME = 0
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _parse_budgets(raw: str) -> Dict[str, Tuple[int, int]]:
+    """LLM_TOKEN_BUDGETS="celtic=2500:1800,weekly=2000:1500" поверх значений по умолчанию"""
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        spread_type, _, value = item.partition("=")
+        prompt_tokens, _, response_tokens = value.partition(":")
+        budgets[spread_type.strip()] = (int(prompt_tokens), int(response_tokens))
+    return budgets
+
+
+def _card_tail(reversed_: bool, keywords: Sequence[str], meaning: str, detail: int) -> str:
+    tail = " (перевёрнутая)" if reversed_ else ""
+    if detail >= DETAIL_FULL:
+        tail += f"\n   Ключевые слова: {', '.join(keywords)}"
+    if detail >= DETAIL_MEANING:
+        tail += f"\n   Значение: {meaning}"
+    return tail + "\n\n"
+
+
+class PromptTemplates:
+    """Версия промптов: системные промпты и фрагменты карт собраны один раз.
+
+    На запрос остаётся только подстановка номера и позиции карты и
+    склейка готовых строк.
+    """
+
+    def __init__(self, version: str, deck: DeckCatalogue, base_prompt: str = BASE_PROMPT,
+                 spread_instructions: Dict[str, str] = None, reading_request: str = READING_REQUEST,
+                 part_request: str = PART_REQUEST, synthesis_request: str = SYNTHESIS_REQUEST,
+                 max_detail: int = DETAIL_FULL):
+        self.version = version
+        self.deck = deck
+        self.base_prompt = base_prompt
+        self.spread_instructions = spread_instructions or SPREAD_INSTRUCTIONS
+        self.reading_request = reading_request
+        self.part_request = part_request
+        self.synthesis_request = synthesis_request
+        self.max_detail = max_detail
+        self._system = {
+            spread_type: f"{base_prompt}\n\n{instruction}"
+            for spread_type, instruction in self.spread_instructions.items()
+        }
+        # (id, перевёрнута, детализация) -> хвост строки карты после названия и позиции
+        self._card_tails = {
+            (record.id, reversed_, detail): _card_tail(
+                reversed_, record.keywords,
+                record.reversed_meaning if reversed_ else record.upright_meaning,
+                detail
+            )
+            for record in deck.records
+            for reversed_ in (False, True)
+            for detail in (DETAIL_NAME, DETAIL_MEANING, DETAIL_FULL)
+        }
+
+    def system_prompt(self, spread_type: str, question: Optional[str] = None) -> str:
+        if question:
+            instruction = self.spread_instructions.get(spread_type, self.spread_instructions["single"])
+            return f"{self.base_prompt}\n\nВопрос: {question}\n\n{instruction}"
+        return self._system.get(spread_type, self._system["single"])
+
+    def _card_line(self, number: int, card: TarotCard, detail: int) -> str:
+        position_info = f" ({card.position})" if card.position else ""
+        record = self.deck.get(card.id)
+        if record is not None and record.name == card.name:
+            tail = self._card_tails[(card.id, bool(card.reversed), detail)]
+        else:
+            # Карта не из серверной колоды - собираем строку на месте
+            meaning = card.reversed_meaning if card.reversed else card.upright_meaning
+            tail = _card_tail(bool(card.reversed), card.keywords, meaning, detail)
+        return f"{number}. {card.name}{position_info}{tail}"
+
+    def card_block(self, cards: List[TarotCard], start: int = 1, token_budget: Optional[int] = None) -> str:
+        """Блок карт для промпта; при нехватке бюджета детализация снижается"""
+        block = ""
+        for detail in range(self.max_detail, DETAIL_NAME - 1, -1):
+            block = "Выпавшие карты:\n\n" + "".join(
+                self._card_line(number, card, detail) for number, card in enumerate(cards, start)
+            )
+            if token_budget is None or estimate_tokens(block) <= token_budget:
+                break
+        return block
+
+    def _fitted_block(self, cards: List[TarotCard], start: int, frame: str, system_prompt: str,
+                      prompt_budget: Optional[int]) -> str:
+        budget = None
+        if prompt_budget is not None:
+            budget = prompt_budget - estimate_tokens(system_prompt) - estimate_tokens(frame)
+        return self.card_block(cards, start, budget)
+
+    def reading_message(self, cards: List[TarotCard], system_prompt: str, prompt_budget: Optional[int] = None) -> str:
+        cards_info = self._fitted_block(cards, 1, self.reading_request, system_prompt, prompt_budget)
+        return self.reading_request.format(cards_info=cards_info)
+
+    def part_message(self, cards: List[TarotCard], start: int, system_prompt: str, prompt_budget: Optional[int] = None) -> str:
+        cards_info = self._fitted_block(cards, start, self.part_request, system_prompt, prompt_budget)
+        return self.part_request.format(cards_info=cards_info)
+
+    def synthesis_message(self, sections: List[str]) -> str:
+        return self.synthesis_request.format(sections="\n\n".join(sections))
+
+
+class PromptLibrary:
+    """Реестр версий промптов, их доли для A/B и бюджеты токенов.
+
+    Версия выбирается детерминированно по ключу запроса, поэтому один и
+    тот же расклад всегда получает одну версию (и одну запись в кэше).
+    """
+
+    def __init__(self, variants: Dict[str, PromptTemplates], weights: Dict[str, float],
+                 budgets: Dict[str, Tuple[int, int]]):
+        self.variants = variants
+        self.weights = {version: weight for version, weight in weights.items() if version in variants and weight > 0}
+        if not self.weights:
+            raise ValueError("Не задано ни одной версии промптов")
+        self.budgets = budgets
+        self._usage: Dict[str, int] = defaultdict(int)
+        self._prompt_tokens: Dict[str, int] = defaultdict(int)
+
+    def select(self, key: str) -> PromptTemplates:
+        total = sum(self.weights.values())
+        point = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF * total
+        for version, weight in self.weights.items():
+            point -= weight
+            if point <= 0:
+                return self.variants[version]
+        return self.variants[version]
+
+    def prompt_budget(self, spread_type: str) -> int:
+        return self.budgets.get(spread_type, self.budgets["single"])[0]
+
+    def response_budget(self, spread_type: str) -> int:
+        return self.budgets.get(spread_type, self.budgets["single"])[1]
+
+    def record(self, version: str, spread_type: str, system_prompt: str, message: str) -> int:
+        """Учитывает оценку входных токенов запроса и возвращает её"""
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(message)
+        spread = spread_label(spread_type)
+        label = f"{version}:{spread}"
+        self._usage[label] += 1
+        self._prompt_tokens[label] += tokens
+        LLM_PROMPT_TOKENS.inc(spread, version, amount=tokens)
+        return tokens
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "weights": self.weights,
+            "requests": dict(self._usage),
+            "avg_prompt_tokens": {
+                label: round(self._prompt_tokens[label] / count)
+                for label, count in self._usage.items()
+            },
+        }
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    """LLM_PROMPT_VARIANTS="v2=0.9,v2-compact=0.1" - доли версий для A/B"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        version, _, weight = item.partition("=")
+        weights[version.strip()] = float(weight or 1)
+    return weights
+
+
+def _build_library() -> PromptLibrary:
+    deck = get_deck()
+    variants = {
+        "v2": PromptTemplates("v2", deck),
+        # Без ключевых слов карт: короче промпт, модель опирается на значения
+        "v2-compact": PromptTemplates("v2-compact", deck, max_detail=DETAIL_MEANING),
+    }
+    return PromptLibrary(
+        variants,
+        weights=_parse_weights(os.environ.get("LLM_PROMPT_VARIANTS", "v2=1")),
+        budgets=_parse_budgets(os.environ.get("LLM_TOKEN_BUDGETS", "")),
+    )
+
+
+prompt_library = _build_library()
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+from pydantic import ValidationError
+
+from models.tarot import Reading, TarotCard
+from services.deck import get_deck
+
+# Версия 2: карты хранятся ссылками (card_id, reversed, position) на колоду,
+# а не полными копиями названий, изображений и значений
+READING_SCHEMA_VERSION = 2
+
+
+class UnusableReading(ValueError):
+    """Карты сохранённого гадания нельзя восстановить (нет в колоде и сохранены не полностью)"""
+
+
+def compact_card(card: Dict) -> Dict:
+    """Ссылка на карту колоды; карты, которых нет в колоде, сохраняются целиком"""
+    record = get_deck().get(card.get("id"))
+    if record is None or record.name != card.get("name"):
+        return dict(card)
+    return {
+        "card_id": record.id,
+        "reversed": bool(card.get("reversed", False)),
+        "position": card.get("position"),
+    }
+
+
+def rehydrate_card(card: Dict) -> Dict:
+    """Полная карта из ссылки (документы версии 1 возвращаются как есть)"""
+    if "card_id" not in card:
+        return card
+    record = get_deck().get(card["card_id"])
+    if record is None:
+        return {"id": card["card_id"], "reversed": card.get("reversed", False), "position": card.get("position")}
+    return {**record.to_dict(), "reversed": card.get("reversed", False), "position": card.get("position")}
+
+
+def compact_cards(cards: List[Dict]) -> List[Dict]:
+    return [compact_card(card) for card in cards]
+
+
+def rehydrate_reading(document: Dict) -> Dict:
+    document["cards"] = [rehydrate_card(card) for card in document.get("cards") or []]
+    document.pop("schema_version", None)
+    return document
+
+
+def reading_cards(reading: Dict) -> List[TarotCard]:
+    """Карты сохранённого гадания для промпта: карты колоды берутся из колоды, прочие - как сохранены"""
+    deck = get_deck()
+    cards = []
+    for card in reading.get("cards") or []:
+        card_id = card.get("card_id", card.get("id"))
+        index = deck.index_by_id.get(card_id)
+        if index is not None:
+            cards.append(deck.tarot_card(index, bool(card.get("reversed", False)), card.get("position")))
+            continue
+        try:
+            cards.append(TarotCard(**card))
+        except ValidationError:
+            raise UnusableReading(f"Карта {card_id} гадания не найдена в колоде")
+    if not cards:
+        raise UnusableReading("В гадании нет карт")
+    return cards
+
+
+def build_reading_document(reading: Reading) -> Dict:
+    """Документ для коллекции readings в компактном формате"""
+    document = reading.dict()
+    document["cards"] = compact_cards(document["cards"])
+    document["schema_version"] = READING_SCHEMA_VERSION
+    return document
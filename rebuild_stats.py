@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Пересчёт статистики гаданий (коллекция reading_stats) с нуля.
+
+Счётчики считаются пачками во временную коллекцию, которая затем атомарно
+заменяет reading_stats. Учитываются горячие гадания, архив readings_archive
+и NDJSON архивы в каталоге --archive-dir (READINGS_ARCHIVE_TARGET=file).
+Сохранения во время пересчёта могут не попасть в итог, поэтому запускать
+лучше в часы низкой нагрузки.
+
+Запуск из каталога backend:
+    python rebuild_stats.py --batch-size 1000 --pause 0.05
+"""
+
+import asyncio
+import gzip
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import typer
+from bson import json_util
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / '.env')
+
+from services import database
+from services.retention_service import reading_archiver
+from services.stats_service import STATS_COLLECTION, apply_increments, ensure_stats_indexes, merge_increments
+
+app = typer.Typer(help="Пересчёт счётчиков статистики гаданий из горячей коллекции и архивов")
+
+SOURCE_COLLECTIONS = ("readings", "readings_archive")
+PROJECTION = {"session_id": 1, "spread_type": 1, "created_at": 1, "cards.card_id": 1, "cards.id": 1, "cards.reversed": 1}
+
+
+def _archive_batches(archive_dir: Path, batch_size: int) -> Iterator[List[Dict]]:
+    """Пачки гаданий из файлов readings-*.ndjson.gz (gzip из нескольких членов читается целиком)"""
+    batch = []
+    for path in sorted(archive_dir.glob("readings-*.ndjson.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                if line.strip():
+                    batch.append(json_util.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+@app.command()
+def main(
+    batch_size: int = typer.Option(1000, help="Документов в одной пачке"),
+    pause: float = typer.Option(0.05, help="Пауза между пачками, секунд (чтобы не мешать основной нагрузке)"),
+    archive_dir: Optional[str] = typer.Option(
+        None, help="Каталог NDJSON архивов (по умолчанию READINGS_ARCHIVE_DIR, если READINGS_ARCHIVE_TARGET=file)"),
+):
+    if archive_dir is None and reading_archiver.target == "file":
+        archive_dir = str(reading_archiver.archive_dir)
+
+    async def run():
+        db = database.connect()
+        target = db[f"{STATS_COLLECTION}_rebuild"]
+        counted = 0
+        try:
+            await target.drop()
+            for name in SOURCE_COLLECTIONS:
+                last_id = None
+                while True:
+                    # Идём по _id, чтобы каждая пачка была дешёвой выборкой по индексу
+                    query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                    documents = await db[name].find(query, PROJECTION).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+                    if not documents:
+                        break
+                    await apply_increments(target, merge_increments(documents))
+                    counted += len(documents)
+                    last_id = documents[-1]["_id"]
+                    typer.echo(f"{name}: учтено {counted}")
+                    await asyncio.sleep(pause)
+
+            if archive_dir and Path(archive_dir).is_dir():
+                for documents in _archive_batches(Path(archive_dir), batch_size):
+                    await apply_increments(target, merge_increments(documents))
+                    counted += len(documents)
+                    typer.echo(f"{archive_dir}: учтено {counted}")
+                    await asyncio.sleep(pause)
+
+            if counted:
+                # Индексы переезжают вместе с коллекцией при rename
+                await ensure_stats_indexes(target)
+                await target.rename(STATS_COLLECTION, dropTarget=True)
+            else:
+                await db[STATS_COLLECTION].drop()
+        finally:
+            database.close()
+        typer.echo(f"Готово, учтено гаданий: {counted}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    app()
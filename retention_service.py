@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bson import json_util
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from services.history_cache import history_cache
+
+load_dotenv()
+
+DUPLICATE_KEY = 11000
+ARCHIVE_TARGETS = ("collection", "file")
+LEASE_ID = "reading_archiver"
+
+
+def _parse_window(raw: str) -> Optional[Tuple[int, int]]:
+    """READINGS_ARCHIVE_HOURS="2-6" - часы UTC, когда разрешена архивация (пусто - всегда)"""
+    if not raw:
+        return None
+    start, _, end = raw.partition("-")
+    return int(start), int(end)
+
+
+class ReadingArchiver:
+    """Хранение гаданий: в горячей коллекции readings остаются только свежие.
+
+    Фоновая задача пачками переносит в архив гадания старше max_age_days
+    и гадания сверх hot_per_session последних в сессии. Архив - коллекция
+    readings_archive (с необязательным TTL) или сжатые NDJSON файлы. Между
+    пачками делается пауза, а вне окна window (часы UTC) задача не работает,
+    чтобы не конкурировать с пиковой нагрузкой.
+
+    Задача запускается в каждом воркере, но архивирует только владелец
+    аренды (документ в коллекции leases), поэтому пачки не обрабатываются
+    дважды.
+    """
+
+    def __init__(self, enabled: bool = False, hot_per_session: int = 200, max_age_days: int = 365,
+                 archive_ttl_days: int = 0, target: str = "collection", archive_dir: str = "archive",
+                 batch_size: int = 500, pause: float = 0.5, interval: float = 3600,
+                 window: Optional[Tuple[int, int]] = None, lease_seconds: float = 300):
+        if target not in ARCHIVE_TARGETS:
+            raise ValueError(f"Неизвестное хранилище архива: {target}")
+        self.enabled = enabled
+        self.hot_per_session = hot_per_session
+        self.max_age_days = max_age_days
+        self.archive_ttl_days = archive_ttl_days
+        self.target = target
+        self.archive_dir = Path(archive_dir)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.window = window
+        self.lease_seconds = lease_seconds
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.runs = 0
+
+    async def attach(self, db: AsyncIOMotorDatabase) -> None:
+        """Индексы для выборки по возрасту и TTL архива"""
+        self._db = db
+        await db.readings.create_index("created_at", name="reading_created_at")
+        # Анонимная сессия без сохранений дольше срока хранения забывается целиком:
+        # её гадания к этому времени уже в архиве
+        await db.session_versions.create_index(
+            "updated_at",
+            expireAfterSeconds=(self.max_age_days + 1) * 86400,
+            name="session_ttl"
+        )
+        if self.target == "collection" and self.archive_ttl_days > 0:
+            await db.readings_archive.create_index(
+                "created_at",
+                expireAfterSeconds=self.archive_ttl_days * 86400,
+                name="archive_ttl"
+            )
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.attach(db)
+        except Exception as e:
+            print(f"Ошибка создания индексов архивации: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def in_window(self, now: datetime = None) -> bool:
+        if self.window is None:
+            return True
+        hour = (now or datetime.utcnow()).hour
+        start, end = self.window
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    async def _run(self) -> None:
+        while True:
+            if self.in_window():
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"Ошибка архивации гаданий: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _hold_lease(self) -> bool:
+        """Берёт или продлевает аренду; False - архивирует другой процесс"""
+        now = datetime.utcnow()
+        try:
+            await self._db.leases.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"expires_at": {"$lt": now}}, {"owner": self._owner}]},
+                {"$set": {"owner": self._owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Документ аренды есть и принадлежит другому процессу
+            return False
+        return True
+
+    async def _release_lease(self) -> None:
+        await self._db.leases.update_one(
+            {"_id": LEASE_ID, "owner": self._owner},
+            {"$set": {"expires_at": datetime.utcnow()}}
+        )
+
+    async def _may_continue(self) -> bool:
+        # Аренда продлевается перед каждой пачкой; потеряли - останавливаемся
+        return self.in_window() and await self._hold_lease()
+
+    async def run_once(self) -> int:
+        """Один проход архивации: по возрасту, затем по лимиту на сессию"""
+        if not await self._hold_lease():
+            return 0
+        self.runs += 1
+        try:
+            moved = await self._archive_expired()
+            moved += await self._archive_over_limit()
+        finally:
+            await self._release_lease()
+        return moved
+
+    async def _archive_expired(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=self.max_age_days)
+        moved = 0
+        while await self._may_continue():
+            documents = await self._db.readings.find({"created_at": {"$lt": cutoff}}) \
+                .sort("created_at", 1).limit(self.batch_size).to_list(length=self.batch_size)
+            if not documents:
+                break
+            moved += await self._archive(documents)
+            await asyncio.sleep(self.pause)
+        return moved
+
+    async def _archive_over_limit(self) -> int:
+        moved = 0
+        sessions = self._db.session_versions.aggregate([
+            {"$match": {"readings": {"$gt": self.hot_per_session}}},
+            {"$project": {"_id": 1}},
+        ])
+        async for session in sessions:
+            while await self._may_continue():
+                # Всё, что после hot_per_session последних гаданий сессии (индекс session_history)
+                documents = await self._db.readings.find({"session_id": session["_id"]}) \
+                    .sort([("created_at", -1), ("id", -1)]).skip(self.hot_per_session) \
+                    .limit(self.batch_size).to_list(length=self.batch_size)
+                if not documents:
+                    break
+                moved += await self._archive(documents)
+                await asyncio.sleep(self.pause)
+        return moved
+
+    async def _archive(self, documents: List[Dict]) -> int:
+        """Пишет пачку в архив и только после этого удаляет её из горячей коллекции"""
+        if self.target == "collection":
+            try:
+                await self._db.readings_archive.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Пачка могла быть частично перенесена прошлым прерванным проходом
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+                if errors:
+                    raise
+        else:
+            await asyncio.to_thread(self._write_file, documents)
+
+        # Удаляем по сессиям, чтобы уменьшить счётчик каждой ровно на удалённое
+        by_session: Dict[str, List] = defaultdict(list)
+        for document in documents:
+            by_session[document["session_id"]].append(document["_id"])
+        removed = {}
+        for session, ids in by_session.items():
+            result = await self._db.readings.delete_many({"_id": {"$in": ids}})
+            if result.deleted_count:
+                removed[session] = -result.deleted_count
+        await history_cache.bump_many(removed)
+        deleted = -sum(removed.values())
+        self.archived += deleted
+        return deleted
+
+    def _write_file(self, documents: List[Dict]) -> None:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        path = self.archive_dir / f"readings-{datetime.utcnow():%Y%m%d}.ndjson.gz"
+        # Каждая пачка - отдельный gzip-член; файл остаётся корректным gzip при дописывании
+        with path.open("ab") as archive:
+            with gzip.GzipFile(fileobj=archive, mode="wb") as compressed:
+                for document in documents:
+                    compressed.write((json_util.dumps(document, ensure_ascii=False) + "\n").encode("utf-8"))
+            archive.flush()
+            os.fsync(archive.fileno())
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "target": self.target,
+            "runs": self.runs,
+            "archived": self.archived,
+        }
+
+
+async def recount_sessions(db: AsyncIOMotorDatabase) -> int:
+    """Пересчитывает число гаданий в session_versions по горячей коллекции"""
+    updated = 0
+    async for group in db.readings.aggregate([{"$group": {"_id": "$session_id", "readings": {"$sum": 1}}}]):
+        await db.session_versions.update_one(
+            {"_id": group["_id"]},
+            {"$set": {"readings": group["readings"]}, "$inc": {"version": 1}},
+            upsert=True
+        )
+        updated += 1
+    return updated
+
+
+reading_archiver = ReadingArchiver(
+    enabled=os.environ.get("READINGS_ARCHIVE_ENABLED", "false").lower() == "true",
+    hot_per_session=int(os.environ.get("READINGS_HOT_PER_SESSION", "200")),
+    max_age_days=int(os.environ.get("READINGS_MAX_AGE_DAYS", "365")),
+    archive_ttl_days=int(os.environ.get("READINGS_ARCHIVE_TTL_DAYS", "0")),
+    target=os.environ.get("READINGS_ARCHIVE_TARGET", "collection"),
+    archive_dir=os.environ.get("READINGS_ARCHIVE_DIR", "archive"),
+    batch_size=int(os.environ.get("READINGS_ARCHIVE_BATCH_SIZE", "500")),
+    pause=float(os.environ.get("READINGS_ARCHIVE_PAUSE_SECONDS", "0.5")),
+    interval=float(os.environ.get("READINGS_ARCHIVE_INTERVAL_SECONDS", "3600")),
+    window=_parse_window(os.environ.get("READINGS_ARCHIVE_HOURS", "")),
+    lease_seconds=float(os.environ.get("READINGS_ARCHIVE_LEASE_SECONDS", "300")),
+)
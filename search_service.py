@@ -0,0 +1,129 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+MAX_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGES = 10
+SNIPPET_CHARS = 160
+SEARCH_LANGUAGE = "russian"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _prefix_stem(word: str) -> str:
+    """Грубая основа без стеммера: слово без окончания (не короче 3 букв)"""
+    return word[:max(3, len(word) - 2)] if len(word) > 3 else word
+
+
+def _make_stem() -> Callable[[str], str]:
+    # Тот же Snowball, что у текстового индекса MongoDB, - подсветка совпадает с найденным
+    if snowballstemmer is not None:
+        return snowballstemmer.stemmer(SEARCH_LANGUAGE).stemWord
+    return _prefix_stem
+
+
+_stem = _make_stem()
+
+
+def _normalize(word: str) -> str:
+    return word.lower().replace("ё", "е")
+
+
+def query_stems(query: str) -> List[str]:
+    """Основы слов запроса (без исключённых через -слово)"""
+    stems = []
+    for token in query.split():
+        if token.startswith("-"):
+            continue
+        stems.extend(_stem(_normalize(word)) for word in WORD_RE.findall(token))
+    return [stem for stem in stems if stem]
+
+
+def _matches(text: str, stems: List[str]) -> List[Tuple[int, int]]:
+    spans = []
+    for match in WORD_RE.finditer(text):
+        word = _normalize(match.group())
+        stem = _stem(word)
+        if any(stem == query or (snowballstemmer is None and word.startswith(query)) for query in stems):
+            spans.append(match.span())
+    return spans
+
+
+def make_snippet(text: str, stems: List[str], size: int = SNIPPET_CHARS) -> Dict:
+    """Фрагмент текста вокруг первого совпадения и позиции совпадений в нём.
+
+    Подсветка отдаётся смещениями [начало, конец), а не HTML, чтобы клиент
+    не вставлял текст интерпретации как разметку.
+    """
+    text = text or ""
+    spans = _matches(text, stems)
+    if len(text) <= size:
+        return {"text": text, "highlights": [list(span) for span in spans]}
+
+    start = max(0, spans[0][0] - size // 3) if spans else 0
+    end = min(len(text), start + size)
+    start = max(0, end - size)
+    # Не режем слова по краям фрагмента
+    if start > 0:
+        space = text.find(" ", start, spans[0][0] if spans else end)
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > (spans[0][1] if spans else start) else end
+
+    snippet = text[start:end]
+    highlights = [[s - start, e - start] for s, e in spans if s >= start and e <= end]
+    prefix = "…" if start > 0 else ""
+    if prefix:
+        highlights = [[s + 1, e + 1] for s, e in highlights]
+    return {"text": prefix + snippet + ("…" if end < len(text) else ""), "highlights": highlights}
+
+
+async def ensure_search_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Текстовый индекс с префиксом session_id: поиск всегда внутри одной сессии"""
+    await db.readings.create_index(
+        [("session_id", 1), ("question", "text"), ("interpretation", "text")],
+        name="session_search",
+        default_language=SEARCH_LANGUAGE,
+        # У гаданий нет поля языка; не даём случайному полю "language" сменить стеммер
+        language_override="text_language",
+        weights={"question": 3, "interpretation": 1}
+    )
+
+
+async def search_readings(db: AsyncIOMotorDatabase, session: str, query: str,
+                          limit: int = MAX_SEARCH_PAGE_SIZE, page: int = 1) -> Dict:
+    """Гадания сессии по словам вопроса и интерпретации, по убыванию релевантности.
+
+    Равенство по session_id - префикс индекса session_search, поэтому
+    MongoDB читает только записи индекса этой сессии, а не всю коллекцию.
+    """
+    limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+    page = max(1, min(page, MAX_SEARCH_PAGES))
+    score = {"$meta": "textScore"}
+    documents = await db.readings.find(
+        {"session_id": session, "$text": {"$search": query, "$language": SEARCH_LANGUAGE}},
+        {"_id": 0, "id": 1, "spread_type": 1, "question": 1, "interpretation": 1, "created_at": 1, "score": score}
+    ).sort([("score", score), ("created_at", -1)]).skip((page - 1) * limit).limit(limit + 1).to_list(length=limit + 1)
+
+    stems = query_stems(query)
+    results = []
+    for document in documents[:limit]:
+        question = document.get("question") or ""
+        results.append({
+            "id": document["id"],
+            "spread_type": document.get("spread_type"),
+            "created_at": document.get("created_at"),
+            "score": document.get("score"),
+            "question": {"text": question, "highlights": [list(span) for span in _matches(question, stems)]},
+            "snippet": make_snippet(document.get("interpretation"), stems),
+        })
+
+    next_page: Optional[int] = page + 1 if len(documents) > limit and page < MAX_SEARCH_PAGES else None
+    return {"results": results, "next_page": next_page}
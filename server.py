@@ -1,24 +1,35 @@
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import logging
+import os
 from pathlib import Path
 
 # Импортируем роутеры
-from routes.tarot import router as tarot_router, cards_router
+from routes.tarot import router as tarot_router, cards_router, stats_router
+from services import database
+from services.cache_service import reading_cache
+from services.corpus_service import reading_corpus
+from services.followup_service import ensure_followup_indexes
+from services.history_cache import history_cache
+from services.history_service import ensure_history_indexes
+from services.search_service import ensure_search_indexes
+from services.stats_service import STATS_COLLECTION, ensure_stats_indexes
+from services.jobs_service import reading_jobs
+from services.write_behind import reading_writer
+from services.retention_service import reading_archiver
+from services.admission import llm_admission
+from services.singleflight import reading_flight
+from services.llm_policy import llm_policy
+from services.metrics import MetricsMiddleware, registry as metrics_registry
+from services.compression import CompressionMiddleware
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Create the main app without a prefix
-app = FastAPI(title="3D Tarot API", version="1.0.0")
+app = FastAPI(title="3D Tarot API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix for basic endpoints
 api_router = APIRouter(prefix="/api")
@@ -32,10 +43,31 @@ async def root():
 async def health_check():
     return {"status": "ok", "message": "API работает"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# Значения, которые снимаются в момент выгрузки метрик
+metrics_registry.gauge("tarot_llm_active", "Активные вызовы LLM", lambda: llm_admission.stats()["active"])
+metrics_registry.gauge("tarot_llm_queue_depth", "Запросы в очереди к LLM", lambda: llm_admission.stats()["waiting"])
+metrics_registry.gauge("tarot_llm_degraded", "AI в деградированном режиме (1/0)", lambda: int(llm_policy.health.degraded))
+metrics_registry.gauge("tarot_singleflight_in_flight", "Общие вызовы LLM в процессе", lambda: reading_flight.in_flight())
+metrics_registry.gauge("tarot_reading_cache_hit_ratio", "Доля попаданий в кэш интерпретаций", lambda: reading_cache.stats()["hit_ratio"])
+metrics_registry.gauge("tarot_reading_cache_entries", "Записей в локальном кэше интерпретаций", lambda: reading_cache.stats()["entries"])
+metrics_registry.gauge("tarot_reading_cache_misses_total", "Промахи кэша интерпретаций", lambda: reading_cache.misses, kind="counter")
+metrics_registry.gauge("tarot_history_cache_hit_ratio", "Доля просмотров истории без запроса к MongoDB", lambda: history_cache.stats()["hit_ratio"])
+metrics_registry.gauge("tarot_corpus_hits_total", "Ответы из предгенерированного корпуса", lambda: reading_corpus.hits, kind="counter")
+metrics_registry.gauge("tarot_corpus_misses_total", "Промахи предгенерированного корпуса", lambda: reading_corpus.misses, kind="counter")
+metrics_registry.gauge("tarot_jobs_queued", "Задания в очереди", lambda: reading_jobs.stats()["queued"])
+metrics_registry.gauge("tarot_jobs_running", "Выполняющиеся задания", lambda: reading_jobs.stats()["running"])
+metrics_registry.gauge("tarot_write_buffer_size", "Гадания в буфере отложенной записи", lambda: len(reading_writer))
+
 # Include routers
 app.include_router(api_router)
 app.include_router(tarot_router)
 app.include_router(cards_router)
+app.include_router(stats_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +76,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Сжатие больших JSON ответов (история, карты) для медленных мобильных сетей
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
+)
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -54,8 +92,37 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    # Один пул соединений MongoDB на процесс, общий для всех роутеров
+    db = database.connect()
+    # Каждая группа индексов создаётся отдельно: сбой одной не отменяет остальные
+    try:
+        await ensure_history_indexes(db)
+    except Exception as e:
+        logger.error(f"Ошибка создания индексов истории: {e}")
+    try:
+        await ensure_followup_indexes(db)
+    except Exception as e:
+        logger.error(f"Ошибка создания индексов уточняющих вопросов: {e}")
+    try:
+        await ensure_search_indexes(db)
+    except Exception as e:
+        logger.error(f"Ошибка создания индексов поиска: {e}")
+    try:
+        await ensure_stats_indexes(db[STATS_COLLECTION])
+    except Exception as e:
+        logger.error(f"Ошибка создания индексов статистики: {e}")
+    await reading_cache.attach(db)
+    await history_cache.attach(db)
+    await reading_corpus.attach(db)
+    await reading_writer.start(db)
+    await reading_jobs.start(db)
+    await reading_archiver.start(db)
     logger.info("3D Tarot API запущено с AI интеграцией")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Сначала останавливаем воркеров и дописываем буфер отложенной записи, затем закрываем пул
+    await reading_archiver.stop()
+    await reading_jobs.stop()
+    await reading_writer.stop()
+    database.close()
\ No newline at end of file
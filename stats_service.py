@@ -0,0 +1,134 @@
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo import UpdateOne
+
+from services.deck import get_deck
+from services.tarot_service import spread_label
+
+GLOBAL_SCOPE = "global"
+STATS_COLLECTION = "reading_stats"
+TOP_CARDS = 10
+MAX_STATS_DAYS = 365
+
+load_dotenv()
+
+# Статистика сессии удаляется, если в сессии не было сохранений дольше этого срока
+STATS_SESSION_TTL_DAYS = int(os.environ.get("STATS_SESSION_TTL_DAYS", "365"))
+
+
+def session_scope(session: str) -> str:
+    return f"session:{session}"
+
+
+def _card_id(card: Dict):
+    # Компактные документы (схема 2) хранят card_id, старые - полную карту с id
+    return card.get("card_id", card.get("id"))
+
+
+def reading_increments(document: Dict) -> Counter:
+    """Поля $inc, которые вносит одно гадание.
+
+    Ключи карт и раскладов становятся именами полей, поэтому неизвестные
+    расклады (строка от клиента) сводятся к "other".
+    """
+    spread = spread_label(str(document.get("spread_type") or ""))
+    created_at = document.get("created_at") or datetime.utcnow()
+    increments = Counter({
+        "readings": 1,
+        f"spreads.{spread}": 1,
+        f"days.{created_at:%Y-%m-%d}": 1,
+    })
+    for card in document.get("cards") or []:
+        card_id = _card_id(card)
+        if not isinstance(card_id, int):
+            continue
+        increments["cards_total"] += 1
+        increments[f"cards.{card_id}"] += 1
+        if card.get("reversed"):
+            increments["reversed_total"] += 1
+            increments[f"reversed.{card_id}"] += 1
+    return increments
+
+
+def merge_increments(documents: Iterable[Dict]) -> Dict[str, Counter]:
+    """Суммарные $inc по областям: общая статистика и статистика каждой сессии"""
+    scopes: Dict[str, Counter] = defaultdict(Counter)
+    for document in documents:
+        increments = reading_increments(document)
+        scopes[GLOBAL_SCOPE].update(increments)
+        scopes[session_scope(document["session_id"])].update(increments)
+    return scopes
+
+
+async def ensure_stats_indexes(collection: AsyncIOMotorCollection) -> None:
+    """TTL для статистики сессий (у общего документа expires_at нет)"""
+    await collection.create_index("expires_at", expireAfterSeconds=0, name="session_stats_ttl")
+
+
+async def apply_increments(collection: AsyncIOMotorCollection, scopes: Dict[str, Counter]) -> None:
+    if not scopes:
+        return
+    expires_at = datetime.utcnow() + timedelta(days=STATS_SESSION_TTL_DAYS)
+    requests = []
+    for scope, increments in scopes.items():
+        update = {"$inc": dict(increments)}
+        if scope != GLOBAL_SCOPE:
+            # Каждое сохранение продлевает жизнь статистики сессии
+            update["$set"] = {"expires_at": expires_at}
+        requests.append(UpdateOne({"_id": scope}, update, upsert=True))
+    await collection.bulk_write(requests, ordered=False)
+
+
+async def record_readings(db: AsyncIOMotorDatabase, documents: List[Dict]) -> None:
+    """Учитывает сохранённые гадания атомарными $inc (один bulk_write на пачку)"""
+    await apply_increments(db[STATS_COLLECTION], merge_increments(documents))
+
+
+def _rate(part: int, total: int) -> float:
+    return round(part / total, 4) if total else 0.0
+
+
+def stats_view(document: Dict, days: int = 30) -> Dict:
+    """Ответ /api/stats из документа счётчиков: размер не зависит от числа гаданий"""
+    deck = get_deck()
+    cards = document.get("cards", {})
+    reversed_cards = document.get("reversed", {})
+    readings = document.get("readings", 0)
+    top = sorted(cards.items(), key=lambda item: item[1], reverse=True)[:TOP_CARDS]
+    top_cards = []
+    for card_id, count in top:
+        record = deck.get(int(card_id))
+        top_cards.append({
+            "id": int(card_id),
+            "name": record.name if record else None,
+            "count": count,
+            "reversed_rate": _rate(reversed_cards.get(card_id, 0), count),
+        })
+
+    today = datetime.utcnow().date()
+    per_day = document.get("days", {})
+    readings_per_day = []
+    for offset in range(days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        readings_per_day.append({"date": day, "readings": per_day.get(day, 0)})
+
+    return {
+        "readings": readings,
+        "cards_drawn": document.get("cards_total", 0),
+        "reversal_rate": _rate(document.get("reversed_total", 0), document.get("cards_total", 0)),
+        "top_cards": top_cards,
+        "spreads": {spread: {"count": count, "share": _rate(count, readings)}
+                    for spread, count in document.get("spreads", {}).items()},
+        "readings_per_day": readings_per_day,
+    }
+
+
+async def fetch_stats(db: AsyncIOMotorDatabase, scope: str, days: int = 30) -> Dict:
+    """Одно чтение документа по _id"""
+    document = await db[STATS_COLLECTION].find_one({"_id": scope}) or {}
+    return stats_view(document, days=max(1, min(days, MAX_STATS_DAYS)))
@@ -0,0 +1,107 @@
+from typing import Dict, List, Optional, Tuple
+
+INTERPRETATION_MARKER = "ИНТЕРПРЕТАЦИЯ:"
+ADVICE_MARKER = "СОВЕТ:"
+DEFAULT_ADVICE = "Доверьтесь своей интуиции и используйте полученную информацию для принятия осознанных решений."
+
+
+class ReadingStreamParser:
+    """Инкрементальный разбор потока ответа AI на интерпретацию и совет.
+
+    feed() принимает очередной фрагмент текста и возвращает события
+    ("interpretation" | "advice", текст). Маркеры разделов могут быть
+    разрезаны между фрагментами, поэтому хвост, похожий на начало маркера,
+    придерживается до следующего фрагмента.
+    """
+
+    def __init__(self):
+        self.section = "interpretation"
+        self._pending = ""
+        self._parts: Dict[str, List[str]] = {"interpretation": [], "advice": []}
+        self._started: Dict[str, bool] = {"interpretation": False, "advice": False}
+        self._seen_interpretation = False
+        self._seen_advice = False
+
+    def _next_marker(self) -> Optional[str]:
+        if self.section == "interpretation" and not self._seen_advice:
+            return ADVICE_MARKER
+        return None
+
+    def _emit(self, text: str, events: List[Tuple[str, str]]) -> None:
+        if not self._started[self.section]:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started[self.section] = True
+        self._parts[self.section].append(text)
+        events.append((self.section, text))
+
+    @staticmethod
+    def _held_back(text: str, markers: List[str]) -> int:
+        """Длина хвоста text, который может оказаться началом маркера"""
+        longest = 0
+        for marker in markers:
+            for size in range(min(len(marker) - 1, len(text)), 0, -1):
+                if marker.startswith(text[-size:]):
+                    longest = max(longest, size)
+                    break
+        return longest
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        events: List[Tuple[str, str]] = []
+        text = self._pending + chunk
+        self._pending = ""
+
+        while text:
+            markers = []
+            if not self._seen_interpretation and self.section == "interpretation":
+                markers.append(INTERPRETATION_MARKER)
+            advice_marker = self._next_marker()
+            if advice_marker:
+                markers.append(advice_marker)
+            if not markers:
+                self._emit(text, events)
+                break
+
+            positions = [(text.find(marker), marker) for marker in markers]
+            positions = [(index, marker) for index, marker in positions if index >= 0]
+            if positions:
+                index, marker = min(positions)
+                if index:
+                    self._emit(text[:index], events)
+                text = text[index + len(marker):]
+                if marker == INTERPRETATION_MARKER:
+                    self._seen_interpretation = True
+                else:
+                    self._seen_advice = True
+                    self.section = "advice"
+                continue
+
+            held = self._held_back(text, markers)
+            if held:
+                self._pending = text[-held:]
+                text = text[:-held]
+            if text:
+                self._emit(text, events)
+            break
+
+        return events
+
+    @property
+    def advice_found(self) -> bool:
+        """Встретился ли маркер СОВЕТ (если нет - ответ, скорее всего, обрезан)"""
+        return self._seen_advice
+
+    def finish(self) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
+        """Сбрасывает остаток буфера и возвращает итоговый структурированный результат"""
+        events: List[Tuple[str, str]] = []
+        if self._pending:
+            self._emit(self._pending, events)
+            self._pending = ""
+
+        interpretation = "".join(self._parts["interpretation"]).strip()
+        advice = "".join(self._parts["advice"]).strip()
+        if not self._seen_advice:
+            # Как и в обычном режиме: без маркера весь ответ считается интерпретацией
+            advice = DEFAULT_ADVICE
+        return events, {"interpretation": interpretation, "advice": advice}
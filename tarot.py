@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
-import os
+from typing import List, Literal, Optional, Union
 from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+import json
 
 from models.tarot import (
     ReadingGenerateRequest, 
@@ -10,46 +12,249 @@ from models.tarot import (
     ReadingSaveRequest,
     RandomCardsRequest,
     Reading,
-    ReadingHistoryResponse,
     TarotCard
 )
 from services.ai_service import AITarotService
-from services.tarot_service import TarotService
+from services.tarot_service import SPREAD_POSITIONS, TarotService
+from services.deck import get_deck
+from services.database import get_database
+from services.cache_service import make_reading_key, reading_cache
+from services.singleflight import reading_flight
+from services.admission import AdmissionRejected, llm_admission
+from services.llm_policy import DeadlineExceeded, llm_policy
+from services.local_interpreter import local_interpreter
+from services.corpus_service import reading_corpus
+from services.prompts import prompt_library
+from services.write_behind import reading_writer
+from services.jobs_service import IdempotencyConflict, JobQueueFull, job_view, reading_jobs
+from services.reading_store import UnusableReading, build_reading_document, reading_cards
+from services.followup_service import fetch_followup_history, save_followup_turn
+from services.history_cache import history_cache
+from services.retention_service import reading_archiver
+from services.stats_service import GLOBAL_SCOPE, MAX_STATS_DAYS, fetch_stats, record_readings, session_scope
+from services.search_service import MAX_SEARCH_PAGE_SIZE, MAX_SEARCH_PAGES, search_readings
+from services.history_service import MAX_PAGE_SIZE, InvalidCursor, fetch_reading, public_reading
 
 router = APIRouter(prefix="/api/reading", tags=["tarot"])
 
-# Dependency для получения базы данных
-def get_database():
-    from motor.motor_asyncio import AsyncIOMotorClient
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    return client[os.environ['DB_NAME']]
+GENERATE_MODES = ("ai", "local")
+
+tarot_service = TarotService()
+
+def _overloaded(error: AdmissionRejected) -> HTTPException:
+    """Преобразует отказ в допуске к LLM в быстрый 429/503 с Retry-After"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+class CardRef(BaseModel):
+    """Ссылка на карту серверной колоды вместо полного описания карты"""
+    model_config = ConfigDict(extra="forbid")
+    
+    id: int
+    reversed: bool = False
+    position: Optional[str] = None
+
+class ReadingGenerateRefsRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    spread_type: str
+    question: Optional[str] = None
+    cards: List[CardRef] = Field(min_length=1, max_length=78)
+
+class ReadingDrawRequest(BaseModel):
+    spread_type: str
+    question: Optional[str] = None
+    count: Optional[int] = None
+
+class ReadingDrawResponse(ReadingGenerateResponse):
+    cards: List[TarotCard]
+
+async def _interpret(cards: List[TarotCard], spread_type: str, question: Optional[str], mode: str) -> dict:
+    if mode == "local":
+        # Локальная интерпретация: без сети, за доли миллисекунды
+        return local_interpreter.interpret(cards, spread_type, question)
+    
+    # Генерируем AI предсказание
+    ai_service = AITarotService()
+    return await ai_service.generate_reading(
+        cards=cards,
+        spread_type=spread_type,
+        question=question
+    )
+
+def _request_cards(request: Union[ReadingGenerateRefsRequest, ReadingGenerateRequest]) -> List[TarotCard]:
+    # Текст карт клиента в промпт не попадает: и ссылки, и полные карты
+    # (старый формат) собираются из серверной колоды по id, позиции - из расклада
+    try:
+        if isinstance(request, ReadingGenerateRefsRequest):
+            return tarot_service.cards_from_refs([card.dict() for card in request.cards], request.spread_type)
+        return tarot_service.canonical_cards(request.cards, request.spread_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/generate", response_model=ReadingGenerateResponse)
-async def generate_reading(request: ReadingGenerateRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Генерирует AI предсказание на основе карт"""
+async def generate_reading(
+    request: Union[ReadingGenerateRefsRequest, ReadingGenerateRequest],
+    mode: str = "ai",
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Генерирует AI предсказание на основе карт (mode=local - без AI)"""
+    if mode not in GENERATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный режим генерации: {mode}")
+    
+    cards = _request_cards(request)
+    
     try:
-        ai_service = AITarotService()
+        ai_result = await _interpret(cards, request.spread_type, request.question, mode)
         
-        # Преобразуем данные в TarotCard объекты
-        cards = [TarotCard(**card.dict()) for card in request.cards]
+        return ReadingGenerateResponse(
+            interpretation=ai_result["interpretation"],
+            advice=ai_result["advice"]
+        )
         
-        # Генерируем AI предсказание
-        ai_result = await ai_service.generate_reading(
-            cards=cards,
-            spread_type=request.spread_type,
-            question=request.question
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except Exception as e:
+        print(f"Ошибка генерации предсказания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка генерации предсказания: {str(e)}")
+
+@router.post("/draw", response_model=ReadingDrawResponse)
+async def draw_reading(request: ReadingDrawRequest, mode: str = "ai"):
+    """Вытягивает карты, назначает позиции и генерирует предсказание за один запрос"""
+    if mode not in GENERATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный режим генерации: {mode}")
+    
+    deck = get_deck()
+    if request.count is None and request.spread_type not in SPREAD_POSITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный расклад: {request.spread_type}; для него нужно указать count"
         )
+    count = request.count if request.count is not None else len(SPREAD_POSITIONS[request.spread_type])
+    if not 0 < count <= len(deck):
+        raise HTTPException(status_code=400, detail=f"Количество карт должно быть от 1 до {len(deck)}")
+    
+    try:
+        cards = tarot_service.get_random_cards(count, request.spread_type)
+        ai_result = await _interpret(cards, request.spread_type, request.question, mode)
         
-        return ReadingGenerateResponse(
+        return ReadingDrawResponse(
+            cards=cards,
             interpretation=ai_result["interpretation"],
             advice=ai_result["advice"]
         )
         
+    except AdmissionRejected as e:
+        raise _overloaded(e)
     except Exception as e:
         print(f"Ошибка генерации предсказания: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка генерации предсказания: {str(e)}")
 
+def _sse_event(event: str, data: dict) -> str:
+    """Форматирует событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/generate/stream")
+async def generate_reading_stream(
+    request: Union[ReadingGenerateRefsRequest, ReadingGenerateRequest],
+    http_request: Request
+):
+    """Генерирует AI предсказание в потоковом режиме (Server-Sent Events)"""
+    cards = _request_cards(request)
+    try:
+        ai_service = AITarotService()
+    except Exception as e:
+        print(f"Ошибка генерации предсказания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка генерации предсказания: {str(e)}")
+    
+    events = ai_service.stream_reading(
+        cards=cards,
+        spread_type=request.spread_type,
+        question=request.question
+    )
+    try:
+        # Первое событие получаем до отправки заголовков, чтобы перегрузка
+        # вернулась обычным 429/503, а не внутри потока
+        first_event = await events.__anext__()
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    
+    async def event_stream():
+        async def all_events():
+            yield first_event
+            async for item in events:
+                yield item
+        
+        try:
+            async for event, data in all_events():
+                # Клиент ушёл - прекращаем генерацию и закрываем поток LLM
+                if await http_request.is_disconnected():
+                    break
+                if event == "done":
+                    data = ReadingGenerateResponse(
+                        interpretation=data["interpretation"],
+                        advice=data["advice"]
+                    ).dict()
+                yield _sse_event(event, data)
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/jobs", status_code=202)
+async def create_reading_job(
+    request: Union[ReadingGenerateRefsRequest, ReadingGenerateRequest],
+    idempotency_key: Optional[str] = Header(None, max_length=128)
+):
+    """Ставит генерацию предсказания в очередь и сразу возвращает id задания"""
+    cards = _request_cards(request)
+    try:
+        job = await reading_jobs.submit(cards, request.spread_type, request.question, idempotency_key)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Ошибка создания задания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка создания задания: {str(e)}")
+    
+    return job_view(job)
+
+@router.get("/jobs/{job_id}")
+async def get_reading_job(job_id: str, wait: float = Query(0, ge=0, le=30)):
+    """Статус и результат задания (wait - ждать завершения до N секунд)"""
+    try:
+        job = await reading_jobs.get(job_id, wait=wait)
+    except Exception as e:
+        print(f"Ошибка загрузки задания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки задания: {str(e)}")
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job_view(job)
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Статистика кэша интерпретаций, объединения запросов и очереди к LLM"""
+    return {
+        **reading_cache.stats(),
+        "singleflight": reading_flight.stats(),
+        "admission": llm_admission.stats(),
+        "llm_policy": llm_policy.stats(),
+        "corpus": reading_corpus.stats(),
+        "jobs": reading_jobs.stats(),
+        "prompts": prompt_library.stats(),
+        "history": history_cache.stats(),
+        "archive": reading_archiver.stats()
+    }
+
 @router.post("/save")
 async def save_reading(request: ReadingSaveRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Сохраняет гадание в истории"""
@@ -63,8 +268,25 @@ async def save_reading(request: ReadingSaveRequest, db: AsyncIOMotorDatabase = D
             created_at=datetime.utcnow()
         )
         
-        # Сохраняем в MongoDB
-        await db.readings.insert_one(reading.dict())
+        # Карты сохраняются ссылками на колоду
+        document = build_reading_document(reading)
+        # Версия промптов, выбранная при генерации, - уточняющие вопросы используют её же
+        document["prompt_version"] = prompt_library.select(
+            make_reading_key(request.cards, request.spread_type, request.question)
+        ).version
+        
+        # В режиме write-behind запись уходит в буфер и пишется пачкой в фоне;
+        # при переполненном буфере пишем напрямую
+        if not (reading_writer.enabled and reading_writer.enqueue(document)):
+            # Сохраняем в MongoDB
+            await db.readings.insert_one(document)
+            # Кэш истории сессии устаревает (в режиме write-behind - после записи пачки)
+            await history_cache.bump(reading.session_id)
+            try:
+                await record_readings(db, [document])
+            except Exception as e:
+                # Гадание сохранено; расхождение счётчиков исправит rebuild_stats.py
+                print(f"Ошибка обновления статистики: {e}")
         
         return {"message": "Гадание сохранено", "reading_id": reading.id}
         
@@ -72,41 +294,172 @@ async def save_reading(request: ReadingSaveRequest, db: AsyncIOMotorDatabase = D
         print(f"Ошибка сохранения гадания: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка сохранения гадания: {str(e)}")
 
-@router.get("/history", response_model=ReadingHistoryResponse)
-async def get_reading_history(session: str, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Получает историю гаданий пользователя"""
+@router.get("/history")
+async def get_reading_history(
+    session: str,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Получает историю гаданий пользователя (keyset-пагинация по курсору)"""
     try:
-        cursor = db.readings.find({"session_id": session}).sort("created_at", -1).limit(50)
-        readings_data = await cursor.to_list(length=50)
-        
-        readings = []
-        for reading_data in readings_data:
-            # Преобразуем ObjectId в строку для _id поля
-            if "_id" in reading_data:
-                del reading_data["_id"]
-            readings.append(Reading(**reading_data))
-        
-        return ReadingHistoryResponse(readings=readings)
+        # Страница уже сериализована (orjson) и закэширована до следующего сохранения в сессии
+        etag, body = await history_cache.get_page(db, session, limit, cursor, view)
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Ошибка загрузки истории: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки истории: {str(e)}")
+    
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/search")
+async def search_reading_history(
+    session: str,
+    q: str = Query(min_length=2, max_length=200),
+    limit: int = Query(MAX_SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    page: int = Query(1, ge=1, le=MAX_SEARCH_PAGES),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Поиск по вопросам и интерпретациям истории сессии (текстовый индекс)"""
+    try:
+        return ORJSONResponse(await search_readings(db, session, q, limit=limit, page=page))
+    except Exception as e:
+        print(f"Ошибка поиска по истории: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска по истории: {str(e)}")
 
 # Роутер для карт
 cards_router = APIRouter(prefix="/api/cards", tags=["cards"])
 
+# Полные карты в десятки раз длиннее ссылок, поэтому и предел раскладов ниже
+MAX_FULL_BATCH_SPREADS = 10_000
+
+class RandomCardsBatchRequest(BaseModel):
+    count: int
+    spread_type: str
+    spreads: int = Field(ge=1, le=1_000_000)
+    seed: Optional[int] = None
+    format: Literal["refs", "full"] = "refs"
+
 @cards_router.post("/random")
 async def get_random_cards(request: RandomCardsRequest):
     """Получает случайные карты для расклада"""
+    deck = get_deck()
+    if not 0 < request.count <= len(deck):
+        raise HTTPException(status_code=400, detail=f"Количество карт должно быть от 1 до {len(deck)}")
+    
     try:
-        tarot_service = TarotService()
-        cards = tarot_service.get_random_cards(request.count, request.spread_type)
+        drawn = deck.draw(request.count)
         
         # Назначаем позиции
-        cards = tarot_service.assign_positions(cards, request.spread_type)
+        positions = tarot_service.get_position_names(request.spread_type, request.count)
         
-        return {"cards": [card.dict() for card in cards]}
+        # Ответ склеивается из заранее собранных JSON-фрагментов карт
+        return Response(content=deck.spread_json(drawn, positions), media_type="application/json")
         
     except Exception as e:
         print(f"Ошибка получения карт: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка получения карт: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка получения карт: {str(e)}")
+
+@cards_router.post("/random/batch")
+async def get_random_cards_batch(request: RandomCardsBatchRequest):
+    """Вытягивает много независимых раскладов за один запрос (NDJSON, по раскладу на строку)"""
+    deck = get_deck()
+    if not 0 < request.count <= len(deck):
+        raise HTTPException(status_code=400, detail=f"Количество карт должно быть от 1 до {len(deck)}")
+    if request.format == "full" and request.spreads > MAX_FULL_BATCH_SPREADS:
+        raise HTTPException(status_code=400, detail=f"Для format=full можно запросить не больше {MAX_FULL_BATCH_SPREADS} раскладов")
+    
+    positions = tarot_service.get_position_names(request.spread_type, request.count)
+    lines = deck.batch_ndjson(
+        count=request.count,
+        spreads=request.spreads,
+        positions=positions,
+        seed=request.seed,
+        full=request.format == "full"
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+class FollowupRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=1000)
+    user_session: str
+
+@router.post("/{reading_id}/followup")
+async def followup_reading(reading_id: str, request: FollowupRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Уточняющий вопрос по сохранённому гаданию без повторной генерации расклада"""
+    try:
+        reading = await fetch_reading(db, request.user_session, reading_id)
+    except Exception as e:
+        print(f"Ошибка загрузки гадания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки гадания: {str(e)}")
+    
+    if reading is None:
+        raise HTTPException(status_code=404, detail="Гадание не найдено")
+    try:
+        cards = reading_cards(reading)
+    except UnusableReading as e:
+        raise HTTPException(status_code=422, detail=f"По этому гаданию нельзя задать уточняющий вопрос: {e}")
+    if not llm_policy.health.allow_request():
+        raise HTTPException(status_code=503, detail="AI временно недоступен, попробуйте позже")
+    
+    try:
+        history = await fetch_followup_history(db, reading_id)
+        answer = await AITarotService().answer_followup(reading, cards, history, request.question)
+        await save_followup_turn(db, reading_id, request.user_session, request.question, answer)
+        
+        return {"reading_id": reading_id, "question": request.question, "answer": answer}
+        
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"Ошибка ответа на уточняющий вопрос: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка ответа на уточняющий вопрос: {str(e)}")
+
+@router.get("/{reading_id}")
+async def get_reading(reading_id: str, session: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Получает полное гадание из истории"""
+    try:
+        reading = await fetch_reading(db, session, reading_id)
+    except Exception as e:
+        print(f"Ошибка загрузки гадания: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки гадания: {str(e)}")
+    
+    if reading is None:
+        raise HTTPException(status_code=404, detail="Гадание не найдено")
+    return ORJSONResponse(public_reading(reading))
+
+# Роутер статистики
+stats_router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+@stats_router.get("")
+async def get_global_stats(
+    days: int = Query(30, ge=1, le=MAX_STATS_DAYS),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Общая статистика гаданий (счётчики, обновляемые при сохранении)"""
+    try:
+        return ORJSONResponse(await fetch_stats(db, GLOBAL_SCOPE, days=days))
+    except Exception as e:
+        print(f"Ошибка загрузки статистики: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки статистики: {str(e)}")
+
+@stats_router.get("/session")
+async def get_session_stats(
+    session: str,
+    days: int = Query(30, ge=1, le=MAX_STATS_DAYS),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Статистика гаданий сессии"""
+    try:
+        return ORJSONResponse(await fetch_stats(db, session_scope(session), days=days))
+    except Exception as e:
+        print(f"Ошибка загрузки статистики: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки статистики: {str(e)}")
@@ -1,142 +1,67 @@
-import random
 from typing import List, Dict
 from models.tarot import TarotCard
+from services.deck import DeckCatalogue, get_deck
+
+# Названия позиций для разных раскладов
+SPREAD_POSITIONS = {
+    "single": ["Ответ"],
+    "daily": ["Карта дня"],
+    "three": ["Прошлое", "Настоящее", "Будущее"],
+    "love": ["Ваши чувства", "Чувства партнёра", "Препятствия", "Совет", "Исход"],
+    "weekly": ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"],
+    "celtic": [
+        "Текущая ситуация",
+        "Препятствие/Помощь",
+        "Далёкое прошлое",
+        "Недавнее прошлое",
+        "Возможное будущее",
+        "Ближайшее будущее",
+        "Ваш подход",
+        "Внешние влияния",
+        "Надежды и страхи",
+        "Итоговый результат"
+    ]
+}
+
+# Служебные ключи LLM, которые не являются раскладами, и части веерной генерации ("celtic:part")
+INTERNAL_SPREAD_KEYS = ("followup",)
+SPREAD_KEY_PARTS = ("part", "synthesis")
+
+
+def spread_label(key: str) -> str:
+    """Тип расклада для меток метрик и ключей счётчиков.
+
+    spread_type приходит от клиента, поэтому всё, чего нет в SPREAD_POSITIONS,
+    сводится к "other" - иначе каждая строка создавала бы новую серию.
+    """
+    spread, separator, part = key.partition(":")
+    if spread not in SPREAD_POSITIONS and spread not in INTERNAL_SPREAD_KEYS:
+        spread = "other"
+    if separator and part not in SPREAD_KEY_PARTS:
+        return "other"
+    return spread + separator + part
+
 
 class TarotService:
-    def __init__(self):
-        self.cards = self._initialize_cards()
+    def __init__(self, deck: DeckCatalogue = None):
+        self.deck = deck or get_deck()
     
-    def _initialize_cards(self) -> List[Dict]:
-        """Инициализация колоды карт Таро"""
-        return [
-            {
-                "id": 1,
-                "name": "Шут",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1578662996442-48f60103fc96?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["новое начало", "спонтанность", "свобода"],
-                "upright_meaning": "Новые начинания, спонтанность, свобода духа, чистый потенциал",
-                "reversed_meaning": "Безрассудство, наивность, отсутствие планов, легкомыслие"
-            },
-            {
-                "id": 2,
-                "name": "Маг",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1551269901-5c5e14c25df7?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["сила воли", "творчество", "навыки"],
-                "upright_meaning": "Сила воли, творческая энергия, умения, проявление намерений",
-                "reversed_meaning": "Неиспользованный потенциал, обман, манипуляции, самомнение"
-            },
-            {
-                "id": 3,
-                "name": "Жрица",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1532618793091-ec5fe9635fbd?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["интуиция", "тайна", "женская мудрость"],
-                "upright_meaning": "Интуиция, внутренняя мудрость, тайные знания, духовность",
-                "reversed_meaning": "Игнорирование интуиции, секреты, поверхностность, разобщённость"
-            },
-            {
-                "id": 4,
-                "name": "Императрица",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1518709268805-4e9042af2176?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["материнство", "плодородие", "изобилие"],
-                "upright_meaning": "Материнство, творчество, изобилие природы, плодородность",
-                "reversed_meaning": "Зависимость, пустота, бесплодие, блокировка творчества"
-            },
-            {
-                "id": 5,
-                "name": "Император",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["авторитет", "структура", "защита"],
-                "upright_meaning": "Авторитет, стабильность, защита, лидерство",
-                "reversed_meaning": "Тирания, негибкость, отсутствие дисциплины, злоупотребление властью"
-            },
-            {
-                "id": 6,
-                "name": "Иерофант",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1578662996442-48f60103fc96?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["духовность", "традиции", "обучение"],
-                "upright_meaning": "Духовное руководство, традиции, образование, институциональность",
-                "reversed_meaning": "Догматизм, конформизм, ограниченность, бунт против системы"
-            },
-            {
-                "id": 7,
-                "name": "Влюбленные",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1518709268805-4e9042af2176?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["любовь", "выбор", "гармония"],
-                "upright_meaning": "Любовь, партнерство, важный выбор, гармония отношений",
-                "reversed_meaning": "Дисгармония, неправильный выбор, расставание, конфликт ценностей"
-            },
-            {
-                "id": 8,
-                "name": "Колесница",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1551269901-5c5e14c25df7?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["контроль", "победа", "целеустремленность"],
-                "upright_meaning": "Контроль, триумф, преодоление препятствий, направленная энергия",
-                "reversed_meaning": "Отсутствие контроля, поражение, агрессия, отсутствие направления"
-            },
-            {
-                "id": 9,
-                "name": "Сила",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1532618793091-ec5fe9635fbd?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["внутренняя сила", "терпение", "сострадание"],
-                "upright_meaning": "Внутренняя сила, терпение, сострадание, контроль над эмоциями",
-                "reversed_meaning": "Слабость, неуверенность, злоупотребление силой, потеря контроля"
-            },
-            {
-                "id": 10,
-                "name": "Отшельник",
-                "arcana": "major",
-                "image": "https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=400&h=600&fit=crop&crop=center",
-                "keywords": ["поиск истины", "одиночество", "мудрость"],
-                "upright_meaning": "Поиск истины, внутренняя мудрость, одиночество как путь к себе",
-                "reversed_meaning": "Изоляция, одиночество как бегство, отказ от помощи, заблуждения"
-            }
-        ]
+    @property
+    def cards(self) -> List[Dict]:
+        """Колода карт Таро в виде словарей"""
+        return [record.to_dict() for record in self.deck.records]
     
     def get_random_cards(self, count: int, spread_type: str = None) -> List[TarotCard]:
-        """Получает случайные карты из колоды"""
-        shuffled_cards = random.sample(self.cards, count)
-        
-        result = []
-        for card_data in shuffled_cards:
-            card = TarotCard(**card_data)
-            # 30% шанс перевернутой карты
-            card.reversed = random.random() < 0.3
-            result.append(card)
-        
-        return result
+        """Получает случайные карты из колоды; если указан расклад, назначает позиции"""
+        # 30% шанс перевернутой карты
+        cards = [self.deck.tarot_card(index, is_reversed) for index, is_reversed in self.deck.draw(count)]
+        if spread_type is not None:
+            cards = self.assign_positions(cards, spread_type)
+        return cards
     
     def get_position_names(self, spread_type: str, count: int) -> List[str]:
         """Возвращает названия позиций для разных раскладов"""
-        positions = {
-            "single": ["Ответ"],
-            "daily": ["Карта дня"],
-            "three": ["Прошлое", "Настоящее", "Будущее"],
-            "love": ["Ваши чувства", "Чувства партнёра", "Препятствия", "Совет", "Исход"],
-            "weekly": ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"],
-            "celtic": [
-                "Текущая ситуация",
-                "Препятствие/Помощь",
-                "Далёкое прошлое",
-                "Недавнее прошлое",
-                "Возможное будущее",
-                "Ближайшее будущее",
-                "Ваш подход",
-                "Внешние влияния",
-                "Надежды и страхи",
-                "Итоговый результат"
-            ]
-        }
-        
-        return positions.get(spread_type, [f"Позиция {i+1}" for i in range(count)])
+        return SPREAD_POSITIONS.get(spread_type, [f"Позиция {i+1}" for i in range(count)])
     
     def assign_positions(self, cards: List[TarotCard], spread_type: str) -> List[TarotCard]:
         """Назначает позиции картам в раскладе"""
@@ -146,4 +71,33 @@ class TarotService:
             if i < len(positions):
                 card.position = positions[i]
         
-        return cards
\ No newline at end of file
+        return cards
+    
+    def cards_from_refs(self, refs: List[Dict], spread_type: str) -> List[TarotCard]:
+        """Собирает карты по ссылкам (id, reversed, position) из серверной колоды.
+
+        Позиция клиента принимается, только если это позиция расклада;
+        иначе карта получает позицию расклада по порядку.
+        """
+        positions = self.get_position_names(spread_type, len(refs))
+        seen = set()
+        cards = []
+        for i, ref in enumerate(refs):
+            card_id = ref["id"]
+            if card_id not in self.deck.index_by_id:
+                raise ValueError(f"Неизвестная карта: {card_id}")
+            if card_id in seen:
+                raise ValueError(f"Карта {card_id} повторяется в раскладе")
+            seen.add(card_id)
+            position = ref.get("position")
+            if position not in positions:
+                position = positions[i] if i < len(positions) else None
+            cards.append(self.deck.tarot_card(self.deck.index_by_id[card_id], ref.get("reversed", False), position))
+        return cards
+    
+    def canonical_cards(self, cards: List[TarotCard], spread_type: str) -> List[TarotCard]:
+        """Полные карты клиента, сверенные с колодой по id: названия и значения - из колоды"""
+        return self.cards_from_refs([
+            {"id": int(card.id), "reversed": bool(card.reversed), "position": card.position}
+            for card in cards
+        ], spread_type)
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from services.admission import (
+    PRIORITY_HEAVY,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STANDARD,
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+def test_admission_wakes_waiters_by_priority_then_fifo():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=1)
+        order = []
+
+        async def request(name, priority):
+            async with controller.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.001)
+
+        await controller.acquire()
+        waiters = [
+            asyncio.ensure_future(request("heavy", PRIORITY_HEAVY)),
+            asyncio.ensure_future(request("standard-1", PRIORITY_STANDARD)),
+            asyncio.ensure_future(request("interactive", PRIORITY_INTERACTIVE)),
+            asyncio.ensure_future(request("standard-2", PRIORITY_STANDARD)),
+        ]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*waiters)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["interactive", "standard-1", "standard-2", "heavy"]
+    assert controller.stats()["active"] == 0
+    assert controller.stats()["waiting"] == 0
+
+
+def test_admission_rejects_with_429_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        controller.release()
+        await waiter
+        controller.release()
+        return controller, rejected.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+    assert controller.rejected_full == 1
+    assert controller.stats()["active"] == 0
+
+
+def test_admission_rejects_with_503_after_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=0.01)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        # Истёкший ожидающий не забирает освободившийся слот
+        controller.release()
+        return controller, rejected.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert controller.rejected_timeout == 1
+    assert controller.stats()["active"] == 0
+    assert controller.stats()["waiting"] == 0
+
+
+def test_admission_try_acquire_does_not_jump_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, max_queue=5, queue_timeout=1)
+        assert controller.try_acquire()
+        assert controller.try_acquire()
+        assert not controller.try_acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        controller.release()
+        # Освободившийся слот передан ожидающему, а не необязательному вызову
+        assert not controller.try_acquire()
+        await waiter
+        controller.release()
+        controller.release()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.stats()["active"] == 0
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from services.cache_service import ReadingCache, make_reading_key
+
+VALUE = {"interpretation": "Карты говорят о переменах.", "advice": "Действуйте спокойно."}
+
+
+def test_reading_key_ignores_question_case_and_spaces(make_cards):
+    cards = make_cards((1, False, "Прошлое"), (2, True, "Настоящее"))
+    assert make_reading_key(cards, "three", "Что  меня ждёт?") == make_reading_key(cards, "three", " что меня ЖДЁТ? ")
+
+
+def test_reading_key_empty_question_is_no_question(make_cards):
+    cards = make_cards((1, False, "Ответ"))
+    assert make_reading_key(cards, "single", "") == make_reading_key(cards, "single", None)
+
+
+@pytest.mark.parametrize("other", [
+    ((1, True, "Прошлое"), (2, True, "Настоящее")),
+    ((2, True, "Прошлое"), (1, False, "Настоящее")),
+    ((1, False, "Настоящее"), (2, True, "Прошлое")),
+])
+def test_reading_key_depends_on_cards(make_cards, other):
+    cards = make_cards((1, False, "Прошлое"), (2, True, "Настоящее"))
+    assert make_reading_key(cards, "three") != make_reading_key(make_cards(*other), "three")
+
+
+def test_reading_key_depends_on_spread(make_cards):
+    cards = make_cards((1, False, None))
+    assert make_reading_key(cards, "single") != make_reading_key(cards, "daily")
+
+
+def test_local_cache_evicts_least_recently_used():
+    async def scenario():
+        cache = ReadingCache(max_entries=2)
+        await cache.set("a", VALUE)
+        await cache.set("b", VALUE)
+        await cache.get("a")
+        await cache.set("c", VALUE)
+        return cache, [await cache.get(key) is not None for key in ("a", "b", "c")]
+
+    cache, present = asyncio.run(scenario())
+    assert present == [True, False, True]
+    assert cache.stats()["misses"] == 1
+
+
+def test_shared_cache_serves_other_process(db):
+    async def scenario():
+        writer, reader = ReadingCache(), ReadingCache()
+        await writer.attach(db)
+        await reader.attach(db)
+        await writer.set("key", {**VALUE, "extra": "не сохраняется"})
+        return reader, await reader.get("key"), await reader.get("key")
+
+    reader, shared, local = asyncio.run(scenario())
+    assert shared == VALUE and local == VALUE
+    assert (reader.shared_hits, reader.local_hits) == (1, 1)
@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from services import compression
+from services.compression import CompressionMiddleware, _choose_encoding
+
+BODY = '{"cards": "' + "Колесо Фортуны " * 200 + '"}'
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+
+    @app.get("/json")
+    async def json_body():
+        return Response(BODY, media_type="application/json", headers={"Vary": "Origin"})
+
+    @app.get("/small")
+    async def small_body():
+        return PlainTextResponse("ok")
+
+    @app.get("/image")
+    async def image_body():
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+def test_choose_encoding_respects_q_values(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert _choose_encoding("gzip, deflate, br") == "gzip"
+    assert _choose_encoding("gzip;q=0, br") is None
+    assert _choose_encoding("GZIP;q=0.5") == "gzip"
+    assert _choose_encoding("gzip;q=abc") is None
+    assert _choose_encoding("identity") is None
+    assert _choose_encoding("") is None
+
+    monkeypatch.setattr(compression, "brotli", object())
+    assert _choose_encoding("gzip, br") == "br"
+    assert _choose_encoding("gzip, br;q=0") == "gzip"
+
+
+def test_json_is_gzipped_with_vary_and_length(app_client):
+    response = app_client.get("/json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Origin, Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(BODY.encode("utf-8"))
+    # httpx распаковывает тело сам
+    assert response.text == BODY
+
+
+def test_gzip_body_is_valid_stream(app_client):
+    with app_client.stream("GET", "/json", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode("utf-8") == BODY
+
+
+@pytest.mark.parametrize("path, accept", [
+    ("/json", "identity"),
+    ("/small", "gzip"),
+    ("/image", "gzip"),
+])
+def test_response_passes_uncompressed(app_client, path, accept):
+    response = app_client.get(path, headers={"Accept-Encoding": accept})
+    assert "content-encoding" not in response.headers
+    assert response.status_code == 200
+
+
+def test_streaming_response_passes_through_chunk_by_chunk():
+    # TestClient собирает тело целиком, поэтому сообщения ASGI проверяем напрямую
+    chunks = [b"event: interpretation\ndata: " + b"x" * 2000 + b"\n\n"] * 3
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=500)(scope, None, send))
+
+    assert [message["type"] for message in sent] == ["http.response.start"] + ["http.response.body"] * 3
+    assert b"content-encoding" not in dict(sent[0]["headers"])
+    assert [message["body"] for message in sent[1:]] == chunks
@@ -0,0 +1,119 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from services.corpus_service import ACTIVE_ID, CorpusBuildFailed, ReadingCorpus, build_corpus
+from services.deck import get_deck
+
+DECK_SIZE = len(get_deck())
+
+
+def _generator(fail=lambda card, attempt: False):
+    attempts = Counter()
+
+    async def generate(cards, spread_type):
+        card = cards[0]
+        key = (spread_type, card.id, card.reversed)
+        attempts[key] += 1
+        if fail(card, attempts[key]):
+            raise ConnectionError("LLM недоступен")
+        return {"interpretation": f"{card.name} {attempts[key]}", "advice": "совет"}
+
+    return generate, attempts
+
+
+def test_build_switches_active_version_and_keeps_previous(db):
+    async def scenario():
+        generate, _ = _generator()
+        first = await build_corpus(db, generate, variants=1, spreads=("daily",))
+        second = await build_corpus(db, generate, variants=1, spreads=("daily",))
+        third = await build_corpus(db, generate, variants=1, spreads=("daily",))
+        active = await db.reading_corpus_meta.find_one({"_id": ACTIVE_ID})
+        versions = await db.reading_corpus.distinct("version")
+        return first, second, third, active, versions
+
+    first, second, third, active, versions = asyncio.run(scenario())
+    assert active["version"] == third
+    # Предыдущая версия остаётся для процессов, ещё не перечитавших метаданные
+    assert sorted(versions) == sorted([second, third])
+    assert first not in versions
+
+
+def test_failed_variants_are_retried(db):
+    async def scenario():
+        # Каждая прямая карта удаётся только со второй попытки
+        generate, attempts = _generator(lambda card, attempt: not card.reversed and attempt == 1)
+        version = await build_corpus(db, generate, variants=1, spreads=("single",), max_failure_rate=0)
+        return version, attempts, await db.reading_corpus.count_documents({"version": version})
+
+    version, attempts, stored = asyncio.run(scenario())
+    assert stored == DECK_SIZE * 2
+    assert attempts[("single", 1, False)] == 2
+    assert attempts[("single", 1, True)] == 1
+
+
+def test_missing_variants_under_threshold_are_filled(db):
+    async def scenario():
+        # Второй вариант карты 1 не удаётся ни с одной попытки
+        generate, _ = _generator(lambda card, attempt: card.id == 1 and not card.reversed and attempt > 1)
+        version = await build_corpus(db, generate, variants=2, spreads=("daily",), retries=2)
+        documents = await db.reading_corpus.find(
+            {"version": version, "card_id": 1, "reversed": False}).sort("variant", 1).to_list(None)
+        active = await db.reading_corpus_meta.find_one({"_id": ACTIVE_ID})
+        return version, documents, active
+
+    version, documents, active = asyncio.run(scenario())
+    assert active["version"] == version
+    assert active["duplicated"] == 1
+    # Читатель попадает в любой вариант: пустых мест в активной версии нет
+    assert [document["variant"] for document in documents] == [0, 1]
+    assert documents[0]["interpretation"] == documents[1]["interpretation"]
+
+
+def test_build_over_failure_rate_keeps_previous_version(db):
+    async def scenario():
+        ok, _ = _generator()
+        previous = await build_corpus(db, ok, variants=1, spreads=("daily",))
+        failing, _ = _generator(lambda card, attempt: card.id % 2 == 0)
+        with pytest.raises(CorpusBuildFailed) as failed:
+            await build_corpus(db, failing, variants=1, spreads=("daily",), max_failure_rate=0.05, retries=1)
+        active = await db.reading_corpus_meta.find_one({"_id": ACTIVE_ID})
+        return previous, failed.value, active, await db.reading_corpus.distinct("version")
+
+    previous, error, active, versions = asyncio.run(scenario())
+    assert error.total == DECK_SIZE * 2
+    assert error.failed == DECK_SIZE
+    assert active["version"] == previous
+    assert versions == [previous]
+
+
+def test_card_without_any_variant_fails_the_build(db):
+    async def scenario():
+        generate, _ = _generator(lambda card, attempt: card.id == 1 and card.reversed)
+        with pytest.raises(CorpusBuildFailed):
+            await build_corpus(db, generate, variants=2, spreads=("daily",), max_failure_rate=0.5, retries=0)
+        return await db.reading_corpus_meta.find_one({"_id": ACTIVE_ID}), await db.reading_corpus.count_documents({})
+
+    active, stored = asyncio.run(scenario())
+    assert active is None
+    assert stored == 0
+
+
+def test_pick_serves_active_version_only_for_eligible_readings(db, make_cards):
+    async def scenario():
+        generate, _ = _generator()
+        await build_corpus(db, generate, variants=1, spreads=("daily",))
+        corpus = ReadingCorpus(refresh_seconds=0)
+        await corpus.attach(db)
+        card = make_cards((1, False, "Карта дня"))
+        return (
+            await corpus.pick(card, "daily"),
+            await corpus.pick(card, "daily", "Вопрос?"),
+            await corpus.pick(card, "single"),
+            await corpus.pick(make_cards((1, False, None), (2, False, None)), "daily"),
+        )
+
+    daily, with_question, other_spread, two_cards = asyncio.run(scenario())
+    assert daily == {"interpretation": f"{get_deck().get(1).name} 1", "advice": "совет"}
+    assert with_question is None and other_spread is None and two_cards is None
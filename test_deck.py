@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from services.deck import get_deck
+from services.tarot_service import TarotService
+
+POSITIONS = ["Прошлое", "Настоящее", "Будущее"]
+
+
+def _lines(**kwargs):
+    return "".join(get_deck().batch_ndjson(**kwargs)).splitlines()
+
+
+def test_full_deck_catalogue():
+    deck = get_deck()
+    assert len(deck) == 78
+    assert len({record.id for record in deck.records}) == 78
+    assert deck is get_deck()
+
+
+@pytest.mark.parametrize("full", [False, True])
+def test_batch_is_reproducible_with_seed(full):
+    kwargs = dict(count=3, spreads=500, positions=POSITIONS, full=full, chunk_bytes=4096)
+    assert _lines(seed=7, **kwargs) == _lines(seed=7, **kwargs)
+    assert _lines(seed=7, **kwargs) != _lines(seed=8, **kwargs)
+
+
+def test_batch_lines_are_valid_spreads():
+    lines = _lines(count=3, spreads=1000, positions=POSITIONS, seed=1, chunk_bytes=2048)
+    assert len(lines) == 1000
+    reversed_cards = 0
+    for line in lines:
+        cards = json.loads(line)["cards"]
+        assert [card["position"] for card in cards] == POSITIONS
+        # Карты в раскладе не повторяются
+        assert len({card["id"] for card in cards}) == 3
+        reversed_cards += sum(card["reversed"] for card in cards)
+    assert 0.2 < reversed_cards / 3000 < 0.4
+
+
+def test_full_batch_lines_carry_card_fields():
+    deck = get_deck()
+    card = json.loads(_lines(count=1, spreads=1, positions=["Ответ"], seed=3, full=True)[0])["cards"][0]
+    assert card.items() >= deck.get(card["id"]).to_dict().items()
+    assert card["position"] == "Ответ"
+
+
+def test_draw_without_repeats():
+    drawn = get_deck().draw(78)
+    assert sorted(index for index, _ in drawn) == list(range(78))
+    with pytest.raises(ValueError):
+        get_deck().draw(79)
+
+
+def test_random_cards_get_spread_positions():
+    tarot_service = TarotService()
+    assert [card.position for card in tarot_service.get_random_cards(3, "three")] == ["Прошлое", "Настоящее", "Будущее"]
+    assert [card.position for card in tarot_service.get_random_cards(2)] == [None, None]
+
+
+def test_batch_route_limits_and_seed(client):
+    request = {"count": 3, "spread_type": "three", "spreads": 50, "seed": 11}
+    first = client.post("/api/cards/random/batch", json=request)
+    assert first.status_code == 200
+    assert first.headers["content-type"].startswith("application/x-ndjson")
+    assert first.text == client.post("/api/cards/random/batch", json=request).text
+    assert len(first.text.splitlines()) == 50
+
+    assert client.post("/api/cards/random/batch", json={**request, "count": 79}).status_code == 400
+    too_many = {**request, "format": "full", "spreads": 10_001}
+    assert client.post("/api/cards/random/batch", json=too_many).status_code == 400
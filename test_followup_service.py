@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from services import followup_service
+from services.followup_service import fetch_followup_history, save_followup_turn
+from services.prompts import estimate_tokens
+
+
+async def _insert_turns(db, reading_id, count, size=40):
+    start = datetime.utcnow() - timedelta(minutes=count)
+    await db.reading_followups.insert_many([
+        {"reading_id": reading_id, "session_id": "s", "question": f"q{i}".ljust(size, "?"),
+         "answer": f"a{i}".ljust(size, "."), "created_at": start + timedelta(minutes=i)}
+        for i in range(count)
+    ])
+
+
+def test_history_keeps_latest_turns_within_token_budget(db):
+    turn_tokens = estimate_tokens("q".ljust(40)) + estimate_tokens("a".ljust(40))
+
+    async def scenario():
+        await _insert_turns(db, "r1", 6)
+        await _insert_turns(db, "r2", 3)
+        return await fetch_followup_history(db, "r1", token_budget=3 * turn_tokens + 1)
+
+    history = asyncio.run(scenario())
+    # Новейшие вопросы, уложенные в бюджет, в хронологическом порядке
+    assert [turn["question"][:2] for turn in history] == ["q3", "q4", "q5"]
+    assert set(history[0]) == {"question", "answer"}
+
+
+def test_saved_turns_are_scoped_to_reading(db):
+    async def scenario():
+        await save_followup_turn(db, "r1", "s", "Когда?", "Скоро.")
+        await save_followup_turn(db, "r2", "s", "Где?", "Рядом.")
+        return await fetch_followup_history(db, "r1")
+
+    assert asyncio.run(scenario()) == [{"question": "Когда?", "answer": "Скоро."}]
+
+
+def test_history_is_empty_when_latest_turn_exceeds_budget(db):
+    async def scenario():
+        await _insert_turns(db, "r1", 2, size=400)
+        return await fetch_followup_history(db, "r1", token_budget=50)
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_history_defaults_to_configured_budget_and_turn_limit(db, monkeypatch):
+    monkeypatch.setattr(followup_service, "MAX_FOLLOWUP_TURNS", 4)
+
+    async def scenario():
+        await _insert_turns(db, "r1", 6, size=10)
+        return await fetch_followup_history(db, "r1")
+
+    history = asyncio.run(scenario())
+    assert [turn["answer"][:2] for turn in history] == ["a2", "a3", "a4", "a5"]
+    assert sum(estimate_tokens(t["question"]) + estimate_tokens(t["answer"]) for t in history) \
+        <= followup_service.FOLLOWUP_HISTORY_TOKENS
@@ -0,0 +1,51 @@
+import uuid
+
+from services.deck import get_deck
+
+
+def _save(client, session: str) -> None:
+    card = {**get_deck().get(1).to_dict(), "reversed": False, "position": "Ответ"}
+    response = client.post("/api/reading/save", json={
+        "spread_type": "single",
+        "cards": [card],
+        "interpretation": "Карты говорят о переменах.",
+        "user_session": session,
+    })
+    assert response.status_code == 200
+
+
+def test_history_etag_and_not_modified(client):
+    session = f"test_{uuid.uuid4()}"
+    _save(client, session)
+
+    first = client.get("/api/reading/history", params={"session": session})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert len(first.json()["readings"]) == 1
+
+    cached = client.get("/api/reading/history", params={"session": session}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    # Несколько тегов в заголовке, как шлют прокси
+    listed = client.get("/api/reading/history", params={"session": session},
+                        headers={"If-None-Match": f'"other", {etag}'})
+    assert listed.status_code == 304
+
+
+def test_history_etag_changes_after_save(client):
+    session = f"test_{uuid.uuid4()}"
+    _save(client, session)
+    etag = client.get("/api/reading/history", params={"session": session}).headers["ETag"]
+
+    _save(client, session)
+    response = client.get("/api/reading/history", params={"session": session}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()["readings"]) == 2
+
+
+def test_history_rejects_bad_cursor(client):
+    response = client.get("/api/reading/history", params={"session": "s", "cursor": "не-курсор"})
+    assert response.status_code == 400
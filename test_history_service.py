@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.history_service import (
+    READING_FIELDS,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    ensure_history_indexes,
+    fetch_history_page,
+)
+
+
+def _document(index: int, session: str = "s1") -> dict:
+    return {
+        "id": f"r{index:02d}",
+        "session_id": session,
+        "spread_type": "single",
+        "question": None,
+        "cards": [{"card_id": 1, "reversed": False, "position": "Ответ"}],
+        "interpretation": f"текст {index}",
+        # Пары гаданий с одинаковым временем: порядок внутри пары задаёт id
+        "created_at": datetime(2024, 3, 1) + timedelta(minutes=index // 2),
+        "schema_version": 2,
+        "prompt_version": "v1",
+    }
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 17, 12, 30, 45, 123000)
+    cursor = encode_cursor(created_at, "reading-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "reading-1")
+
+
+@pytest.mark.parametrize("cursor", ["", "не-base64", "e30", encode_cursor(datetime(2024, 1, 1), "x")[:-3]])
+def test_cursor_rejects_garbage(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_pages_cover_session_once_in_order(db):
+    async def scenario():
+        await ensure_history_indexes(db)
+        await db.readings.insert_many([_document(index) for index in range(7)] + [_document(99, "s2")])
+        pages, cursor = [], None
+        while True:
+            page = await fetch_history_page(db, "s1", limit=3, cursor=cursor)
+            pages.append(page["readings"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = asyncio.run(scenario())
+    assert [len(page) for page in pages] == [3, 3, 1]
+    ids = [reading["id"] for page in pages for reading in page]
+    assert ids == [f"r{index:02d}" for index in range(6, -1, -1)]
+
+
+def test_full_view_returns_contract_fields_only(db):
+    async def scenario():
+        await db.readings.insert_one(_document(1))
+        return (await fetch_history_page(db, "s1"))["readings"][0]
+
+    reading = asyncio.run(scenario())
+    assert tuple(reading) == READING_FIELDS
+    assert reading["cards"][0]["id"] == 1 and "card_id" not in reading["cards"][0]
+
+
+def test_reading_route_hides_internal_fields(client, db):
+    asyncio.run(db.readings.insert_one(_document(1)))
+    response = client.get("/api/reading/r01", params={"session": "s1"})
+    assert response.status_code == 200
+    assert set(response.json()) == set(READING_FIELDS)
+    assert client.get("/api/reading/r01", params={"session": "s2"}).status_code == 404
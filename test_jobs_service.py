@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from services import jobs_service
+from services.jobs_service import JOB_DONE, JOB_QUEUED, JOB_RUNNING, ReadingJobQueue
+
+JOB_BODY = {"spread_type": "three", "question": "Что меня ждёт?", "cards": [{"id": 1}, {"id": 2, "reversed": True}, {"id": 3}]}
+
+
+def _queue(db, **kwargs) -> ReadingJobQueue:
+    """Очередь без воркеров: задания выполняются явным вызовом _run"""
+    queue = ReadingJobQueue(**kwargs)
+    queue._db = db
+    queue._queue = asyncio.Queue()
+    return queue
+
+
+def _job(job_id, status, **fields):
+    now = datetime.utcnow()
+    return {"_id": job_id, "status": status, "spread_type": "single", "question": None, "cards": [],
+            "request_hash": job_id, "attempts": 0, "created_at": now, "queued_at": now,
+            "expires_at": now + timedelta(hours=1), **fields}
+
+
+def test_idempotency_key_reuse_returns_same_job_and_conflicts_on_other_body(client):
+    headers = {"Idempotency-Key": "reading-42"}
+    first = client.post("/api/reading/jobs", json=JOB_BODY, headers=headers)
+    repeat = client.post("/api/reading/jobs", json=JOB_BODY, headers=headers)
+    assert first.status_code == repeat.status_code == 202
+    assert repeat.json()["job_id"] == first.json()["job_id"]
+
+    conflict = client.post("/api/reading/jobs", json=dict(JOB_BODY, question="Другой вопрос"), headers=headers)
+    assert conflict.status_code == 409
+
+
+def test_reclaim_requeues_running_jobs_with_expired_lease(db):
+    async def scenario():
+        queue = _queue(db, lease_seconds=60)
+        stale = datetime.utcnow() - timedelta(seconds=120)
+        await db.reading_jobs.insert_many([
+            _job("stale", JOB_RUNNING, owner="dead", attempts=1, heartbeat_at=stale),
+            _job("alive", JOB_RUNNING, owner="live", attempts=1, heartbeat_at=datetime.utcnow()),
+        ])
+        reclaimed = await queue.reclaim_stale()
+        again = await queue.reclaim_stale()
+        return queue, reclaimed, again, await db.reading_jobs.find_one({"_id": "stale"}), \
+            await db.reading_jobs.find_one({"_id": "alive"})
+
+    queue, reclaimed, again, stale, alive = asyncio.run(scenario())
+    assert (reclaimed, again) == (1, 0)
+    assert stale["status"] == JOB_QUEUED and "owner" not in stale
+    assert alive["status"] == JOB_RUNNING
+    assert queue._queue.qsize() == 1
+
+
+def test_reclaim_picks_up_orphaned_queued_jobs(db):
+    async def scenario():
+        queue = _queue(db, lease_seconds=60)
+        now = datetime.utcnow()
+        old = now - timedelta(seconds=120)
+        await db.reading_jobs.insert_many([
+            _job("orphaned", JOB_QUEUED, created_at=old, queued_at=old),
+            _job("legacy", JOB_QUEUED, created_at=old, queued_at=None),
+            _job("due", JOB_QUEUED, not_before=now - timedelta(seconds=1)),
+            _job("fresh", JOB_QUEUED),
+            _job("delayed", JOB_QUEUED, created_at=old, queued_at=old, not_before=now + timedelta(seconds=30)),
+        ])
+        reclaimed = await queue.reclaim_stale()
+        # Задания уже в локальной очереди второй раз не ставятся
+        again = await queue.reclaim_stale()
+        enqueued = [queue._queue.get_nowait() for _ in range(queue._queue.qsize())]
+        return reclaimed, again, enqueued
+
+    reclaimed, again, enqueued = asyncio.run(scenario())
+    assert (reclaimed, again) == (3, 0)
+    assert sorted(enqueued) == ["due", "legacy", "orphaned"]
+
+
+def test_reclaimed_job_is_finished_only_by_its_current_run(db, monkeypatch):
+    class SlowService:
+        """Первый запуск зависает до сигнала, повторный отвечает сразу"""
+        calls = 0
+        release = None
+
+        async def generate_reading(self, cards, spread_type, question=None):
+            SlowService.calls += 1
+            if SlowService.calls == 1:
+                await SlowService.release.wait()
+                return {"interpretation": "устаревший", "advice": "устаревший"}
+            return {"interpretation": "новый", "advice": "новый"}
+
+    monkeypatch.setattr(jobs_service, "AITarotService", SlowService)
+
+    async def scenario():
+        SlowService.release = asyncio.Event()
+        stalled, healthy = _queue(db, lease_seconds=60), _queue(db, lease_seconds=60)
+        await db.reading_jobs.insert_one(_job("job", JOB_QUEUED))
+
+        first_run = asyncio.ensure_future(stalled._run("job"))
+        while SlowService.calls == 0:
+            await asyncio.sleep(0)
+        # Первый процесс перестал продлевать аренду
+        await db.reading_jobs.update_one({"_id": "job"}, {"$set": {"heartbeat_at": datetime.utcnow() - timedelta(seconds=120)}})
+        assert await healthy.reclaim_stale() == 1
+        await healthy._run(healthy._queue.get_nowait())
+
+        SlowService.release.set()
+        await first_run
+        return stalled, healthy, await db.reading_jobs.find_one({"_id": "job"})
+
+    stalled, healthy, job = asyncio.run(scenario())
+    assert job["status"] == JOB_DONE
+    assert job["attempts"] == 2
+    assert job["result"]["interpretation"] == "новый"
+    assert (healthy.completed, stalled.completed) == (1, 0)
+    assert not stalled._running
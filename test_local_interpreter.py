@@ -0,0 +1,58 @@
+import pytest
+
+from services.local_interpreter import (
+    ADVICE_CLOSING,
+    REVERSED_SUFFIX,
+    TONE_MIXED,
+    TONE_REVERSED,
+    TONE_UPRIGHT,
+    LocalInterpretationEngine,
+)
+
+engine = LocalInterpretationEngine()
+
+
+def test_interpretation_is_deterministic(make_cards):
+    cards = make_cards((1, False, None), (2, True, None), (3, False, None))
+    assert engine.interpret(cards, "three", "Что дальше?") == engine.interpret(cards, "three", "Что дальше?")
+
+
+def test_interpretation_mentions_question_positions_and_cards(make_cards):
+    cards = make_cards((1, False, None), (2, True, None), (3, False, None))
+    result = engine.interpret(cards, "three", "  Что дальше?  ")
+    interpretation = result["interpretation"]
+    assert interpretation.startswith("Вы спросили: «Что дальше?».")
+    for position, card in zip(("Прошлое", "Настоящее", "Будущее"), cards):
+        assert f"{position} - {card.name}" in interpretation
+    assert f"{cards[1].name}{REVERSED_SUFFIX}: {cards[1].reversed_meaning}" in interpretation
+    assert f"{cards[0].name}: {cards[0].upright_meaning}" in interpretation
+    assert result["advice"].endswith(ADVICE_CLOSING)
+
+
+def test_card_position_takes_precedence_over_spread(make_cards):
+    cards = make_cards((1, False, "Своя позиция"))
+    assert "Своя позиция - " in engine.interpret(cards, "single")["interpretation"]
+
+
+@pytest.mark.parametrize("reversed_flags, tone", [
+    ((False, False, False), TONE_UPRIGHT),
+    ((True, False, False), TONE_UPRIGHT),
+    ((True, True, False), TONE_REVERSED),
+    ((True, False, False, True, False, True), TONE_MIXED),
+    ((True, True, True), TONE_REVERSED),
+])
+def test_tone_follows_share_of_reversed_cards(make_cards, reversed_flags, tone):
+    cards = make_cards(*((index + 1, flag, None) for index, flag in enumerate(reversed_flags)))
+    assert engine.interpret(cards, "three")["interpretation"].endswith(tone)
+
+
+def test_advice_follows_last_card(make_cards):
+    upright = make_cards((1, False, None), (5, False, None))
+    reversed_last = make_cards((1, False, None), (5, True, None))
+    assert f"«{upright[-1].name}»: " in engine.interpret(upright, "three")["advice"]
+    assert "в перевёрнутом положении" in engine.interpret(reversed_last, "three")["advice"]
+    assert f"«{reversed_last[-1].keywords[0]}»" in engine.interpret(reversed_last, "three")["advice"]
+
+
+def test_empty_spread():
+    assert engine.interpret([], "three") == {"interpretation": "", "advice": ADVICE_CLOSING}
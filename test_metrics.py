@@ -0,0 +1,56 @@
+import pytest
+
+from services.metrics import MetricsRegistry
+
+
+def test_render_writes_help_and_type_before_samples():
+    registry = MetricsRegistry()
+    requests = registry.counter("test_requests_total", "Запросы", ("route", "status"))
+    registry.gauge("test_queue_depth", "Глубина очереди", lambda: 3)
+    requests.inc("/api/cards", "200")
+    requests.inc("/api/cards", "200", amount=2)
+
+    assert registry.render() == (
+        "# HELP test_requests_total Запросы\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{route="/api/cards",status="200"} 3\n'
+        "# HELP test_queue_depth Глубина очереди\n"
+        "# TYPE test_queue_depth gauge\n"
+        "test_queue_depth 3\n"
+    )
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_errors_total", "Ошибки", ("message",))
+    counter.inc('путь "C:\\tmp"\nстрока')
+
+    assert 'test_errors_total{message="путь \\"C:\\\\tmp\\"\\nстрока"} 1' in registry.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Время", ("route",), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.observe(value, "/a")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP test_latency_seconds Время", "# TYPE test_latency_seconds histogram"]
+    # Границы сортируются; значение на границе попадает в её корзину (le - включительно)
+    assert lines[2:] == [
+        'test_latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'test_latency_seconds_bucket{route="/a",le="0.5"} 3',
+        'test_latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'test_latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'test_latency_seconds_sum{route="/a"} 2.45',
+        'test_latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_failing_gauge_is_skipped_and_duplicates_are_rejected():
+    registry = MetricsRegistry()
+    registry.gauge("test_broken", "Сломанная метрика", lambda: 1 / 0)
+    assert registry.render() == "# HELP test_broken Сломанная метрика\n# TYPE test_broken gauge\n"
+
+    with pytest.raises(ValueError):
+        registry.gauge("test_broken", "Повтор", lambda: 0)
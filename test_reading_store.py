@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from models.tarot import Reading
+from services.deck import get_deck
+from services.reading_store import (
+    READING_SCHEMA_VERSION,
+    UnusableReading,
+    build_reading_document,
+    compact_card,
+    reading_cards,
+    rehydrate_card,
+    rehydrate_reading,
+)
+
+
+def _full_card(card_id: int, reversed_: bool = False, position: str = None) -> dict:
+    return {**get_deck().get(card_id).to_dict(), "reversed": reversed_, "position": position}
+
+
+def test_compact_card_round_trip():
+    card = _full_card(5, True, "Будущее")
+    compact = compact_card(card)
+    assert compact == {"card_id": 5, "reversed": True, "position": "Будущее"}
+    assert rehydrate_card(compact) == card
+
+
+def test_compact_card_keeps_unknown_cards_whole():
+    renamed = {**_full_card(5), "name": "Своя карта"}
+    unknown = {"id": 10_000, "name": "Нет в колоде", "reversed": False, "position": None}
+    assert compact_card(renamed) == renamed
+    assert compact_card(unknown) == unknown
+    assert rehydrate_card(unknown) == unknown
+
+
+def test_reading_document_round_trip():
+    cards = [_full_card(1, False, "Прошлое"), _full_card(2, True, "Настоящее")]
+    reading = Reading(session_id="s1", spread_type="three", cards=cards, interpretation="текст",
+                      created_at=datetime(2024, 3, 1))
+    document = build_reading_document(reading)
+    assert document["schema_version"] == READING_SCHEMA_VERSION
+    assert all(set(card) == {"card_id", "reversed", "position"} for card in document["cards"])
+
+    restored = rehydrate_reading(dict(document))
+    assert "schema_version" not in restored
+    assert restored["cards"] == cards
+
+
+def test_legacy_documents_are_returned_as_stored():
+    legacy = {"id": "r1", "cards": [_full_card(3)]}
+    assert rehydrate_reading(dict(legacy)) == legacy
+
+
+def test_reading_cards_take_deck_text():
+    deck = get_deck()
+    # Старый документ с изменённым текстом карты: для промпта берётся текст колоды
+    cards = reading_cards({"cards": [
+        {**_full_card(1, True, "Прошлое"), "upright_meaning": "подменённый текст"},
+        {"card_id": 2, "reversed": False, "position": "Настоящее"},
+    ]})
+    assert [(card.id, card.reversed, card.position) for card in cards] == [(1, True, "Прошлое"), (2, False, "Настоящее")]
+    assert cards[0].upright_meaning == deck.get(1).upright_meaning
+
+
+@pytest.mark.parametrize("reading", [{"cards": []}, {"cards": [{"card_id": 10_000, "reversed": False}]}])
+def test_unusable_readings(reading):
+    with pytest.raises(UnusableReading):
+        reading_cards(reading)
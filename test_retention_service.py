@@ -0,0 +1,121 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta
+
+from bson import json_util
+from typer.testing import CliRunner
+
+from services import retention_service
+from services.history_cache import HistoryCache
+from services.retention_service import LEASE_ID, ReadingArchiver, recount_sessions
+
+
+def _reading(reading_id, session, age_days=0.0):
+    return {"_id": reading_id, "id": reading_id, "session_id": session, "spread_type": "single",
+            "created_at": datetime.utcnow() - timedelta(days=age_days)}
+
+
+async def _archiver(db, **kwargs) -> ReadingArchiver:
+    archiver = ReadingArchiver(**{"hot_per_session": 100, "max_age_days": 30, "batch_size": 2, "pause": 0, **kwargs})
+    await archiver.attach(db)
+    return archiver
+
+
+async def _setup(db, monkeypatch, readings):
+    history = HistoryCache()
+    monkeypatch.setattr(retention_service, "history_cache", history)
+    await history.attach(db)
+    await db.readings.insert_many(readings)
+    await recount_sessions(db)
+
+
+async def _ids(collection):
+    return sorted(doc["_id"] for doc in await collection.find({}, {"_id": 1}).to_list(length=None))
+
+
+def test_expired_readings_move_to_archive_collection(db, monkeypatch):
+    async def scenario():
+        await _setup(db, monkeypatch, [
+            _reading("old-1", "s1", 40), _reading("old-2", "s1", 35), _reading("old-3", "s2", 31),
+            _reading("new-1", "s1", 1),
+        ])
+        archiver = await _archiver(db)
+        moved = await archiver.run_once()
+        session = await db.session_versions.find_one({"_id": "s1"})
+        return archiver, moved, await _ids(db.readings), await _ids(db.readings_archive), session
+
+    archiver, moved, hot, archived, session = asyncio.run(scenario())
+    assert moved == archiver.archived == 3
+    assert hot == ["new-1"]
+    assert archived == ["old-1", "old-2", "old-3"]
+    # Счётчик сессии уменьшен ровно на перенесённые гадания
+    assert session["readings"] == 1
+
+
+def test_readings_over_session_limit_are_archived_oldest_first(db, monkeypatch):
+    async def scenario():
+        await _setup(db, monkeypatch, [_reading(f"r{i}", "s1", 10 - i) for i in range(5)] + [_reading("other", "s2", 5)])
+        archiver = await _archiver(db, hot_per_session=2)
+        moved = await archiver.run_once()
+        return moved, await _ids(db.readings), await _ids(db.readings_archive)
+
+    moved, hot, archived = asyncio.run(scenario())
+    assert moved == 3
+    assert hot == ["other", "r3", "r4"]
+    assert archived == ["r0", "r1", "r2"]
+
+
+def test_file_target_appends_gzip_members(db, monkeypatch, tmp_path):
+    async def scenario():
+        await _setup(db, monkeypatch, [_reading(f"r{i}", "s1", 60 + i) for i in range(3)])
+        archiver = await _archiver(db, target="file", archive_dir=str(tmp_path))
+        moved = await archiver.run_once()
+        return moved, await db.readings.count_documents({}), await db.readings_archive.count_documents({})
+
+    moved, hot, in_collection = asyncio.run(scenario())
+    assert (moved, hot, in_collection) == (3, 0, 0)
+    [path] = tmp_path.iterdir()
+    # batch_size=2: две пачки - два gzip-члена одного файла
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        documents = [json_util.loads(line) for line in archive]
+    assert sorted(doc["_id"] for doc in documents) == ["r0", "r1", "r2"]
+    assert isinstance(documents[0]["created_at"], datetime)
+
+
+def test_lease_held_by_another_archiver_blocks_the_pass(db, monkeypatch):
+    async def scenario():
+        await _setup(db, monkeypatch, [_reading("old", "s1", 40)])
+        await db.leases.insert_one({"_id": LEASE_ID, "owner": "other-host:1:abcd",
+                                    "expires_at": datetime.utcnow() + timedelta(minutes=5)})
+        archiver = await _archiver(db)
+        blocked = await archiver.run_once()
+
+        # Аренда истекла - проход выполняет следующий архиватор и отпускает аренду
+        await db.leases.update_one({"_id": LEASE_ID}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+        moved = await archiver.run_once()
+        lease = await db.leases.find_one({"_id": LEASE_ID})
+        return archiver, blocked, moved, lease
+
+    archiver, blocked, moved, lease = asyncio.run(scenario())
+    assert (blocked, moved) == (0, 1)
+    assert archiver.runs == 1
+    assert lease["owner"] == archiver._owner
+    assert lease["expires_at"] <= datetime.utcnow()
+
+
+def test_pass_stops_outside_window(db, monkeypatch):
+    async def scenario():
+        await _setup(db, monkeypatch, [_reading("old", "s1", 40)])
+        hour = datetime.utcnow().hour
+        archiver = await _archiver(db, window=((hour + 1) % 24, (hour + 2) % 24))
+        return await archiver.run_once(), await db.readings.count_documents({})
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_cli_rejects_unknown_target():
+    from archive_readings import app
+
+    result = CliRunner().invoke(app, ["--target", "s3"])
+    assert result.exit_code == 2
+    assert "s3" in result.output
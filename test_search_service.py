@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.search_service import make_snippet, query_stems, search_readings
+
+FILLER = "Карты предлагают спокойно оглядеться вокруг и не торопить события. "
+
+
+def _highlighted(snippet):
+    return [snippet["text"][start:end] for start, end in snippet["highlights"]]
+
+
+def test_query_stems_skip_excluded_words_and_normalize():
+    assert query_stems("Любовь -работа") == query_stems("любовь")
+    assert query_stems("ёлка") == query_stems("елка")
+    assert len(query_stems("перемены, удача!")) == 2
+    assert query_stems("-всё") == []
+
+
+def test_short_text_is_returned_whole_with_offsets():
+    text = "Перемены близко. Жди перемен и удачи."
+    snippet = make_snippet(text, query_stems("перемены"))
+    assert snippet["text"] == text
+    assert snippet["highlights"] == [[0, 8], [21, 28]]
+    assert _highlighted(snippet) == ["Перемены", "перемен"]
+
+
+def test_long_text_snippet_surrounds_first_match_without_cutting_words():
+    text = FILLER * 5 + "Впереди большие перемены в работе. " + FILLER * 5
+    snippet = make_snippet(text, query_stems("перемены"), size=120)
+
+    assert snippet["text"].startswith("…") and snippet["text"].endswith("…")
+    body = snippet["text"][1:-1]
+    assert len(body) <= 120
+    # Края фрагмента - границы слов исходного текста
+    offset = text.index(body)
+    assert text[offset - 1] == " " and text[offset + len(body)] == " "
+    # Смещения считаются с учётом многоточия в начале
+    assert _highlighted(snippet) == ["перемены"]
+
+
+def test_long_text_without_match_starts_from_beginning():
+    text = FILLER * 10
+    snippet = make_snippet(text, query_stems("звезда"), size=100)
+    assert snippet["highlights"] == []
+    assert text.startswith(snippet["text"][:-1])
+    assert snippet["text"].endswith("…")
+
+
+def test_empty_interpretation_gives_empty_snippet():
+    assert make_snippet(None, query_stems("удача")) == {"text": "", "highlights": []}
+
+
+class _Cursor:
+    """Курсор с результатом $text: mongomock не поддерживает текстовый поиск"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.skipped = 0
+
+    def sort(self, keys):
+        return self
+
+    def skip(self, count):
+        self.skipped = count
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[self.skipped:self.skipped + count]
+        return self
+
+    async def to_list(self, length):
+        return self.documents
+
+
+def test_search_results_are_paged_and_highlighted():
+    documents = [
+        {"id": f"r{i}", "spread_type": "single", "question": "Ждут ли меня перемены?",
+         "interpretation": "Перемены уже начались.", "score": 2.0 - i / 10}
+        for i in range(5)
+    ]
+    queries = []
+
+    def find(query, projection):
+        queries.append(query)
+        return _Cursor(documents)
+
+    db = SimpleNamespace(readings=SimpleNamespace(find=find))
+    first = asyncio.run(search_readings(db, "s1", "перемены", limit=2))
+    last = asyncio.run(search_readings(db, "s1", "перемены", limit=2, page=3))
+
+    assert queries[0]["session_id"] == "s1"
+    assert [result["id"] for result in first["results"]] == ["r0", "r1"]
+    assert first["next_page"] == 2
+    assert [result["id"] for result in last["results"]] == ["r4"]
+    assert last["next_page"] is None
+    result = first["results"][0]
+    assert result["question"]["highlights"] == [[13, 21]]
+    assert result["snippet"] == {"text": "Перемены уже начались.", "highlights": [[0, 8]]}
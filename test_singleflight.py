@@ -0,0 +1,64 @@
+import asyncio
+
+from services.singleflight import SingleFlight
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    async def scenario():
+        flight = SingleFlight()
+        started = 0
+
+        async def work():
+            nonlocal started
+            started += 1
+            await asyncio.sleep(0.01)
+            return "результат"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(10)))
+        return flight, started, results
+
+    flight, started, results = asyncio.run(scenario())
+    assert started == 1
+    assert results == ["результат"] * 10
+    assert flight.stats() == {"calls": 1, "coalesced": 9, "in_flight": 0}
+
+
+def test_singleflight_delivers_error_to_every_waiter_and_forgets_key():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("LLM недоступен")
+
+        results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+        # После ошибки ключ свободен: следующий вызов выполняется заново
+        retry = await flight.do("key", lambda: asyncio.sleep(0, result="ok"))
+        return flight, results, retry
+
+    flight, results, retry = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == "ok"
+    assert flight.calls == 2
+
+
+def test_singleflight_cancelled_waiter_does_not_cancel_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return 42
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return first, await second
+
+    first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == 42
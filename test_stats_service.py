@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from services.deck import get_deck
+from services.stats_service import (
+    GLOBAL_SCOPE,
+    STATS_COLLECTION,
+    fetch_stats,
+    reading_increments,
+    record_readings,
+    session_scope,
+    stats_view,
+)
+
+
+def test_reading_increments_counts_cards_and_spread():
+    document = {
+        "spread_type": "three",
+        "created_at": datetime(2024, 3, 1, 10, 0),
+        "cards": [
+            {"card_id": 1, "reversed": True, "position": "Прошлое"},
+            {"id": 2, "name": "Маг", "reversed": False},
+            {"id": "битая"},
+        ],
+    }
+    assert reading_increments(document) == {
+        "readings": 1,
+        "spreads.three": 1,
+        "days.2024-03-01": 1,
+        "cards_total": 2,
+        "cards.1": 1,
+        "cards.2": 1,
+        "reversed_total": 1,
+        "reversed.1": 1,
+    }
+
+
+@pytest.mark.parametrize("spread_type", ["bogus", "a.b", "$where", "", None])
+def test_reading_increments_unknown_spread_is_other(spread_type):
+    increments = reading_increments({"spread_type": spread_type, "created_at": datetime(2024, 3, 1), "cards": []})
+    assert [key for key in increments if key.startswith("spreads.")] == ["spreads.other"]
+
+
+def test_stats_view_rates_and_top_cards():
+    today = datetime.utcnow().date().isoformat()
+    view = stats_view({
+        "readings": 4,
+        "cards_total": 8,
+        "reversed_total": 2,
+        "cards": {"1": 5, "2": 3},
+        "reversed": {"1": 2},
+        "spreads": {"three": 3, "single": 1},
+        "days": {today: 4},
+    }, days=3)
+
+    assert view["reversal_rate"] == 0.25
+    assert view["top_cards"][0] == {"id": 1, "name": get_deck().get(1).name, "count": 5, "reversed_rate": 0.4}
+    assert view["top_cards"][1]["reversed_rate"] == 0.0
+    assert view["spreads"] == {"three": {"count": 3, "share": 0.75}, "single": {"count": 1, "share": 0.25}}
+    assert [day["readings"] for day in view["readings_per_day"]] == [0, 0, 4]
+    assert view["readings_per_day"][-1]["date"] == today
+
+
+def test_empty_stats_view_has_zero_rates():
+    view = stats_view({}, days=1)
+    assert (view["readings"], view["reversal_rate"], view["top_cards"], view["spreads"]) == (0, 0.0, [], {})
+
+
+def test_record_readings_updates_global_and_session_scopes(db):
+    documents = [
+        {"session_id": "s1", "spread_type": "single", "created_at": datetime.utcnow(),
+         "cards": [{"card_id": 3, "reversed": True}]},
+        {"session_id": "s2", "spread_type": "three", "created_at": datetime.utcnow(),
+         "cards": [{"card_id": 3, "reversed": False}, {"card_id": 4, "reversed": False}]},
+    ]
+
+    async def scenario():
+        await record_readings(db, documents[:1])
+        await record_readings(db, documents[1:])
+        return (await fetch_stats(db, GLOBAL_SCOPE), await fetch_stats(db, session_scope("s1")),
+                await db[STATS_COLLECTION].find_one({"_id": GLOBAL_SCOPE}),
+                await db[STATS_COLLECTION].find_one({"_id": session_scope("s1")}))
+
+    total, session, global_document, session_document = asyncio.run(scenario())
+    assert (total["readings"], total["cards_drawn"]) == (2, 3)
+    assert total["top_cards"][0]["id"] == 3 and total["top_cards"][0]["reversed_rate"] == 0.5
+    assert (session["readings"], session["reversal_rate"]) == (1, 1.0)
+    # Срок жизни продлевается только у статистики сессии
+    assert "expires_at" not in global_document
+    assert session_document["expires_at"] > datetime.utcnow()
@@ -0,0 +1,74 @@
+import asyncio
+import math
+
+import pytest
+
+from services import ai_service
+from services.metrics import LLM_MISSING_ADVICE
+from services.prompts import CHARS_PER_TOKEN, prompt_library
+from services.stream_parser import DEFAULT_ADVICE, ReadingStreamParser
+
+
+def _parse(chunks):
+    parser = ReadingStreamParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    tail, result = parser.finish()
+    return events + tail, result, parser
+
+
+def test_stream_parser_splits_sections():
+    events, result, parser = _parse(["ИНТЕРПРЕТАЦИЯ:\nКарты ", "говорят.\n\nСОВЕТ:\nЖдите."])
+    assert result == {"interpretation": "Карты говорят.", "advice": "Ждите."}
+    assert parser.advice_found
+    assert {section for section, _ in events} == {"interpretation", "advice"}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5])
+def test_stream_parser_marker_split_between_chunks(size):
+    text = "ИНТЕРПРЕТАЦИЯ: Перемены близко. СОВЕТ: Будьте готовы."
+    events, result, _ = _parse([text[i:i + size] for i in range(0, len(text), size)])
+    assert result == {"interpretation": "Перемены близко.", "advice": "Будьте готовы."}
+    # Маркеры не попадают в поток событий
+    streamed = "".join(text for _, text in events)
+    assert "СОВЕТ:" not in streamed and "ИНТЕРПРЕТАЦИЯ:" not in streamed
+
+
+def test_stream_parser_without_advice_marker():
+    events, result, parser = _parse(["Просто текст ", "без разделов, СОВ"])
+    assert result == {"interpretation": "Просто текст без разделов, СОВ", "advice": DEFAULT_ADVICE}
+    assert not parser.advice_found
+    assert all(section == "interpretation" for section, _ in events)
+
+
+def test_stream_reading_reports_truncated_response(monkeypatch, make_cards):
+    # Ответ без раздела СОВЕТ ровно на пороге обрезки: порог достигается
+    # только с учётом всего текста, включая маркер раздела
+    threshold = math.ceil(prompt_library.response_budget("single") * 0.9)
+    marker = "ИНТЕРПРЕТАЦИЯ:\n"
+    response = marker + "x" * ((threshold - 1) * CHARS_PER_TOKEN - len(marker))
+
+    class StreamingChat:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def with_model(self, provider, model):
+            return self
+
+        async def stream_message(self, user_message):
+            for start in range(0, len(response), 500):
+                yield response[start:start + 500]
+
+    monkeypatch.setattr(ai_service, "LlmChat", StreamingChat)
+    before = LLM_MISSING_ADVICE._values.get(("single", "truncated"), 0)
+
+    async def scenario():
+        service = ai_service.AITarotService()
+        cards = make_cards((3, False, "Ответ"))
+        return [event async for event in service.stream_reading(cards, "single", "обрезанный ответ?")]
+
+    events = asyncio.run(scenario())
+    assert events[-1][0] == "done"
+    assert events[-1][1]["advice"] == DEFAULT_ADVICE
+    assert LLM_MISSING_ADVICE._values.get(("single", "truncated"), 0) == before + 1
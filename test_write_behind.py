@@ -0,0 +1,176 @@
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from services.history_cache import HistoryCache
+from services.history_service import ensure_history_indexes
+from services.stats_service import GLOBAL_SCOPE, STATS_COLLECTION
+from services import write_behind
+from services.write_behind import ReadingWriteBuffer
+
+
+def _reading(reading_id: str, session: str = "s1") -> dict:
+    return {
+        "id": reading_id,
+        "session_id": session,
+        "spread_type": "single",
+        "cards": [{"card_id": 1, "reversed": False, "position": "Ответ"}],
+        "interpretation": "текст",
+        "advice": "совет",
+        "created_at": datetime(2024, 3, 1, 12, 0),
+    }
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+class UnavailableReadings:
+    async def insert_many(self, documents, ordered=True):
+        raise ConnectionError("MongoDB недоступна")
+
+
+class UnavailableDatabase:
+    readings = UnavailableReadings()
+
+
+class RejectingReadings:
+    """Пишет пачку, кроме документов с invalid=True (как ошибка валидации схемы)"""
+
+    def __init__(self, readings):
+        self.readings = readings
+
+    async def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            if document.get("invalid"):
+                errors.append({"index": index, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                await self.readings.insert_one(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+
+class RejectingDatabase:
+    def __init__(self, db):
+        self.db = db
+        self.readings = RejectingReadings(db.readings)
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+
+async def _global_readings(db) -> int:
+    document = await db[STATS_COLLECTION].find_one({"_id": GLOBAL_SCOPE}) or {}
+    return document.get("readings", 0)
+
+
+def test_duplicates_are_skipped_and_not_counted_twice(db, tmp_path):
+    async def scenario():
+        await ensure_history_indexes(db)
+        await db.readings.insert_one(_reading("r1"))
+        writer = ReadingWriteBuffer(enabled=True, batch_size=10, spill_path=str(tmp_path / "spill.ndjson"))
+        writer._db = db
+        writer.enqueue(_reading("r1"))
+        writer.enqueue(_reading("r2"))
+        written = await writer.flush()
+        return writer, written, await db.readings.count_documents({}), await _global_readings(db)
+
+    writer, written, stored, counted = asyncio.run(scenario())
+    assert written == 2
+    assert stored == 2
+    # В статистику попадает только действительно новое гадание
+    assert counted == 1
+    assert writer.spilled == 0
+    assert not list(tmp_path.iterdir())
+
+
+def test_only_failed_documents_are_spilled(db, tmp_path, monkeypatch):
+    history = HistoryCache()
+    monkeypatch.setattr(write_behind, "history_cache", history)
+
+    async def scenario():
+        await history.attach(db)
+        writer = ReadingWriteBuffer(enabled=True, batch_size=10, spill_path=str(tmp_path / "spill.ndjson"))
+        writer._db = RejectingDatabase(db)
+        writer.enqueue(_reading("r1"))
+        writer.enqueue({**_reading("r2"), "invalid": True})
+        writer.enqueue(_reading("r3", "s2"))
+        written = await writer.flush()
+        return (writer, written, await _global_readings(db),
+                await history.version("s1"), await history.version("s2"))
+
+    writer, written, counted, version_s1, version_s2 = asyncio.run(scenario())
+    assert written == 2
+    # Записанные гадания сразу учтены в статистике и версиях истории
+    assert counted == 2
+    assert (version_s1, version_s2) == (1, 1)
+    assert writer.spilled == 1
+    spilled = (tmp_path / "spill.ndjson").read_text(encoding="utf-8")
+    assert '"r2"' in spilled and '"r1"' not in spilled and '"r3"' not in spilled
+
+
+def test_failed_batch_is_spilled_and_replayed_on_start(db, tmp_path):
+    spill_path = tmp_path / "spill.ndjson"
+
+    async def scenario():
+        await ensure_history_indexes(db)
+        failing = ReadingWriteBuffer(enabled=True, batch_size=2, spill_path=str(spill_path))
+        failing._db = UnavailableDatabase()
+        for index in range(3):
+            failing.enqueue(_reading(f"r{index}"))
+        while len(failing):
+            await failing.flush()
+
+        # Файл, не доигранный завершившимся воркером
+        leftover = ReadingWriteBuffer(spill_path=str(tmp_path / f"spill.ndjson.{_dead_pid()}.replay"))
+        leftover._spill([_reading("r2"), _reading("r3")])
+
+        writer = ReadingWriteBuffer(enabled=True, batch_size=2, spill_path=str(spill_path))
+        await writer.start(db)
+        await writer.stop()
+        ids = sorted(document["id"] for document in await db.readings.find({}, {"id": 1}).to_list(None))
+        return failing, writer, ids, await _global_readings(db)
+
+    failing, writer, ids, counted = asyncio.run(scenario())
+    assert failing.spilled == 3
+    assert ids == ["r0", "r1", "r2", "r3"]
+    # r2 есть и в файле сброса, и в файле прошлого запуска - учитывается один раз
+    assert counted == 4
+    assert not os.listdir(tmp_path)
+
+
+def test_replay_files_of_live_workers_are_left_alone(db, tmp_path):
+    live = tmp_path / f"spill.ndjson.{os.getppid()}.replay"
+
+    async def scenario():
+        ReadingWriteBuffer(spill_path=str(live))._spill([_reading("r1")])
+        writer = ReadingWriteBuffer(enabled=True, spill_path=str(tmp_path / "spill.ndjson"))
+        await writer.start(db)
+        await writer.stop()
+        return await db.readings.count_documents({})
+
+    assert asyncio.run(scenario()) == 0
+    assert os.listdir(tmp_path) == [live.name]
+
+
+def test_concurrent_claims_take_each_file_once(tmp_path, monkeypatch):
+    spill_path = tmp_path / "spill.ndjson"
+    ReadingWriteBuffer(spill_path=str(spill_path))._spill([_reading("r1")])
+    ReadingWriteBuffer(spill_path=str(tmp_path / f"spill.ndjson.{_dead_pid()}.replay"))._spill([_reading("r2")])
+
+    first = ReadingWriteBuffer(spill_path=str(spill_path))._claim_spill()
+    # Второй воркер - другой процесс
+    other_pid = _dead_pid()
+    monkeypatch.setattr(os, "getpid", lambda: other_pid)
+    second = ReadingWriteBuffer(spill_path=str(spill_path))._claim_spill()
+    assert len(first) == 2
+    # Файлы, забранные первым (живым) воркером, второму не достаются
+    assert second == []
+    assert sorted(os.listdir(tmp_path)) == sorted(path.name for path in first)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Пакетная генерация корпуса интерпретаций для карты дня и одной карты.
+
+Запуск из каталога backend:
+    python warmup_corpus.py --variants 3 --concurrency 8
+"""
+
+import asyncio
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / '.env')
+
+from services import database
+from services.ai_service import AITarotService
+from services.corpus_service import CORPUS_SPREADS, CorpusBuildFailed, build_corpus
+
+app = typer.Typer(help="Предгенерация интерпретаций для раскладов из одной карты")
+
+
+@app.command()
+def main(
+    variants: int = typer.Option(3, help="Количество вариантов на (расклад, карту, ориентацию)"),
+    concurrency: int = typer.Option(8, help="Максимум одновременных запросов к AI"),
+    spreads: str = typer.Option(",".join(CORPUS_SPREADS), help="Расклады через запятую"),
+    max_failure_rate: float = typer.Option(0.05, help="Допустимая доля неудачных генераций"),
+    retries: int = typer.Option(2, help="Повторы неудачных генераций перед активацией"),
+):
+    spread_types = tuple(spread.strip() for spread in spreads.split(",") if spread.strip())
+    unknown = [spread for spread in spread_types if spread not in CORPUS_SPREADS]
+    if unknown:
+        raise typer.BadParameter(f"Корпус поддерживает только {', '.join(CORPUS_SPREADS)}: {', '.join(unknown)}")
+
+    async def run():
+        db = database.connect()
+        ai_service = AITarotService()
+        try:
+            version = await build_corpus(db, ai_service.request_llm_reading, variants=variants,
+                                         concurrency=concurrency, spreads=spread_types,
+                                         max_failure_rate=max_failure_rate, retries=retries)
+        except CorpusBuildFailed as e:
+            typer.echo(f"{e}; активной остаётся прежняя версия", err=True)
+            raise typer.Exit(code=1)
+        finally:
+            database.close()
+        typer.echo(f"Корпус {version} собран и активирован")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    app()
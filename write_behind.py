@@ -0,0 +1,249 @@
+import asyncio
+import fcntl
+import os
+import uuid
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bson import json_util
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+from services.history_cache import history_cache
+from services.stats_service import record_readings
+
+load_dotenv()
+
+DUPLICATE_KEY = 11000
+
+
+class ReadingWriteBuffer:
+    """Отложенная запись гаданий (write-behind).
+
+    Сохранение подтверждается сразу, документ попадает в ограниченный
+    буфер в памяти, а фоновая задача пишет буфер пачками через
+    insert_many(ordered=False) - по размеру пачки или по таймеру.
+    Если MongoDB недоступна, пачка дописывается в локальный файл
+    (NDJSON), который переигрывается при следующем старте. При остановке
+    буфер сбрасывается целиком.
+
+    Файл сброса общий для воркеров: запись идёт под flock, а переигрывание
+    сначала атомарно переименовывает файл в свой (os.replace), поэтому
+    строки, дописанные другим воркером, не теряются. При частичной ошибке
+    пачки в файл уходят только незаписанные документы.
+    """
+
+    def __init__(self, enabled: bool = False, max_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, spill_path: str = "readings_spill.ndjson"):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = Path(spill_path)
+        self._buffer: deque = deque()
+        # Событие создаётся сразу: enqueue() может быть вызван до start()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Переигрывает файл сброса и запускает фоновую запись"""
+        if not self.enabled:
+            return
+        self._db = db
+        await self.replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и дописывает весь буфер"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._buffer:
+            await self.flush()
+
+    def enqueue(self, document: Dict) -> bool:
+        """Ставит документ в очередь записи; False - буфер переполнен"""
+        if len(self._buffer) >= self.max_size:
+            return False
+        self._buffer.append(document)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                await self.flush()
+                if len(self._buffer) < self.batch_size:
+                    break
+
+    async def _insert(self, documents: List[Dict]) -> List[Dict]:
+        """Пишет пачку и возвращает документы, которые записать не удалось"""
+        inserted, failed = documents, []
+        try:
+            await self._db.readings.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Повторы уже записанных гаданий (например, при переигрывании файла) не ошибка
+            write_errors = e.details.get("writeErrors", [])
+            skipped = {error["index"] for error in write_errors}
+            failed_indices = {error["index"] for error in write_errors if error.get("code") != DUPLICATE_KEY}
+            failed = [document for index, document in enumerate(documents) if index in failed_indices]
+            # Записанные документы пачки учитываются сразу; повторы второй раз в счётчики не попадают
+            inserted = [document for index, document in enumerate(documents) if index not in skipped]
+        if inserted:
+            await self._account(inserted)
+        return failed
+
+    async def _account(self, inserted: List[Dict]) -> None:
+        try:
+            # Гадания уже в базе - истории их сессий должны перечитаться
+            await history_cache.bump_many(Counter(document["session_id"] for document in inserted))
+        except Exception as e:
+            print(f"Ошибка обновления версий истории: {e}")
+        try:
+            await record_readings(self._db, inserted)
+        except Exception as e:
+            print(f"Ошибка обновления статистики: {e}")
+
+    async def flush(self) -> int:
+        """Записывает одну пачку из буфера"""
+        documents = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        if not documents:
+            return 0
+        try:
+            failed = await self._insert(documents)
+        except Exception as e:
+            print(f"Ошибка пакетной записи гаданий, сохраняем в {self.spill_path}: {e}")
+            await asyncio.to_thread(self._spill, documents)
+            return 0
+        if failed:
+            # В файл сброса уходят только незаписанные документы пачки
+            print(f"Не удалось записать {len(failed)} гаданий из пачки, сохраняем в {self.spill_path}")
+            await asyncio.to_thread(self._spill, failed)
+        written = len(documents) - len(failed)
+        self.written += written
+        self.batches += 1
+        return written
+
+    def _spill(self, documents: List[Dict]) -> None:
+        lines = []
+        for document in documents:
+            document.pop("_id", None)
+            lines.append(json_util.dumps(document, ensure_ascii=False) + "\n")
+        while True:
+            with self.spill_path.open("a", encoding="utf-8") as spill:
+                fcntl.flock(spill, fcntl.LOCK_EX)
+                # Файл могли забрать на переигрывание между open и flock - тогда пишем в новый
+                try:
+                    current = os.stat(self.spill_path).st_ino == os.fstat(spill.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if not current:
+                    continue
+                spill.writelines(lines)
+                spill.flush()
+                os.fsync(spill.fileno())
+            break
+        self.spilled += len(documents)
+
+    def _replay_name(self) -> Path:
+        return self.spill_path.with_name(f"{self.spill_path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.replay")
+
+    def _abandoned(self, path: Path) -> bool:
+        """Файл переигрывания брошен: воркер, забравший его, уже не работает"""
+        try:
+            pid = int(path.name[len(self.spill_path.name) + 1:].split(".")[0])
+        except ValueError:
+            return True
+        if pid == os.getpid():
+            # Тот же pid после перезапуска контейнера: файл остался от прошлого процесса
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def _claim_spill(self) -> List[Path]:
+        """Забирает файл сброса и файлы, не доигранные завершившимися воркерами.
+
+        Каждый файл забирается атомарным os.replace в уникальное имя, поэтому
+        один и тот же файл не достанется двум воркерам, стартующим вместе.
+        """
+        leftovers = sorted(self.spill_path.parent.glob(f"{self.spill_path.name}.*.replay"))
+        claimed = []
+        for path in [self.spill_path] + [path for path in leftovers if self._abandoned(path)]:
+            target = self._replay_name()
+            try:
+                os.replace(path, target)
+            except FileNotFoundError:
+                # Файл уже забрал другой воркер
+                continue
+            claimed.append(target)
+        return claimed
+
+    @staticmethod
+    def _read_spill(path: Path) -> List[Dict]:
+        with path.open(encoding="utf-8") as spill:
+            # Дожидаемся записи, начатой до переименования
+            fcntl.flock(spill, fcntl.LOCK_SH)
+            return [json_util.loads(line) for line in spill if line.strip()]
+
+    async def replay_spill(self) -> int:
+        """Дописывает в MongoDB гадания из файлов сброса"""
+        replayed = 0
+        for path in await asyncio.to_thread(self._claim_spill):
+            try:
+                documents = await asyncio.to_thread(self._read_spill, path)
+                failed = []
+                for start in range(0, len(documents), self.batch_size):
+                    failed.extend(await self._insert(documents[start:start + self.batch_size]))
+            except Exception as e:
+                print(f"Не удалось переиграть {path}, повторим при следующем старте: {e}")
+                continue
+            if failed:
+                print(f"Не удалось записать {len(failed)} гаданий из {path}, возвращаем в {self.spill_path}")
+                await asyncio.to_thread(self._spill, failed)
+            path.unlink(missing_ok=True)
+            replayed += len(documents) - len(failed)
+        self.written += replayed
+        return replayed
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+        }
+
+
+reading_writer = ReadingWriteBuffer(
+    enabled=os.environ.get("READINGS_WRITE_MODE", "direct") == "behind",
+    max_size=int(os.environ.get("READINGS_BUFFER_MAX_SIZE", "10000")),
+    batch_size=int(os.environ.get("READINGS_BUFFER_BATCH_SIZE", "500")),
+    flush_interval=float(os.environ.get("READINGS_BUFFER_FLUSH_SECONDS", "0.5")),
+    spill_path=os.environ.get("READINGS_SPILL_PATH", "readings_spill.ndjson"),
+)